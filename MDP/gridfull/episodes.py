@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class Episode:
+    """
+    The states, actions, available and allowed actions of a single simulated episode, and its accumulated rewards.
+    """
+    def __init__(self, index=0):
+        self.index = index
+        self.states = []
+        self.actions = []
+        self.available_actions = []
+        # Filled if a shield restricted the actions; otherwise all available actions are allowed.
+        self.allowed_actions = []
+        self.finished = False
+        self.returns = []
+
+    def __len__(self):
+        return len(self.actions)
+
+    def summary(self, keep_trajectory=False):
+        return EpisodeSummary(self.index, len(self), self.finished, self.returns, self if keep_trajectory else None)
+
+    def replay(self, recorder):
+        """
+        Records the episode, in the same way as SimulationExecutor.simulate records it while simulating.
+        """
+        allowed_actions = self.allowed_actions if self.allowed_actions else self.available_actions
+        recorder.start_path()
+        recorder.record_state(self.states[0])
+        for action, actions, allowed, state in zip(self.actions, self.available_actions, allowed_actions, self.states[1:]):
+            recorder.record_available_actions(actions)
+            recorder.record_allowed_actions(allowed)
+            recorder.record_selected_action(action)
+            recorder.record_state(state)
+        recorder.record_available_actions(self.available_actions[-1])
+        recorder.record_allowed_actions(allowed_actions[-1])
+        recorder.end_path(self.finished)
+
+
+class EpisodeSummary:
+    """
+    The outcome of a simulated episode: its length, whether it finished, the accumulated rewards
+    (one entry per reward model) and, if requested, the trajectory (an Episode).
+    """
+    def __init__(self, index, length, finished, returns=(), trajectory=None):
+        self.index = index
+        self.length = length
+        self.finished = finished
+        self.returns = list(returns)
+        self.trajectory = trajectory
+
+    def as_dict(self):
+        record = {"index": self.index, "length": self.length, "finished": self.finished, "returns": self.returns}
+        if self.trajectory is not None:
+            record["states"] = [int(s) for s in self.trajectory.states]
+            record["actions"] = [int(a) for a in self.trajectory.actions]
+        return record
+
+
+class EpisodeStatistics:
+    """
+    Aggregates episode summaries in constant memory.
+    """
+    def __init__(self):
+        self.nr_episodes = 0
+        self.nr_finished = 0
+        self.total_length = 0
+        self.total_returns = []
+
+    def add(self, summary):
+        self.nr_episodes += 1
+        self.nr_finished += summary.finished
+        self.total_length += summary.length
+        if len(self.total_returns) < len(summary.returns):
+            self.total_returns.extend([0.0] * (len(summary.returns) - len(self.total_returns)))
+        for i, value in enumerate(summary.returns):
+            self.total_returns[i] += value
+        return summary
+
+    @property
+    def success_rate(self):
+        return self.nr_finished / self.nr_episodes if self.nr_episodes > 0 else 0.0
+
+    @property
+    def mean_length(self):
+        return self.total_length / self.nr_episodes if self.nr_episodes > 0 else 0.0
+
+    @property
+    def mean_returns(self):
+        return [value / self.nr_episodes for value in self.total_returns] if self.nr_episodes > 0 else []
+
+    def __str__(self):
+        return f"{self.nr_episodes} episodes, {self.nr_finished} finished ({self.success_rate:.3f}), mean length {self.mean_length:.1f}, mean returns {self.mean_returns}"
+
+
+def aggregate(episodes, statistics=None):
+    """
+    Consumes a stream of episode summaries and returns their EpisodeStatistics.
+    """
+    statistics = statistics if statistics is not None else EpisodeStatistics()
+    for summary in episodes:
+        statistics.add(summary)
+    return statistics
+
+
+def write_episodes(episodes, path):
+    """
+    Appends a stream of episode summaries to a JSON lines file, one line per episode, as they arrive.
+
+    :return: The number of episodes written.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    count = 0
+    with open(path, "a") as f:
+        for summary in episodes:
+            f.write(json.dumps(summary.as_dict()) + "\n")
+            count += 1
+    return count
@@ -1,5 +1,5 @@
 import os
-from gridstorm.annotations import ProgramAnnotation, Direction
+from gridfull.annotations import ProgramAnnotation, Direction
 
 class Model:
     def __init__(self, path, annotations, properties, constants="", ego_icon=None):
@@ -161,4 +161,14 @@ def rocks(N, K=2):
     if K == 2:
         return Model(_example_path("rocks2.nm"), ProgramAnnotation(_grid_rocks), ["Pmax=? [\"notbad\" U \"goal\"]"], constants=f"N={N}")
     else:
-        raise RuntimeError("Rocks is only available with 2 or 3 rocks")
\ No newline at end of file
+        raise RuntimeError("Rocks is only available with 2 or 3 rocks")
+
+
+experiment_to_grid_model_names = {
+    "avoid": surveillance,
+    "refuel": refuel,
+    'obstacle': obstacle,
+    "intercept": intercept,
+    'evade': evade,
+    'rocks': rocks
+}
@@ -0,0 +1,149 @@
+from array import array
+import logging
+
+import stormpy as sp
+import stormpy.pomdp
+
+logger = logging.getLogger(__name__)
+
+
+def program_variables(program):
+    """
+    All boolean and integer variables of the program, in a fixed order.
+    """
+    boolean_variables = list(program.global_boolean_variables)
+    integer_variables = list(program.global_integer_variables)
+    for module in program.modules:
+        boolean_variables += list(module.boolean_variables)
+        integer_variables += list(module.integer_variables)
+    return boolean_variables, integer_variables
+
+
+def matrix_arrays(matrix):
+    """
+    The row grouping, row starts, columns and values of a sparse matrix (in CSR layout).
+    """
+    row_groups = array('q', matrix._row_group_indices)
+    row_starts = array('q', [0])
+    columns = array('q')
+    values = array('d')
+    for row in range(matrix.nr_rows):
+        for entry in matrix.get_row(row):
+            columns.append(entry.column)
+            values.append(entry.value())
+        row_starts.append(len(columns))
+    return row_groups, row_starts, columns, values
+
+
+def extract_components(model, program):
+    """
+    Flattens a (canonic) sparse model into plain arrays that can be pickled.
+
+    :param model: The sparse model as built by build_pomdp.
+    :param program: The (preprocessed) prism program the model was built from.
+    :return: A dictionary with the transition matrix, labelings, observations, rewards and state valuations.
+    """
+    row_groups, row_starts, columns, values = matrix_arrays(model.transition_matrix)
+
+    labels = {label: array('q', model.labeling.get_states(label)) for label in model.labeling.get_labels()}
+    choice_labels = None
+    if model.has_choice_labeling():
+        choice_labels = {label: array('q', model.choice_labeling.get_choices(label))
+                         for label in model.choice_labeling.get_labels()}
+
+    reward_models = {}
+    for name, reward_model in model.reward_models.items():
+        reward_models[name] = {
+            "state": array('d', reward_model.state_rewards) if reward_model.has_state_rewards else None,
+            "state_action": array('d', reward_model.state_action_rewards) if reward_model.has_state_action_rewards else None
+        }
+
+    valuations = None
+    if model.has_state_valuations():
+        boolean_variables, integer_variables = program_variables(program)
+        valuations = {
+            "boolean_names": [v.name for v in boolean_variables],
+            "integer_names": [v.name for v in integer_variables],
+            "boolean": [array('b', [model.state_valuations.get_boolean_value(s, v.expression_variable) for v in boolean_variables])
+                        for s in range(model.nr_states)],
+            "integer": [array('q', [model.state_valuations.get_integer_value(s, v.expression_variable) for v in integer_variables])
+                        for s in range(model.nr_states)]
+        }
+
+    return {
+        "nr_states": model.nr_states,
+        "nr_choices": model.nr_choices,
+        "row_groups": row_groups,
+        "row_starts": row_starts,
+        "columns": columns,
+        "values": values,
+        "labels": labels,
+        "choice_labels": choice_labels,
+        "observations": array('q', model.observations),
+        "reward_models": reward_models,
+        "valuations": valuations
+    }
+
+
+def _build_matrix(components):
+    builder = sp.SparseMatrixBuilder(rows=0, columns=0, entries=0, force_dimensions=False,
+                                     has_custom_row_grouping=True, row_groups=0)
+    row_groups = components["row_groups"]
+    row_starts = components["row_starts"]
+    columns = components["columns"]
+    values = components["values"]
+    for state in range(components["nr_states"]):
+        builder.new_row_group(row_groups[state])
+        for row in range(row_groups[state], row_groups[state + 1]):
+            for k in range(row_starts[row], row_starts[row + 1]):
+                builder.add_next_value(row, columns[k], values[k])
+    return builder.build()
+
+
+def _build_valuations(components, program):
+    data = components["valuations"]
+    boolean_variables, integer_variables = program_variables(program)
+    if [v.name for v in boolean_variables] != data["boolean_names"] or [v.name for v in integer_variables] != data["integer_names"]:
+        raise RuntimeError("Stored state valuations do not match the variables of the program")
+    builder = sp.StateValuationsBuilder()
+    for v in boolean_variables + integer_variables:
+        builder.add_variable(v.expression_variable)
+    for s in range(components["nr_states"]):
+        builder.add_state(s, boolean_values=[bool(b) for b in data["boolean"][s]], integer_values=list(data["integer"][s]), rational_values=[])
+    return builder.build(components["nr_states"])
+
+
+def restore_model(components, program):
+    """
+    Inverse of extract_components: reassembles a sparse POMDP.
+
+    :param components: The dictionary created by extract_components.
+    :param program: The (preprocessed) prism program, used to recover the variables of the state valuations.
+    :return: A sparse POMDP.
+    """
+    nr_states = components["nr_states"]
+    nr_choices = components["nr_choices"]
+    labeling = sp.storage.StateLabeling(nr_states)
+    for label, states in components["labels"].items():
+        labeling.add_label(label)
+        labeling.set_states(label, sp.BitVector(nr_states, list(states)))
+
+    reward_models = {}
+    for name, rewards in components["reward_models"].items():
+        state_rewards = list(rewards["state"]) if rewards["state"] is not None else None
+        state_action_rewards = list(rewards["state_action"]) if rewards["state_action"] is not None else None
+        reward_models[name] = sp.SparseRewardModel(optional_state_reward_vector=state_rewards,
+                                                   optional_state_action_reward_vector=state_action_rewards)
+
+    model_components = sp.SparseModelComponents(transition_matrix=_build_matrix(components),
+                                                state_labeling=labeling, reward_models=reward_models)
+    if components["choice_labels"] is not None:
+        choice_labeling = sp.storage.ChoiceLabeling(nr_choices)
+        for label, choices in components["choice_labels"].items():
+            choice_labeling.add_label(label)
+            choice_labeling.set_choices(label, sp.BitVector(nr_choices, list(choices)))
+        model_components.choice_labeling = choice_labeling
+    if components["valuations"] is not None:
+        model_components.state_valuations = _build_valuations(components, program)
+    model_components.observability_classes = list(components["observations"])
+    return sp.storage.SparsePomdp(model_components)
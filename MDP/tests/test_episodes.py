@@ -0,0 +1,59 @@
+import itertools
+import json
+
+import numpy as np
+
+from gridfull.episodes import EpisodeStatistics, aggregate, write_episodes
+from gridfull.simulator import SimulationExecutor
+from gridfull.vectorized import ArraySimulator, BatchedSimulator
+
+from synthetic import grid_arrays
+
+
+def _check_summary(summary):
+    trajectory = summary.trajectory
+    assert summary.length == len(trajectory.actions) == len(trajectory.states) - 1
+    final = trajectory.states[-1]
+    assert summary.finished == (final in (3, 4))
+    # Every step costs 1, and the goal gains 1.
+    costs, gains = summary.returns
+    assert costs == summary.length and gains == (final == 3)
+    assert all(0 <= action < len(actions) for action, actions in zip(trajectory.actions, trajectory.available_actions))
+
+
+def test_batched_episodes_are_streamed():
+    arrays = grid_arrays()
+    simulator = BatchedSimulator(arrays, 8, seed=0, maxsteps=20)
+    summaries = list(itertools.islice(simulator.episodes(keep_trajectories=True), 5))
+    # Only the episodes that had to finish for the first five summaries have been simulated.
+    assert simulator.nr_finished < 5 + 8
+    assert [summary.index for summary in summaries] == list(range(5))
+    for summary in summaries + list(simulator.episodes(200, keep_trajectories=True)):
+        _check_summary(summary)
+
+
+def test_executor_episodes_are_streamed():
+    arrays = grid_arrays()
+    executor = SimulationExecutor(arrays, 0, simulator=ArraySimulator(arrays, seed=0))
+    summaries = list(itertools.islice(executor.episodes(keep_trajectories=True), 50))
+    assert [summary.index for summary in summaries] == list(range(50))
+    for summary in summaries:
+        _check_summary(summary)
+    assert all(summary.trajectory is None for summary in executor.episodes(3))
+
+
+def test_streams_are_aggregated_and_written(tmp_path):
+    arrays = grid_arrays()
+    statistics = aggregate(BatchedSimulator(arrays, 8, seed=0, maxsteps=20).episodes(100))
+    assert statistics.nr_episodes == 100
+    assert 0 < statistics.nr_finished <= 100
+    assert statistics.mean_returns[0] == statistics.mean_length
+    assert EpisodeStatistics().mean_returns == []
+
+    path = str(tmp_path / "out" / "episodes.jsonl")
+    assert write_episodes(BatchedSimulator(arrays, 8, seed=0, maxsteps=20).episodes(30, keep_trajectories=True), path) == 30
+    with open(path) as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 30
+    assert all(len(record["states"]) == record["length"] + 1 for record in records)
+    assert np.isclose(sum(record["length"] for record in records), sum(record["returns"][0] for record in records))
@@ -0,0 +1,70 @@
+import math
+
+import numpy as np
+import pytest
+
+from gridfull.policy import TabularPolicy
+from gridfull.smc import SPRT, ChernoffHoeffding, Wilson, estimate
+
+from synthetic import grid_arrays, model_arrays
+
+
+def coin_arrays(p):
+    """
+    Reaches the goal 1 with probability p and the trap 2 otherwise, in one step.
+    """
+    return model_arrays([[([1, 2], [p, 1 - p])], [([1], [1.0])], [([2], [1.0])]], labels={"goal": [1], "notbad": [0, 1]})
+
+
+def test_chernoff_hoeffding_bound():
+    rule = ChernoffHoeffding(epsilon=0.05, delta=0.05)
+    assert rule.required == math.ceil(math.log(40) / 0.005) == 738
+    assert not rule.done(0, 737) and rule.done(0, 738)
+    assert rule.interval(1, 100) == (0.0, pytest.approx(0.06))
+
+
+def test_wilson_interval():
+    rule = Wilson(epsilon=0.05, delta=0.05)
+    lower, upper = rule.interval(0, 100)
+    assert lower == 0.0 and upper == pytest.approx(0.0370, abs=1e-4)
+    lower, upper = rule.interval(50, 100)
+    assert lower == pytest.approx(0.4038, abs=1e-4) and upper == pytest.approx(0.5962, abs=1e-4)
+    assert not rule.done(0, 29)
+
+
+@pytest.mark.parametrize("rule, p, min_coverage", [(ChernoffHoeffding(0.05, 0.05), 0.3, 0.95), (Wilson(0.05, 0.05), 0.3, 0.9),
+                                                   (Wilson(0.02, 0.05), 0.97, 0.9)])
+def test_intervals_cover_the_probability(rule, p, min_coverage):
+    arrays = coin_arrays(p)
+    covered = 0
+    for seed in range(100):
+        result = estimate(arrays, rule, batch_size=64, seed=seed)
+        assert result.converged and result.nr_truncated == 0
+        lower, upper = result.interval
+        assert upper - lower <= 2 * rule.epsilon + 1e-12
+        covered += lower <= p <= upper
+    assert covered >= min_coverage * 100
+
+
+@pytest.mark.parametrize("p, expected", [(0.6, True), (0.4, False)])
+def test_sprt_decisions(p, expected):
+    arrays = coin_arrays(p)
+    rule = SPRT(0.5, epsilon=0.05, alpha=0.05, beta=0.05)
+    assert rule.decision(0, 0) is None
+    decisions = [estimate(arrays, rule, batch_size=16, seed=seed).decision for seed in range(100)]
+    assert None not in decisions
+    # The error probabilities are at most 0.05 outside of the indifference region.
+    assert decisions.count(expected) >= 90
+
+
+def test_estimate_under_a_policy():
+    arrays = grid_arrays()
+    # Always going east reaches the goal with probability 0.9.
+    east = TabularPolicy(np.zeros(arrays.nr_states, dtype=np.int64))
+    result = estimate(arrays, Wilson(0.01, 0.05), policy=east, seed=0)
+    lower, upper = result.interval
+    assert lower <= 0.9 <= upper
+    # Always going west never reaches the goal, and the episodes are truncated.
+    west = TabularPolicy(np.ones(arrays.nr_states, dtype=np.int64))
+    result = estimate(arrays, ChernoffHoeffding(0.1, 0.1), policy=west, maxsteps=5, seed=0, batch_size=100)
+    assert result.nr_successes == 0 and result.nr_truncated == result.nr_episodes
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from gridfull.shield import BeliefSupportShield, successor_support
+from gridfull.simulator import run_episode
+from gridfull.vectorized import ArraySimulator
+
+from synthetic import guess_arrays, model_arrays
+
+
+def random_arrays(rng, nr_states=8, nr_observations=4, nr_actions=2):
+    """
+    A random model with two initial states, an absorbing goal and an absorbing trap.
+    """
+    goal, trap = nr_states, nr_states + 1
+    rows = []
+    for _ in range(nr_states):
+        choices = []
+        for _ in range(nr_actions):
+            targets = rng.choice(nr_states + 2, size=rng.integers(1, 3), replace=False)
+            choices.append((targets.tolist(), rng.dirichlet(5 * np.ones(len(targets))).tolist()))
+        rows.append(choices)
+    rows += [[([goal], [1.0])], [([trap], [1.0])]]
+    observations = rng.integers(0, nr_observations, size=nr_states).tolist() + [nr_observations, nr_observations + 1]
+    return model_arrays(rows, initial_states=(0, 1), observations=observations,
+                        labels={"goal": [goal], "notbad": list(range(nr_states + 1))})
+
+
+def test_supports_that_are_winning_state_by_state_can_be_losing():
+    shield = BeliefSupportShield(guess_arrays())
+    # Each of 1 and 2 is winning on its own, but with the support {1, 2} the agent does not know which action wins.
+    assert shield.is_winning([1]) and shield.is_winning([2])
+    assert not shield.is_winning([1, 2])
+    assert shield.allowed_actions([1, 2]) == []
+    # So from 0 only the action that avoids the support {1, 2} is allowed.
+    assert shield.allowed_actions([0]) == [1]
+    assert shield.allowed_actions([1]) == [0] and shield.allowed_actions([2]) == [1]
+
+
+def test_positive_mode_allows_actions_that_may_reach_the_goal():
+    shield = BeliefSupportShield(guess_arrays(), mode="positive")
+    assert shield.is_winning([1, 2])
+    assert shield.allowed_actions([1, 2]) == [0, 1]
+    assert shield.allowed_actions([0]) == [0, 1]
+    assert not shield.is_winning([4])
+    with pytest.raises(RuntimeError, match="almost-sure or positive"):
+        BeliefSupportShield(guess_arrays(), mode="sure")
+
+
+def test_batch_masks_match_masks():
+    shield = BeliefSupportShield(guess_arrays())
+    supports = [[0], [1, 2], [1], [3], [2]]
+    masks = shield.batch_masks(np.concatenate(supports), [len(support) for support in supports])
+    assert np.array_equal(masks, [shield.masks(support) for support in supports])
+    with pytest.raises(ValueError, match="add up"):
+        shield.batch_masks([0, 1], [1])
+    with pytest.raises(ValueError, match="not in the model"):
+        shield.masks([7])
+
+
+def test_almost_sure_shield_is_sound_on_random_models():
+    rng = np.random.default_rng(0)
+    nr_winning = 0
+    for index in range(60):
+        arrays = random_arrays(rng)
+        shield = BeliefSupportShield(arrays)
+        if not shield.is_winning(shield.initial_support()):
+            continue
+        nr_winning += 1
+        simulator = ArraySimulator(arrays, seed=index)
+        for episode_index in range(20):
+            # run_episode raises if the shield allows no action.
+            episode = run_episode(simulator, rng, 2000, episode_index, shield=shield.monitor())
+            assert episode.finished and episode.states[-1] == arrays.nr_states - 2
+    assert nr_winning > 10
+
+
+def test_positive_shield_keeps_a_winning_successor_on_random_models():
+    rng = np.random.default_rng(1)
+    nr_checked = 0
+    for _ in range(60):
+        arrays = random_arrays(rng)
+        shield = BeliefSupportShield(arrays, mode="positive")
+        support = shield.initial_support()
+        simulator = ArraySimulator(arrays, seed=2)
+        state, _ = simulator.restart()
+        # The goal is only reached with positive probability, so episodes may leave the winning supports.
+        while shield.is_winning(support) and not simulator.is_done():
+            allowed = shield.allowed_actions(support)
+            for action in allowed:
+                successors = [successor_support(arrays, support, action, observation)
+                              for observation in range(arrays.nr_observations)]
+                assert any(shield.is_winning(successor) for successor in successors if len(successor) > 0)
+            nr_checked += 1
+            action = int(rng.choice(allowed))
+            state, _ = simulator.step(action)
+            support = successor_support(arrays, support, action, arrays.observations[state])
+    assert nr_checked > 10
@@ -1,98 +1,59 @@
 import logging
-import random
-
-import stormpy as sp
-import stormpy.pomdp
-import stormpy.simulator
 
+from gridstorm.builder import build_model, prepare_program, render_profile
+from gridstorm.cache import ModelCache
+from gridstorm.instrumentation import BuildInstrumentation
+from gridstorm.minimize import minimize
 import gridstorm.models as models
 import gridstorm.plotter as plotter
 import gridstorm.recorder
+from gridstorm.lazy import LazyStateSpace
+from gridstorm.shield import Shield
+from gridstorm.simulator import SimulationExecutor
 
 logger = logging.getLogger(__name__)
 
 
-class SimulationExecutor:
-    """
-    Base class that wraps the stormpy simulator
-    """
-    def __init__(self, model, seed):
-        self._model = model
-        self._simulator = sp.simulator.create_simulator(model, seed=seed)
-        self._simulator.set_full_observability(True) # We want to access the full state space for visualisations.
-
-    def simulate(self, recorder, nr_good_runs = 1, total_nr_runs = 5, maxsteps=200):
-        result = []
-        good_runs = 0
-        for m in range(total_nr_runs):
-            finished = False
-            state, _ = self._simulator.restart()
-            logger.info("Start new episode.")
-            recorder.start_path()
-            recorder.record_state(state)
-            for n in range(maxsteps):
-                actions = self._simulator.available_actions()
-                action = random.randint(0, len(actions) - 1)
-                logger.debug(f"Select action: {action}")
-                state, _ = self._simulator.step(action)
-                recorder.record_available_actions(actions)
-                recorder.record_allowed_actions(actions)
-                recorder.record_selected_action(action)
-                recorder.record_state(state)
-
-                if self._simulator.is_done():
-                    logger.info(f"Done after {n} steps!")
-                    finished = True
-                    good_runs += 1
-                    break
-            actions = self._simulator.available_actions()
-            recorder.record_available_actions(actions)
-            recorder.record_allowed_actions(actions)
-            recorder.end_path(finished)
-            result.append(self._simulator.is_done())
-            if good_runs == nr_good_runs:
-                break
-        return result
-
-def build_pomdp(program, formula):
-    options = sp.BuilderOptions([formula])
-    options.set_build_state_valuations()
-    options.set_build_choice_labels()
-    options.set_build_all_labels()
-    logger.debug("Start building the POMDP")
-    return sp.build_sparse_model_with_options(program, options)
+experiment_to_grid_model_names = models.experiment_to_grid_model_names
 
-
-experiment_to_grid_model_names = {
-    "avoid": models.surveillance,
-    "refuel": models.refuel,
-    'obstacle': models.obstacle,
-    "intercept": models.intercept,
-    'evade': models.evade,
-    'rocks': models.rocks
-}
-
-def demo(model_name, constants):
+def demo(model_name, constants, use_cache=True, build_log=None, minimize_model=False, lazy=False, shield_factor=None):
     logging.basicConfig(filename='demo.log', level=logging.DEBUG)
     model = experiment_to_grid_model_names[model_name]
     constants = dict(item.split('=') for item in constants.split(","))
     input = model(**constants)
-    prism_program = sp.parse_prism_program(input.path)
-    prop = sp.parse_properties_for_prism_program(input.properties[0], prism_program)[0]
-    prism_program, props = sp.preprocess_symbolic_input(prism_program, [prop], input.constants)
-    prop = props[0]
-    prism_program = prism_program.as_prism_program()
-    raw_formula = prop.raw_formula
-
-    logger.info("Construct POMDP representation...")
-    model = build_pomdp(prism_program, raw_formula)
-    model = sp.pomdp.make_canonic(model)
+    if lazy:
+        # Explore the state space on the fly, for grids that are too large to build.
+        prism_program, _ = prepare_program(input)
+        state_space = LazyStateSpace(prism_program)
+        model = state_space.model
+    else:
+        instrumentation = BuildInstrumentation(model_name, constants)
+        prism_program, model = build_model(input, cache=ModelCache() if use_cache else None, profile=render_profile(input),
+                                           instrumentation=instrumentation)
+        if build_log is not None:
+            instrumentation.write(build_log)
 
     renderer = plotter.Plotter(prism_program, input.annotations, model)
     renderer.set_title("Demo")
-    recorder = gridstorm.recorder.VideoRecorder(renderer, False)
-    executor = SimulationExecutor(model, seed=42)
+    if lazy:
+        recorder = gridstorm.recorder.VideoRecorder(renderer, False)
+        executor = SimulationExecutor(model, seed=42, simulator=state_space.simulator(seed=42))
+    elif minimize_model:
+        # Simulate on the quotient, but render the concrete representatives.
+        quotient = minimize(model, prism_program)
+        recorder = gridstorm.recorder.VideoRecorder(renderer, False, state_map=quotient.lift_state)
+        executor = SimulationExecutor(quotient.model, seed=42)
+    else:
+        shield = None
+        if shield_factor is not None:
+            # Restrict the actions to those that keep the maximal probability within the factor.
+            _, prop = prepare_program(input)
+            shield = Shield.from_model(model, prism_program, prop, shield_factor)
+        recorder = gridstorm.recorder.VideoRecorder(renderer, False)
+        executor = SimulationExecutor(model, seed=42, shield=shield)
     executor.simulate(recorder)
+    if lazy:
+        logger.info(f"Explored states: {state_space.statistics}")
     recorder.save(".", "demo")
     
 if __name__ == "__main__":
@@ -0,0 +1,129 @@
+from concurrent.futures import ProcessPoolExecutor
+import inspect
+import itertools
+import logging
+import time
+
+from gridfullsparse.builder import FULL_PROFILE, build_from_program, cache_key, estimated_memory, estimated_memory_saved, prepare_program
+from gridfullsparse.cache import ModelCache
+from gridfullsparse.instrumentation import BuildInstrumentation
+
+logger = logging.getLogger(__name__)
+
+
+class BuildSummary:
+    """
+    Outcome of a single job of a batch build.
+    """
+    def __init__(self, model_name, constants, cache_path=None, cached=False, build_time=0.0,
+                 nr_states=None, nr_choices=None, nr_transitions=None, nr_observations=None,
+                 profile=None, memory=None, memory_saved=None, stages=None, error=None):
+        self.model_name = model_name
+        self.constants = constants
+        self.cache_path = cache_path
+        self.cached = cached
+        self.build_time = build_time
+        self.nr_states = nr_states
+        self.nr_choices = nr_choices
+        self.nr_transitions = nr_transitions
+        self.nr_observations = nr_observations
+        self.profile = profile
+        self.memory = memory
+        self.memory_saved = memory_saved
+        self.stages = stages if stages is not None else []
+        self.error = error
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        constants = ",".join(f"{k}={v}" for k, v in self.constants.items())
+        if not self.ok:
+            return f"{self.model_name}({constants}): FAILED ({self.error})"
+        origin = "cached" if self.cached else f"{self.build_time:.2f}s"
+        memory = f"~{self.memory / 1024 ** 2:.1f}MB, ~{self.memory_saved / 1024 ** 2:.1f}MB saved by profile {self.profile}"
+        return f"{self.model_name}({constants}): {self.nr_states} states, {self.nr_choices} choices, {self.nr_transitions} transitions, {self.nr_observations} observations, {memory} [{origin}]"
+
+
+def constant_grid(**ranges):
+    """
+    Cartesian product of the given constant ranges, e.g. constant_grid(N=[6,8], RADIUS=[2,3]).
+    """
+    names = list(ranges.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*(ranges[n] for n in names))]
+
+
+def _jobs(registry, grid):
+    # Every model only receives the constants its factory accepts, so a single grid can be shared across models.
+    jobs = []
+    for name, factory in registry.items():
+        parameters = inspect.signature(factory).parameters
+        seen = set()
+        for constants in grid:
+            selected = {k: v for k, v in constants.items() if k in parameters}
+            identifier = tuple(sorted(selected.items()))
+            if identifier in seen:
+                continue
+            seen.add(identifier)
+            jobs.append((name, factory, selected))
+    return jobs
+
+
+def _build_job(name, factory, constants, cache_directory, cache_size, profile):
+    cache = ModelCache(cache_directory, cache_size)
+    instrumentation = BuildInstrumentation(name, constants)
+    try:
+        start = time.perf_counter()
+        input = factory(**constants)
+        if callable(profile):
+            profile = profile(input)
+        instrumentation.set("profile", profile.name)
+        prism_program, prop = prepare_program(input, instrumentation)
+        key = cache_key(cache, input, prop, profile)
+        # A corrupt or concurrently evicted entry is a cache miss there, so the model is rebuilt.
+        model = build_from_program(input, prism_program, prop, cache, profile, instrumentation)
+        cached = not any(entry["stage"] == "build" for entry in instrumentation.stages)
+        summary = BuildSummary(name, constants, cache.path(key), cached, time.perf_counter() - start,
+                               model.nr_states, model.nr_choices, model.nr_transitions, model.nr_observations,
+                               profile.name, estimated_memory(model, prism_program),
+                               estimated_memory_saved(model, prism_program, profile), instrumentation.stages)
+    except Exception as e:
+        logger.exception(f"Building {name} with {constants} failed")
+        instrumentation.set("error", repr(e))
+        summary = BuildSummary(name, constants, stages=instrumentation.stages, error=repr(e))
+    return summary, instrumentation
+
+
+def build_family(registry, grid, cache_directory=None, cache_size=64 * 1024 ** 3, processes=None, profile=FULL_PROFILE,
+                 records_path=None):
+    """
+    Builds every model of the registry for every combination of constants in the grid, using a process pool.
+
+    Models are written to the model cache; the results are handles into this cache,
+    so that the models can later be loaded with gridfullsparse.builder.build_model.
+
+    :param registry: Maps model names to model factories, e.g. gridfullsparse.models.experiment_to_grid_model_names
+    :param grid: A list of dictionaries of constants, see constant_grid.
+    :param cache_directory: The cache directory, the default cache if None.
+    :param cache_size: Size bound of the cache, should be large enough to hold the whole family.
+    :param processes: Number of worker processes, the number of cores if None.
+    :param profile: A BuildProfile, or a function that derives a profile from a model (e.g. minimal_profile).
+    :param records_path: If given, a JSON lines file to which the per-stage build records are appended.
+    :return: A list of BuildSummary objects, in the order of the jobs.
+    """
+    if cache_directory is None:
+        cache_directory = ModelCache(max_size=cache_size).directory
+    jobs = _jobs(registry, grid)
+    logger.info(f"Building {len(jobs)} models")
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_build_job, name, factory, constants, cache_directory, cache_size, profile)
+                   for name, factory, constants in jobs]
+        summaries = []
+        for future in futures:
+            summary, instrumentation = future.result()
+            logger.info(str(summary))
+            if records_path is not None:
+                instrumentation.write(records_path)
+            summaries.append(summary)
+    return summaries
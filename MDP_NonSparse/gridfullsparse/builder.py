@@ -0,0 +1,311 @@
+from contextlib import nullcontext
+import logging
+import os
+import re
+import tempfile
+
+import stormpy as sp
+import stormpy.pomdp
+
+from gridfullsparse.storage import program_variables
+
+logger = logging.getLogger(__name__)
+
+
+class BuildProfile:
+    """
+    Describes which optional parts of a model the builder constructs.
+
+    Labels that are referenced by the formula are always built.
+    """
+    def __init__(self, name, state_valuations=True, choice_labels=True, all_labels=True, labels=(), reward_models=False):
+        self.name = name
+        self.state_valuations = state_valuations
+        self.choice_labels = choice_labels
+        self.all_labels = all_labels
+        self.labels = sorted(set(labels))
+        self.reward_models = reward_models
+
+    @property
+    def flags(self):
+        flags = []
+        if self.state_valuations:
+            flags.append("state_valuations")
+        if self.choice_labels:
+            flags.append("choice_labels")
+        if self.all_labels:
+            flags.append("all_labels")
+        if self.reward_models:
+            flags.append("reward_models")
+        flags += [f"label:{label}" for label in self.labels]
+        return tuple(flags)
+
+    def options(self, program, formula):
+        # The builder constructs exactly the labels occurring in its formulas, so every extra label is requested via a dummy formula.
+        program_labels = set(label.name for label in program.labels)
+        formulas = [formula]
+        for label in self.labels:
+            if label not in program_labels:
+                logger.warning(f"Label {label} is not defined by the program")
+                continue
+            formulas.append(sp.parse_properties_for_prism_program(f"P=? [F \"{label}\"]", program)[0].raw_formula)
+        options = sp.BuilderOptions(formulas)
+        if self.state_valuations:
+            options.set_build_state_valuations()
+        if self.choice_labels:
+            options.set_build_choice_labels()
+        if self.all_labels:
+            options.set_build_all_labels()
+        if self.reward_models:
+            options.set_build_all_reward_models()
+        return options
+
+
+FULL_PROFILE = BuildProfile("full")
+# The full profile plus all reward models, for environments and planners that collect rewards.
+REWARD_PROFILE = BuildProfile("rewards", reward_models=True)
+
+
+def required_labels(input):
+    """
+    Labels needed by the properties and the annotations of a grid model.
+    """
+    labels = set(input.annotations.labels)
+    for prop in input.properties:
+        labels.update(re.findall(r'"([^"]+)"', prop))
+    return labels
+
+
+def minimal_profile(input, reward_models=False):
+    """
+    Only the labels required by the model's properties and annotations, e.g. for headless training.
+    """
+    return BuildProfile("minimal", state_valuations=False, choice_labels=False, all_labels=False,
+                        labels=required_labels(input), reward_models=reward_models)
+
+
+def render_profile(input, reward_models=False):
+    """
+    The minimal profile plus state valuations and choice labels, as needed by the plotter.
+    """
+    return BuildProfile("render", state_valuations=True, choice_labels=True, all_labels=False,
+                        labels=required_labels(input), reward_models=reward_models)
+
+
+def _action_names(program):
+    return set(command.action_name for module in program.modules for command in module.commands if command.is_labeled)
+
+
+def _valuation_size(program):
+    boolean_variables, integer_variables = program_variables(program)
+    return len(boolean_variables) + 8 * len(integer_variables)
+
+
+def estimated_memory(model, program):
+    """
+    A rough estimate of the memory (in bytes) occupied by a sparse model.
+    """
+    size = model.nr_transitions * 16 + model.nr_choices * 8 + model.nr_states * 8
+    size += len(model.labeling.get_labels()) * model.nr_states // 8
+    if model.has_choice_labeling():
+        size += len(model.choice_labeling.get_labels()) * model.nr_choices // 8
+    if model.has_state_valuations():
+        size += model.nr_states * _valuation_size(program)
+    size += model.nr_states * 4
+    for reward_model in model.reward_models.values():
+        if reward_model.has_state_rewards:
+            size += model.nr_states * 8
+        if reward_model.has_state_action_rewards:
+            size += model.nr_choices * 8
+    return size
+
+
+def estimated_memory_saved(model, program, profile):
+    """
+    Estimate of the memory (in bytes) that the profile saved compared to the full profile.
+    """
+    saved = 0
+    if not profile.all_labels:
+        missing_labels = len(program.labels) - len(model.labeling.get_labels())
+        saved += max(0, missing_labels) * model.nr_states // 8
+    if not profile.choice_labels:
+        saved += len(_action_names(program)) * model.nr_choices // 8
+    if not profile.state_valuations:
+        saved += model.nr_states * _valuation_size(program)
+    return saved
+
+
+def _stage(instrumentation, name):
+    if instrumentation is None:
+        return nullcontext()
+    return instrumentation.stage(name)
+
+
+def build_pomdp(program, formula, profile=FULL_PROFILE):
+    options = profile.options(program, formula)
+    logger.debug(f"Start building the POMDP (profile: {profile.name})")
+    return sp.build_sparse_model_with_options(program, options)
+
+
+def prepare_program(input, instrumentation=None, path=None):
+    """
+    Parse and preprocess the prism program of a grid model.
+
+    :param input: A gridfullsparse.models.Model
+    :param instrumentation: An optional gridfullsparse.instrumentation.BuildInstrumentation
+    :param path: If given, the prism file that is parsed instead of the file of the model.
+    :return: The preprocessed prism program and the first property of the model.
+    """
+    with _stage(instrumentation, "parse"):
+        prism_program = sp.parse_prism_program(input.path if path is None else path)
+        prop = sp.parse_properties_for_prism_program(input.properties[0], prism_program)[0]
+    with _stage(instrumentation, "preprocess"):
+        prism_program, props = sp.preprocess_symbolic_input(prism_program, [prop], input.constants)
+        prism_program = prism_program.as_prism_program()
+    return prism_program, props[0]
+
+
+def cache_key(cache, input, prop, profile=FULL_PROFILE):
+    return cache.key(input.path, input.constants, prop.raw_formula, profile.flags)
+
+
+def build_model(input, cache=None, profile=FULL_PROFILE, instrumentation=None):
+    """
+    Runs the full pipeline (parse, preprocess, build, make_canonic) for a grid model.
+
+    :param input: A gridfullsparse.models.Model
+    :param cache: An optional gridfullsparse.cache.ModelCache; on a hit, building is skipped.
+    :param profile: The BuildProfile that determines which labels, valuations and reward models are built.
+    :param instrumentation: An optional gridfullsparse.instrumentation.BuildInstrumentation that records every stage.
+    :return: The preprocessed prism program and the canonic model.
+    """
+    prism_program, prop = prepare_program(input, instrumentation)
+    return prism_program, build_from_program(input, prism_program, prop, cache, profile, instrumentation)
+
+
+def build_from_program(input, prism_program, prop, cache=None, profile=FULL_PROFILE, instrumentation=None):
+    """
+    Like build_model, for a program that has already been prepared with prepare_program.
+
+    :return: The canonic model.
+    """
+    raw_formula = prop.raw_formula
+    key = None
+    if instrumentation is not None:
+        instrumentation.set("profile", profile.name)
+    if cache is not None:
+        key = cache_key(cache, input, prop, profile)
+        with _stage(instrumentation, "cache_load"):
+            model = cache.load(key, prism_program)
+        if model is not None:
+            logger.info("Loaded POMDP representation from cache.")
+            if instrumentation is not None:
+                instrumentation.record_model(model)
+            return model
+
+    logger.info("Construct POMDP representation...")
+    with _stage(instrumentation, "build"):
+        model = build_pomdp(prism_program, raw_formula, profile)
+    if instrumentation is not None:
+        instrumentation.record_model(model)
+    with _stage(instrumentation, "make_canonic"):
+        model = sp.pomdp.make_canonic(model)
+    if instrumentation is not None:
+        instrumentation.record_model(model)
+    if cache is not None:
+        with _stage(instrumentation, "cache_store"):
+            cache.store(key, model, prism_program)
+    return model
+
+
+_POMDP_KEYWORD = re.compile(r"^(\s*(?://[^\n]*\n\s*)*)pomdp\b")
+_OBSERVABLES_BLOCK = re.compile(r"\bobservables\b.*?\bendobservables\b", re.DOTALL)
+_OBSERVABLE = re.compile(r"\bobservable\s+\"[^\"]*\"\s*=.*?;", re.DOTALL)
+
+
+def underlying_mdp_source(source):
+    """
+    Rewrites the source of a pomdp prism program into the source of its underlying (fully observable) mdp
+    by dropping the observables block and the observable declarations.
+    Sources of other model types are returned unchanged.
+    """
+    if _POMDP_KEYWORD.match(source) is None:
+        return source
+    source = _POMDP_KEYWORD.sub(r"\1mdp", source, count=1)
+    source = _OBSERVABLES_BLOCK.sub("", source)
+    return _OBSERVABLE.sub("", source)
+
+
+# The model types the decision-diagram engine can build.
+_SYMBOLIC_MODEL_TYPES = ("DTMC", "CTMC", "MDP", "MA")
+
+
+def build_symbolic_model(input, instrumentation=None):
+    """
+    Builds a decision-diagram (symbolic) representation of a grid model.
+
+    The decision-diagram engine does not support partial observability, so for pomdp programs the underlying mdp
+    is built (see underlying_mdp_source): values computed on it are those of the fully observable model.
+    The symbolic model supports model checking via gridfullsparse.checking, but no simulation or rendering;
+    use to_sparse to obtain an explicit model for (a part of) its state space.
+
+    :param input: A gridfullsparse.models.Model
+    :param instrumentation: An optional gridfullsparse.instrumentation.BuildInstrumentation
+    :return: The preprocessed prism program, the property, and the symbolic model.
+    """
+    with open(input.path) as f:
+        source = underlying_mdp_source(f.read())
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, os.path.basename(input.path))
+        with open(path, "w") as f:
+            f.write(source)
+        prism_program, prop = prepare_program(input, instrumentation, path)
+    model_type = str(prism_program.model_type).rsplit(".", 1)[-1]
+    if model_type not in _SYMBOLIC_MODEL_TYPES:
+        raise RuntimeError(f"The symbolic engine does not support {model_type} models, only {', '.join(_SYMBOLIC_MODEL_TYPES)}")
+    if instrumentation is not None:
+        instrumentation.set("engine", "dd")
+        instrumentation.set("model_type", model_type.lower())
+    logger.info("Construct symbolic representation of the underlying MDP...")
+    with _stage(instrumentation, "build"):
+        model = sp.build_symbolic_model(prism_program, [prop])
+    if instrumentation is not None:
+        instrumentation.record_model(model)
+    return prism_program, prop, model
+
+
+def _reachable(model, choices):
+    # Breadth-first search from the initial states along the given choices (a set of row indices per state).
+    matrix = model.transition_matrix
+    reachable = set(model.initial_states)
+    queue = list(reachable)
+    while queue:
+        state = queue.pop()
+        for row in choices(state):
+            for entry in matrix.get_row(row):
+                if entry.value() > 0 and entry.column not in reachable:
+                    reachable.add(entry.column)
+                    queue.append(entry.column)
+    return reachable
+
+
+def to_sparse(symbolic_model, policy=None):
+    """
+    Converts a symbolic model into a sparse model.
+
+    :param symbolic_model: A model built by build_symbolic_model.
+    :param policy: Optionally a function that maps a state of the sparse model to the local indices of the actions it may take;
+                   the result is then restricted to the states and actions that are reachable under the policy.
+    :return: The sparse model.
+    """
+    model = sp.transform_to_sparse_model(symbolic_model)
+    if policy is None:
+        return model
+    matrix = model.transition_matrix
+    choices = lambda state: [matrix.get_row_group_start(state) + action for action in policy(state)]
+    states = _reachable(model, choices)
+    actions = [row for state in states for row in choices(state)]
+    result = sp.construct_submodel(model, sp.BitVector(model.nr_states, list(states)),
+                                   sp.BitVector(model.nr_choices, actions), keep_unreachable_states=False)
+    logger.info(f"Restricted to {result.model.nr_states} of {model.nr_states} states reachable under the policy")
+    return result.model
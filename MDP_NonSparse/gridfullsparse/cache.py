@@ -0,0 +1,126 @@
+from contextlib import suppress
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+import gridfullsparse.storage as storage
+
+logger = logging.getLogger(__name__)
+
+CACHE_FORMAT_VERSION = 1
+
+
+def default_cache_directory():
+    return os.environ.get("GRIDSTORM_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "gridfullsparse"))
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ModelCache:
+    """
+    Content-addressed on-disk cache for built (canonic) models.
+
+    Entries are keyed on the prism file, the constants, the formula and the builder flags.
+    The directory is kept below max_size bytes by evicting the least recently used entries.
+    """
+    def __init__(self, directory=None, max_size=2 * 1024 ** 3):
+        self._directory = directory if directory is not None else default_cache_directory()
+        self._max_size = max_size
+        os.makedirs(self._directory, exist_ok=True)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def key(self, path, constants, formula, flags):
+        h = hashlib.sha256()
+        h.update(f"v{CACHE_FORMAT_VERSION}\n".encode())
+        h.update(file_hash(path).encode())
+        h.update(f"\n{constants}\n{formula}\n{','.join(sorted(flags))}".encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self._directory, f"{key}.model")
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def load(self, key, program):
+        """
+        Load the model stored under key, or None if there is no such entry.
+
+        :param key: A key as computed by ModelCache.key
+        :param program: The preprocessed prism program the model was built from.
+        """
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                components = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError) as e:
+            logger.warning(f"Dropping corrupt cache entry {path}: {e}")
+            # Another process may have dropped or evicted it already.
+            with suppress(FileNotFoundError):
+                os.remove(path)
+            return None
+        with suppress(FileNotFoundError):
+            os.utime(path)
+        logger.debug(f"Loaded model from cache entry {path}")
+        return storage.restore_model(components, program)
+
+    def store(self, key, model, program):
+        components = storage.extract_components(model, program)
+        fd, tmp = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(components, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path(key))
+        logger.debug(f"Stored model in cache entry {self.path(key)}")
+        self.evict()
+        return self.path(key)
+
+    def size(self):
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        # Other processes may store or evict concurrently, so entries can vanish while we look at them.
+        entries = []
+        for name in os.listdir(self._directory):
+            if name.endswith(".model"):
+                p = os.path.join(self._directory, name)
+                try:
+                    st = os.stat(p)
+                except FileNotFoundError:
+                    continue
+                entries.append((p, st.st_mtime, st.st_size))
+        return entries
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits into max_size.
+        """
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        while entries and total > self._max_size:
+            p, _, size = entries.pop(0)
+            total -= size
+            logger.info(f"Evicting cache entry {p}")
+            with suppress(FileNotFoundError):
+                os.remove(p)
+
+    def clear(self):
+        for p, _, _ in self._entries():
+            with suppress(FileNotFoundError):
+                os.remove(p)
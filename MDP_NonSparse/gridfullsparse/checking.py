@@ -0,0 +1,36 @@
+import logging
+
+import stormpy as sp
+
+logger = logging.getLogger(__name__)
+
+
+def check(model, prop, only_initial_states=False, extract_scheduler=False):
+    """
+    Model checks a property on a sparse or a symbolic model.
+
+    POMDPs are analysed under full observability, i.e. the result is that of the underlying MDP.
+
+    :param model: A sparse model (e.g. from build_model) or a symbolic model (from build_symbolic_model).
+    :param prop: A property, as returned by gridfullsparse.builder.prepare_program.
+    :param only_initial_states: Whether only the values of the initial states are needed.
+    :param extract_scheduler: Whether to extract a scheduler (only supported by the sparse engine).
+    :return: The check result.
+    """
+    if model.is_symbolic_model:
+        if extract_scheduler:
+            raise RuntimeError("Schedulers can only be extracted from sparse models")
+        return sp.check_model_dd(model, prop, only_initial_states=only_initial_states)
+    return sp.model_checking(model, prop, only_initial_states=only_initial_states, extract_scheduler=extract_scheduler,
+                             force_fully_observable=True)
+
+
+def initial_value(model, prop):
+    """
+    The value of the property in the (unique) initial state, for either engine.
+    """
+    result = check(model, prop, only_initial_states=True)
+    if model.is_symbolic_model:
+        # Restricted to the initial state, minimum and maximum coincide.
+        return result.max
+    return result.at(model.initial_states[0])
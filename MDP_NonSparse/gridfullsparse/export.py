@@ -0,0 +1,260 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from gridfullsparse.storage import matrix_arrays
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+
+
+def _integer_values(model, program, identifier):
+    module, var = identifier
+    expression_variable = program.get_module(module).get_integer_variable(var).expression_variable
+    return np.array([model.state_valuations.get_integer_value(s, expression_variable) for s in range(model.nr_states)],
+                    dtype=np.int32)
+
+
+class ModelArrays:
+    """
+    A built model as a set of flat NumPy arrays.
+
+    The transition matrix is stored in CSR layout: the rows (choices) of state s are row_groups[s]..row_groups[s+1]-1,
+    and the successors of row r are columns[row_starts[r]:row_starts[r+1]] with the corresponding probabilities.
+    Saved bundles are directories of .npy files that are loaded memory-mapped, such that several processes share one copy.
+    """
+    def __init__(self, arrays, metadata):
+        self._arrays = arrays
+        self._metadata = metadata
+        self._labels = {}
+
+    @classmethod
+    def from_model(cls, model, program, annotations=None):
+        """
+        Extract the arrays from a canonic sparse model.
+
+        :param model: The model, as returned by make_canonic.
+        :param program: The prism program the model was built from.
+        :param annotations: The ProgramAnnotation; if given (and the model has state valuations), coordinates are exported.
+        """
+        row_groups, row_starts, columns, values = matrix_arrays(model.transition_matrix)
+        arrays = {
+            "row_groups": np.array(row_groups, dtype=np.int64),
+            "row_starts": np.array(row_starts, dtype=np.int64),
+            "columns": np.array(columns, dtype=np.int64),
+            "probabilities": np.array(values, dtype=np.float64),
+            "initial_states": np.array(list(model.initial_states), dtype=np.int64),
+            "observations": np.array(model.observations, dtype=np.int32)
+        }
+        metadata = {"version": EXPORT_FORMAT_VERSION, "nr_states": model.nr_states, "nr_choices": model.nr_choices,
+                    "nr_observations": model.nr_observations}
+
+        metadata["labels"] = sorted(model.labeling.get_labels())
+        for i, label in enumerate(metadata["labels"]):
+            bits = np.zeros(model.nr_states, dtype=bool)
+            bits[list(model.labeling.get_states(label))] = True
+            arrays[f"label_{i}"] = np.packbits(bits)
+
+        metadata["choice_labels"] = []
+        if model.has_choice_labeling():
+            metadata["choice_labels"] = sorted(model.choice_labeling.get_labels())
+            choice_labels = np.full(model.nr_choices, -1, dtype=np.int32)
+            for i, label in enumerate(metadata["choice_labels"]):
+                choices = np.array(list(model.choice_labeling.get_choices(label)), dtype=np.int64)
+                # One label per choice is stored; a second one would silently replace the first.
+                labelled = choices[choice_labels[choices] >= 0]
+                if len(labelled) > 0:
+                    choice = int(labelled[0])
+                    raise RuntimeError(f"Choice {choice} has several labels ({metadata['choice_labels'][choice_labels[choice]]}, "
+                                       f"{label}), but only one label per choice can be exported")
+                choice_labels[choices] = i
+            arrays["choice_labels"] = choice_labels
+
+        metadata["reward_models"] = {}
+        for i, (name, reward_model) in enumerate(model.reward_models.items()):
+            kinds = []
+            if reward_model.has_state_rewards:
+                arrays[f"reward_{i}_state"] = np.array(reward_model.state_rewards, dtype=np.float64)
+                kinds.append("state")
+            if reward_model.has_state_action_rewards:
+                arrays[f"reward_{i}_state_action"] = np.array(reward_model.state_action_rewards, dtype=np.float64)
+                kinds.append("state_action")
+            metadata["reward_models"][name] = {"index": i, "kinds": kinds}
+
+        metadata["nr_adversaries"] = 0
+        metadata["has_coordinates"] = annotations is not None and model.has_state_valuations()
+        if annotations is not None and not model.has_state_valuations():
+            logger.warning("Model has no state valuations, coordinates are not exported")
+        if metadata["has_coordinates"]:
+            arrays["ego_x"] = _integer_values(model, program, annotations.ego_xvar_identifier)
+            arrays["ego_y"] = _integer_values(model, program, annotations.ego_yvar_identifier)
+            metadata["nr_adversaries"] = annotations.nr_adversaries
+            for i in range(annotations.nr_adversaries):
+                arrays[f"adv_x_{i}"] = _integer_values(model, program, annotations.adv_xvar_identifier(i))
+                arrays[f"adv_y_{i}"] = _integer_values(model, program, annotations.adv_yvar_identifier(i))
+        return cls(arrays, metadata)
+
+    def save(self, directory):
+        """
+        Writes the bundle to the given directory, replacing any previous bundle there.
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=parent, suffix=".tmp")
+        for name, arr in self._arrays.items():
+            np.save(os.path.join(tmp, f"{name}.npy"), arr)
+        with open(os.path.join(tmp, MANIFEST), "w") as f:
+            json.dump(dict(self._metadata, arrays=sorted(self._arrays.keys())), f, indent=1)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(tmp, directory)
+        logger.info(f"Exported model with {self.nr_states} states to {directory}")
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        with open(os.path.join(directory, MANIFEST)) as f:
+            metadata = json.load(f)
+        if metadata["version"] != EXPORT_FORMAT_VERSION:
+            raise RuntimeError(f"Bundle {directory} has format version {metadata['version']}, expected {EXPORT_FORMAT_VERSION}")
+        mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mode) for name in metadata.pop("arrays")}
+        return cls(arrays, metadata)
+
+    @property
+    def nr_states(self):
+        return self._metadata["nr_states"]
+
+    @property
+    def nr_choices(self):
+        return self._metadata["nr_choices"]
+
+    @property
+    def nr_observations(self):
+        return self._metadata["nr_observations"]
+
+    @property
+    def row_groups(self):
+        return self._arrays["row_groups"]
+
+    @property
+    def row_starts(self):
+        return self._arrays["row_starts"]
+
+    @property
+    def columns(self):
+        return self._arrays["columns"]
+
+    @property
+    def probabilities(self):
+        return self._arrays["probabilities"]
+
+    @property
+    def initial_states(self):
+        return self._arrays["initial_states"]
+
+    @property
+    def observations(self):
+        return self._arrays["observations"]
+
+    @property
+    def nr_actions(self):
+        """
+        Number of choices per state.
+        """
+        return np.diff(self.row_groups)
+
+    @property
+    def label_names(self):
+        return self._metadata["labels"]
+
+    def has_label(self, label):
+        return label in self._metadata["labels"]
+
+    def label_bits(self, label):
+        """
+        The packed bitset (see numpy.packbits) of the states with the given label.
+        """
+        if not self.has_label(label):
+            raise RuntimeError(f"Label {label} has not been exported")
+        return self._arrays[f"label_{self._metadata['labels'].index(label)}"]
+
+    def label(self, label):
+        """
+        Boolean vector of the states with the given label.
+        """
+        if label not in self._labels:
+            self._labels[label] = np.unpackbits(self.label_bits(label), count=self.nr_states).astype(bool)
+        return self._labels[label]
+
+    @property
+    def choice_label_names(self):
+        return self._metadata["choice_labels"]
+
+    @property
+    def has_choice_labels(self):
+        return "choice_labels" in self._arrays
+
+    @property
+    def choice_labels(self):
+        """
+        For every choice the index of its label in choice_label_names, or -1.
+        """
+        if "choice_labels" not in self._arrays:
+            raise RuntimeError("Choice labels have not been exported")
+        return self._arrays["choice_labels"]
+
+    @property
+    def reward_model_names(self):
+        return list(self._metadata["reward_models"].keys())
+
+    def _reward(self, name, kind):
+        if name not in self._metadata["reward_models"]:
+            raise RuntimeError(f"Reward model {name} has not been exported")
+        entry = self._metadata["reward_models"][name]
+        if kind not in entry["kinds"]:
+            return None
+        return self._arrays[f"reward_{entry['index']}_{kind}"]
+
+    def state_rewards(self, name):
+        return self._reward(name, "state")
+
+    def state_action_rewards(self, name):
+        return self._reward(name, "state_action")
+
+    @property
+    def has_coordinates(self):
+        return self._metadata["has_coordinates"]
+
+    @property
+    def nr_adversaries(self):
+        return self._metadata["nr_adversaries"]
+
+    @property
+    def ego_coordinates(self):
+        if not self.has_coordinates:
+            raise RuntimeError("Coordinates have not been exported")
+        return self._arrays["ego_x"], self._arrays["ego_y"]
+
+    def adv_coordinates(self, index=0):
+        if index >= self.nr_adversaries:
+            raise RuntimeError(f"No adversary with index {index}")
+        return self._arrays[f"adv_x_{index}"], self._arrays[f"adv_y_{index}"]
+
+
+def export_model(model, program, annotations, directory):
+    """
+    Writes the model as a memory-mappable bundle; see ModelArrays.
+    """
+    arrays = ModelArrays.from_model(model, program, annotations)
+    arrays.save(directory)
+    return arrays
+
+
+def load_model_arrays(directory, mmap=True):
+    return ModelArrays.load(directory, mmap)
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+import logging
+import threading
+
+from gridfullsparse.builder import FULL_PROFILE, build_from_program, prepare_program
+from gridfullsparse.models import experiment_to_grid_model_names
+
+logger = logging.getLogger(__name__)
+
+
+class RegistryStatistics:
+    def __init__(self):
+        self.program_hits = 0
+        self.program_misses = 0
+        self.model_hits = 0
+        self.model_misses = 0
+        self.evictions = 0
+
+
+class _Entry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.program = None
+        self.model = None
+
+
+class ModelRegistry:
+    """
+    Memoizes prepared prism programs and built models per model name and constants.
+
+    At most capacity (name, constants) combinations are kept; the least recently used ones are dropped.
+    The registry can be shared between threads: concurrent requests for the same combination
+    build it only once, requests for different combinations do not block each other.
+    """
+    def __init__(self, factories=None, capacity=16, profile=FULL_PROFILE, cache=None):
+        """
+        :param factories: Maps model names to model factories, by default experiment_to_grid_model_names.
+        :param capacity: Maximal number of (name, constants) combinations that are kept.
+        :param profile: The BuildProfile (or a function deriving one from a model) used for building.
+        :param cache: An optional gridfullsparse.cache.ModelCache that is consulted before building.
+        """
+        self._factories = factories if factories is not None else experiment_to_grid_model_names
+        self._capacity = capacity
+        self._profile = profile
+        self._cache = cache
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._statistics = RegistryStatistics()
+
+    @property
+    def statistics(self):
+        return self._statistics
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self._statistics, counter, getattr(self._statistics, counter) + 1)
+
+    @staticmethod
+    def _key(name, constants):
+        # Constants arrive as ints or as strings (e.g. from the command line); both denote the same model.
+        return name, tuple(sorted((k, str(v)) for k, v in constants.items()))
+
+    def _entry(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry()
+                self._entries[key] = entry
+                while len(self._entries) > self._capacity:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._statistics.evictions += 1
+                    logger.debug(f"Evicting {evicted} from the registry")
+            else:
+                self._entries.move_to_end(key)
+            return entry
+
+    def input(self, name, **constants):
+        if name not in self._factories:
+            raise RuntimeError(f"Unknown model {name}, known models are {', '.join(self._factories.keys())}")
+        return self._factories[name](**constants)
+
+    def _program(self, entry, input):
+        # Must be called with entry.lock held.
+        if entry.program is None:
+            self._count("program_misses")
+            entry.program = (input,) + prepare_program(input)
+        else:
+            self._count("program_hits")
+        return entry.program
+
+    def program(self, name, **constants):
+        """
+        :return: The preprocessed prism program and the first property of the model.
+        """
+        # Unknown names (and invalid constants) fail here, before they can evict a valid entry.
+        input = self.input(name, **constants)
+        entry = self._entry(self._key(name, constants))
+        with entry.lock:
+            _, prism_program, prop = self._program(entry, input)
+        return prism_program, prop
+
+    def model(self, name, **constants):
+        """
+        :return: The preprocessed prism program and the canonic model.
+        """
+        input = self.input(name, **constants)
+        entry = self._entry(self._key(name, constants))
+        with entry.lock:
+            input, prism_program, prop = self._program(entry, input)
+            if entry.model is None:
+                self._count("model_misses")
+                profile = self._profile(input) if callable(self._profile) else self._profile
+                entry.model = build_from_program(input, prism_program, prop, self._cache, profile)
+            else:
+                self._count("model_hits")
+            return prism_program, entry.model
+
+    def invalidate(self, name=None, **constants):
+        """
+        Drops cached programs and models: everything if no name is given,
+        all combinations of a model if no constants are given, and otherwise the given combination.
+        """
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            elif not constants:
+                for key in [key for key in self._entries if key[0] == name]:
+                    del self._entries[key]
+            else:
+                self._entries.pop(self._key(name, constants), None)
@@ -0,0 +1,150 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+
+import numpy as np
+import stormpy as sp
+import stormpy.simulator
+
+from gridfullsparse.builder import build_model
+from gridfullsparse.cache import ModelCache
+from gridfullsparse.export import ModelArrays
+from gridfullsparse.models import experiment_to_grid_model_names
+from gridfullsparse.policy import as_policy
+from gridfullsparse.simulator import first_good_runs, run_episode
+from gridfullsparse.vectorized import ArraySimulator
+
+logger = logging.getLogger(__name__)
+
+# The simulation context of a worker process, set up once by _initialize.
+_worker = None
+
+
+class _WorkerContext:
+    def __init__(self, model_name, constants, cache_directory, bundle, shield, shield_fallback):
+        self.shield = shield
+        self.shield_fallback = shield_fallback
+        if bundle is not None:
+            # Memory-mapped, so all workers share one copy of the model.
+            arrays = ModelArrays.load(bundle)
+            self._simulator = ArraySimulator(arrays)
+            self._model = None
+            self.observations = arrays.observations
+        else:
+            input = experiment_to_grid_model_names[model_name](**constants)
+            _, self._model = build_model(input, cache=ModelCache(cache_directory))
+            self._simulator = None
+            self.observations = np.asarray(self._model.observations)
+
+    def simulator(self, seed_sequence):
+        seed = int(seed_sequence.generate_state(1)[0])
+        if self._simulator is not None:
+            self._simulator.seed(seed)
+            return self._simulator
+        simulator = sp.simulator.create_simulator(self._model, seed=seed)
+        simulator.set_full_observability(True)
+        return simulator
+
+
+def _initialize(model_name, constants, cache_directory, bundle, shield, shield_fallback):
+    global _worker
+    _worker = _WorkerContext(model_name, constants, cache_directory, bundle, shield, shield_fallback)
+
+
+def _run_chunk(start, stop, seed, maxsteps, policy, keep_trajectories):
+    summaries = []
+    for index in range(start, stop):
+        # The index-th child of SeedSequence(seed), as spawn would create it.
+        simulator_seed, action_seed, policy_seed = np.random.SeedSequence(seed, spawn_key=(index,)).spawn(3)
+        if policy is not None:
+            policy.seed(policy_seed)
+        episode = run_episode(_worker.simulator(simulator_seed), np.random.default_rng(action_seed), maxsteps, index,
+                              policy, _worker.observations, _worker.shield, _worker.shield_fallback)
+        summaries.append(episode.summary(keep_trajectories))
+    return summaries
+
+
+class ParallelEpisodeRunner:
+    """
+    Simulates episodes of a grid model in a pool of worker processes.
+
+    Every episode draws from its own random stream, derived from the seed by SeedSequence spawning,
+    and episodes are merged by their index. The same seed thus gives the same episodes for any number of workers.
+    Workers set up the model once: they load a memory-mapped bundle (see gridfullsparse.export) if one is given,
+    and otherwise obtain the model from the model cache.
+    """
+    def __init__(self, model_name, constants, processes=None, cache_directory=None, bundle=None, chunk_size=16, policy=None,
+                 shield=None, shield_fallback=False):
+        """
+        :param model_name: A key of experiment_to_grid_model_names.
+        :param constants: The constants of the model.
+        :param processes: Number of worker processes, the number of cores if None.
+        :param cache_directory: The model cache used by the workers, the default cache if None.
+        :param bundle: A directory with an exported model; if given, workers simulate on the arrays.
+        :param chunk_size: Number of episodes that are handed to a worker at once.
+        :param policy: A picklable gridfullsparse.policy.Policy; actions are selected uniformly at random if None.
+            It is reseeded for every episode (see Policy.seed), so stochastic policies are reproducible as well;
+            functions wrapped in a CallablePolicy must not keep random state of their own.
+        :param shield: A gridfullsparse.shield.Shield for the model, restricting the actions; it is sent to every worker once.
+        :param shield_fallback: Whether all available actions are allowed where the shield allows none, instead of raising.
+        """
+        if model_name not in experiment_to_grid_model_names:
+            raise RuntimeError(f"Unknown model {model_name}")
+        self._model_name = model_name
+        self._constants = constants
+        self._processes = processes
+        self._cache_directory = cache_directory
+        self._bundle = bundle
+        self._chunk_size = chunk_size
+        self._policy = as_policy(policy) if policy is not None else None
+        self._shield = shield
+        self._shield_fallback = shield_fallback
+
+    def episodes(self, nr_episodes, seed, maxsteps=200, keep_trajectories=False, max_pending=None):
+        """
+        Yields an EpisodeSummary per episode, ordered by index, while the workers keep simulating.
+
+        At most max_pending chunks are submitted ahead of the consumer (by default two per worker),
+        so a slow consumer throttles the workers and memory stays bounded.
+        """
+        processes = self._processes if self._processes is not None else os.cpu_count()
+        max_pending = max_pending if max_pending is not None else 2 * processes
+        starts = iter(range(0, nr_episodes, self._chunk_size))
+        with ProcessPoolExecutor(max_workers=processes, initializer=_initialize,
+                                 initargs=(self._model_name, self._constants, self._cache_directory, self._bundle,
+                                           self._shield, self._shield_fallback)) as pool:
+            pending = deque()
+
+            def submit():
+                start = next(starts, None)
+                if start is not None:
+                    stop = min(start + self._chunk_size, nr_episodes)
+                    pending.append(pool.submit(_run_chunk, start, stop, seed, maxsteps, self._policy, keep_trajectories))
+
+            for _ in range(max_pending):
+                submit()
+            while pending:
+                summaries = pending.popleft().result()
+                submit()
+                yield from summaries
+
+    def run(self, nr_episodes, seed, maxsteps=200):
+        """
+        :return: The list of Episodes, ordered by their index.
+        """
+        episodes = [summary.trajectory for summary in self.episodes(nr_episodes, seed, maxsteps, keep_trajectories=True)]
+        logger.info(f"Simulated {nr_episodes} episodes, {sum(e.finished for e in episodes)} finished")
+        return episodes
+
+    def simulate(self, recorder, nr_good_runs=1, total_nr_runs=5, maxsteps=200, seed=42):
+        """
+        Like SimulationExecutor.simulate: the episodes up to the nr_good_runs-th finished one are recorded.
+
+        All total_nr_runs episodes are simulated and the prefix is selected afterwards, which keeps the result
+        independent of the order in which workers complete.
+        """
+        episodes = first_good_runs(self.run(total_nr_runs, seed, maxsteps), nr_good_runs)
+        for episode in episodes:
+            episode.replay(recorder)
+        return [episode.finished for episode in episodes]
@@ -0,0 +1,65 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class AliasSampler:
+    """
+    Samples successors in constant time per sample with Walker's alias method.
+
+    For a row with k successors, entry j of the row keeps the probability with which it is sampled itself
+    and the entry (its alias) that is sampled otherwise. A sample picks j uniformly and then decides between
+    j and its alias, independently of k. The tables are built once, with Vose's pairing of an under-full
+    with an over-full column, vectorized over all rows with the same number of successors.
+
+    Offers the interface of gridfullsparse.vectorized.CumulativeSampler.
+    """
+    def __init__(self, arrays):
+        self._row_starts = np.asarray(arrays.row_starts)
+        self._counts = np.diff(self._row_starts)
+        probabilities = np.asarray(arrays.probabilities, dtype=np.float64)
+        self._probabilities = np.ones(len(probabilities))
+        self._aliases = np.arange(len(probabilities), dtype=np.int64)
+        for k in np.unique(self._counts):
+            if k > 1:
+                self._build(np.flatnonzero(self._counts == k), int(k), probabilities)
+
+    def _build(self, rows, k, probabilities):
+        entries = self._row_starts[rows][:, np.newaxis] + np.arange(k, dtype=np.int64)
+        scaled = probabilities[entries]
+        scaled = scaled * k / scaled.sum(axis=1, keepdims=True)
+        keep = np.ones((len(rows), k))
+        aliases = entries.copy()
+        done = np.zeros((len(rows), k), dtype=bool)
+        index = np.arange(len(rows))
+        for _ in range(k - 1):
+            small = np.argmin(np.where(done, np.inf, scaled), axis=1)
+            candidates = np.where(done, -np.inf, scaled)
+            candidates[index, small] = -np.inf
+            large = np.argmax(candidates, axis=1)
+            keep[index, small] = scaled[index, small]
+            aliases[index, small] = entries[index, large]
+            scaled[index, large] -= 1 - scaled[index, small]
+            done[index, small] = True
+        # The column that remains keeps all its (by now exactly one unit of) mass.
+        self._probabilities[entries] = np.minimum(keep, 1.0)
+        self._aliases[entries] = aliases
+
+    @property
+    def nbytes(self):
+        return self._probabilities.nbytes + self._aliases.nbytes
+
+    def sample(self, rows, uniforms):
+        """
+        :param rows: The rows (choices) to sample from.
+        :param uniforms: Uniformly distributed numbers in [0,1), one per row.
+        :return: The entries (indices into columns) that were sampled.
+        """
+        counts = self._counts[rows]
+        scaled = uniforms * counts
+        # One uniform number selects the column (integer part) and decides for it or its alias (fractional part).
+        columns = np.minimum(scaled.astype(np.int64), counts - 1)
+        entries = self._row_starts[rows] + columns
+        return np.where(scaled - columns < self._probabilities[entries], entries, self._aliases[entries])
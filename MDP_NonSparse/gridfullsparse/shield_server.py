@@ -0,0 +1,374 @@
+import asyncio
+import logging
+import socket
+import struct
+import threading
+
+import numpy as np
+
+from gridfullsparse.shield import BeliefSupportShield, initial_support, load_shield, successor_support
+
+logger = logging.getLogger(__name__)
+
+# Request kinds: the masks of a batch of states, or of a batch of belief supports.
+STATES = 0
+SUPPORTS = 1
+
+_LENGTH = struct.Struct("<I")
+_REQUEST = struct.Struct("<BHI")
+_RESPONSE = struct.Struct("<BIH")
+_OK = 0
+_ERROR = 1
+
+
+def _encode_request(name, kind, states, lengths=None):
+    name = name.encode()
+    states = np.ascontiguousarray(states, dtype=np.int64)
+    if kind == SUPPORTS:
+        lengths = np.ascontiguousarray(lengths, dtype=np.int32)
+        return _REQUEST.pack(kind, len(name), len(lengths)) + name + lengths.tobytes() + states.tobytes()
+    return _REQUEST.pack(kind, len(name), len(states)) + name + states.tobytes()
+
+
+def _decode_request(body):
+    kind, name_length, count = _REQUEST.unpack_from(body)
+    offset = _REQUEST.size
+    name = body[offset:offset + name_length].decode()
+    offset += name_length
+    lengths = None
+    if kind == SUPPORTS:
+        lengths = np.frombuffer(body, dtype=np.int32, count=count, offset=offset)
+        offset += 4 * count
+    states = np.frombuffer(body, dtype=np.int64, offset=offset)
+    return name, kind, states, lengths
+
+
+async def _read_message(reader):
+    header = await reader.readexactly(_LENGTH.size)
+    return await reader.readexactly(_LENGTH.unpack(header)[0])
+
+
+def _recv_exactly(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise RuntimeError("The shield server closed the connection")
+        received += n
+    return buffer
+
+
+class ServerStatistics:
+    def __init__(self):
+        self.requests = 0
+        self.batches = 0
+        self.lookups = 0
+
+    @property
+    def mean_batch_size(self):
+        """
+        Mean number of requests that were answered together.
+        """
+        return self.requests / self.batches if self.batches > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.requests} requests in {self.batches} batches ({self.mean_batch_size:.1f} per batch), {self.lookups} lookups"
+
+
+class ShieldServer:
+    """
+    Answers queries for the allowed actions of a batch of states (for a gridfullsparse.shield.Shield) or of belief supports
+    (for a gridfullsparse.shield.BeliefSupportShield) over a unix socket or a localhost TCP socket, such that many
+    processes share the shields that the server loaded once.
+
+    Requests that arrive concurrently are coalesced: all pending requests for a shield are answered by one
+    vectorized lookup. Messages are length-prefixed binary frames; responses carry the allowed actions as packed
+    bit rows (see numpy.packbits).
+    """
+    def __init__(self, shields=None, max_delay=0.0):
+        """
+        :param shields: Maps names to shields.
+        :param max_delay: Seconds to wait for further requests before answering a batch.
+        """
+        self._shields = dict(shields) if shields is not None else {}
+        self._max_delay = max_delay
+        self._statistics = ServerStatistics()
+        self._loop = None
+        self._server = None
+        self._queue = None
+        self._thread = None
+        self._address = None
+        self._started = threading.Event()
+
+    @classmethod
+    def from_models(cls, models, threshold=1.0, relative=True, store=None, cache=None, **kwargs):
+        """
+        Loads the shields of grid models (see gridfullsparse.shield.load_shield).
+
+        :param models: Maps names to pairs of a key of experiment_to_grid_model_names and the constants.
+        """
+        shields = {name: load_shield(model_name, constants, threshold, relative, store, cache)
+                   for name, (model_name, constants) in models.items()}
+        return cls(shields, **kwargs)
+
+    @property
+    def statistics(self):
+        return self._statistics
+
+    @property
+    def address(self):
+        """
+        The address the server listens on; for TCP with port 0, the port that was assigned.
+        """
+        return self._address
+
+    @property
+    def names(self):
+        return list(self._shields.keys())
+
+    def register(self, name, shield):
+        self._shields[name] = shield
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    body = await _read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                future = self._loop.create_future()
+                try:
+                    request = _decode_request(body)
+                except (struct.error, ValueError, UnicodeDecodeError) as e:
+                    future.set_result(self._error(f"Malformed request: {e}"))
+                else:
+                    await self._queue.put((request, future))
+                response = await future
+                writer.write(_LENGTH.pack(len(response)) + response)
+                await writer.drain()
+        except asyncio.CancelledError:
+            # The server is shutting down while the client is still connected.
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _error(message):
+        return _RESPONSE.pack(_ERROR, 0, 0) + message.encode()
+
+    @staticmethod
+    def _response(masks):
+        bits = np.packbits(masks, axis=1)
+        return _RESPONSE.pack(_OK, masks.shape[0], masks.shape[1]) + bits.tobytes()
+
+    def _answer(self, name, kind, requests):
+        shield = self._shields.get(name)
+        if shield is None:
+            return [self._error(f"Unknown shield {name}")] * len(requests)
+        if kind == STATES:
+            if isinstance(shield, BeliefSupportShield):
+                return [self._error(f"Shield {name} decides on belief supports, not on states")] * len(requests)
+        elif not isinstance(shield, BeliefSupportShield):
+            return [self._error(f"Shield {name} does not decide on belief supports")] * len(requests)
+        # Invalid requests are answered with an error on their own, such that they do not fail the whole batch;
+        # negative state ids would otherwise silently index from the end.
+        nr_states = shield.nr_states if kind == STATES else len(shield.observations)
+        responses = [None] * len(requests)
+        valid = []
+        for i, (states, lengths) in enumerate(requests):
+            invalid = states[(states < 0) | (states >= nr_states)]
+            if len(invalid) > 0:
+                responses[i] = self._error(f"Invalid query: states {invalid[:10].tolist()} are not in 0..{nr_states - 1}")
+            elif lengths is not None and (np.any(lengths < 0) or lengths.sum() != len(states)):
+                responses[i] = self._error(f"Invalid query: the support lengths do not add up to the {len(states)} states")
+            else:
+                valid.append(i)
+        if not valid:
+            return responses
+        states = np.concatenate([requests[i][0] for i in valid])
+        if kind == STATES:
+            masks = shield.masks(states)
+            self._statistics.lookups += len(states)
+            ends = np.cumsum([len(requests[i][0]) for i in valid])
+        else:
+            # The allowed actions of a support are not those allowed in all its states (see BeliefSupportShield),
+            # so supports are looked up as a whole, all requests in one call.
+            masks = shield.batch_masks(states, np.concatenate([requests[i][1] for i in valid]))
+            self._statistics.lookups += len(masks)
+            ends = np.cumsum([len(requests[i][1]) for i in valid])
+        for i, part in zip(valid, np.split(masks, ends[:-1])):
+            responses[i] = self._response(part)
+        return responses
+
+    async def _batch(self):
+        while True:
+            batch = [await self._queue.get()]
+            if self._max_delay > 0:
+                await asyncio.sleep(self._max_delay)
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self._statistics.requests += len(batch)
+            self._statistics.batches += 1
+            groups = {}
+            for (name, kind, states, lengths), future in batch:
+                groups.setdefault((name, kind), []).append(((states, lengths), future))
+            for (name, kind), entries in groups.items():
+                try:
+                    responses = self._answer(name, kind, [request for request, _ in entries])
+                except (IndexError, ValueError) as e:
+                    responses = [self._error(f"Invalid query: {e}")] * len(entries)
+                except Exception as e:
+                    # Any failure must still answer the pending requests, otherwise their clients wait forever.
+                    logger.exception(f"Failed to answer {len(entries)} requests for shield {name}")
+                    responses = [self._error(f"Server error: {e!r}")] * len(entries)
+                for (_, future), response in zip(entries, responses):
+                    # The future is cancelled if its client disconnected in the meantime.
+                    if not future.done():
+                        future.set_result(response)
+
+    async def serve(self, address):
+        """
+        Serves until cancelled.
+
+        :param address: A path for a unix socket, or a (host, port) pair for TCP.
+        """
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        if isinstance(address, str):
+            self._server = await asyncio.start_unix_server(self._handle, path=address)
+        else:
+            self._server = await asyncio.start_server(self._handle, *address)
+            address = self._server.sockets[0].getsockname()[:2]
+        self._address = address
+        batcher = asyncio.ensure_future(self._batch())
+        logger.info(f"Serving shields {self.names} on {address}")
+        self._started.set()
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            batcher.cancel()
+
+    def serve_forever(self, address):
+        asyncio.run(self.serve(address))
+
+    def start(self, address):
+        """
+        Serves from a background thread of this process.
+        """
+        def run():
+            try:
+                asyncio.run(self.serve(address))
+            except asyncio.CancelledError:
+                pass
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class ShieldClient:
+    """
+    Queries a shield of a ShieldServer.
+
+    It has the interface of a gridfullsparse.shield.Shield, so it can be passed as the shield of
+    gridfullsparse.simulator.run_episode, SimulationExecutor or the planner.
+    For a gridfullsparse.shield.BeliefSupportShield, pass the arrays of the model: the client then tracks the belief
+    support of the episode like a gridfullsparse.shield.SupportMonitor (run_episode informs it via restart and update),
+    and masks and allowed_actions return the actions allowed for the current support.
+    """
+    def __init__(self, address, name, arrays=None):
+        """
+        :param address: The address of the server, a path for a unix socket or a (host, port) pair.
+        :param name: The name of the shield on the server.
+        :param arrays: The gridfullsparse.export.ModelArrays of the model, to track the belief support; without them the
+            shield is queried by state, which requires a fully observable shield.
+        """
+        if isinstance(address, str):
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket.connect(address)
+        self._name = name
+        self._arrays = arrays
+        self._support = initial_support(arrays) if arrays is not None else None
+
+    def _query(self, kind, states, lengths=None):
+        body = _encode_request(self._name, kind, states, lengths)
+        self._socket.sendall(_LENGTH.pack(len(body)) + body)
+        response = _recv_exactly(self._socket, _LENGTH.unpack(_recv_exactly(self._socket, _LENGTH.size))[0])
+        status, rows, width = _RESPONSE.unpack_from(response)
+        if status != _OK:
+            raise RuntimeError(bytes(response[_RESPONSE.size:]).decode())
+        bits = np.frombuffer(response, dtype=np.uint8, offset=_RESPONSE.size).reshape(rows, (width + 7) // 8)
+        return np.unpackbits(bits, axis=1, count=width).astype(bool)
+
+    @property
+    def support(self):
+        """
+        The tracked belief support, or None if the client queries by state.
+        """
+        return self._support
+
+    def masks(self, states):
+        """
+        The boolean masks of the allowed actions of a batch of states; when tracking the support, every row is the
+        mask of the support.
+        """
+        if self._support is not None:
+            return np.tile(self.support_masks([self._support])[0], (len(states), 1))
+        return self._query(STATES, states)
+
+    def support_masks(self, supports):
+        """
+        The boolean masks of the allowed actions of a batch of belief supports (arrays of states).
+        """
+        supports = [np.asarray(support, dtype=np.int64) for support in supports]
+        states = np.concatenate(supports) if supports else np.zeros(0, dtype=np.int64)
+        return self._query(SUPPORTS, states, [len(support) for support in supports])
+
+    def __call__(self, states):
+        return self.masks(states)
+
+    def allowed_actions(self, state):
+        return [int(a) for a in np.flatnonzero(self.masks([state])[0])]
+
+    def restart(self):
+        if self._arrays is not None:
+            self._support = initial_support(self._arrays)
+
+    def update(self, action, state):
+        if self._arrays is None:
+            return
+        observation = self._arrays.observations[state]
+        support = successor_support(self._arrays, self._support, action, observation)
+        if len(support) == 0:
+            logger.warning(f"Observation {observation} is inconsistent with the support, continuing with all states that have it")
+            support = np.flatnonzero(np.asarray(self._arrays.observations) == observation)
+        self._support = support
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,488 @@
+import logging
+import math
+
+import numpy as np
+
+from gridfullsparse.episodes import Episode, EpisodeSummary
+from gridfullsparse.export import ModelArrays
+from gridfullsparse.policy import action_masks, as_policy
+
+logger = logging.getLogger(__name__)
+
+
+def sink_states(arrays):
+    """
+    Boolean vector of the states in which every choice is a self-loop with probability one.
+
+    These are the states in which the stormpy simulator reports is_done().
+    """
+    counts = np.diff(arrays.row_starts)
+    row_states = np.repeat(np.arange(arrays.nr_states, dtype=np.int64), arrays.nr_actions)
+    single = counts == 1
+    self_loop = np.zeros(arrays.nr_choices, dtype=bool)
+    self_loop[single] = np.asarray(arrays.columns)[np.asarray(arrays.row_starts[:-1])[single]] == row_states[single]
+    # A state is a sink if none of its rows leaves it.
+    not_sink = np.zeros(arrays.nr_states, dtype=bool)
+    not_sink[row_states[~self_loop]] = True
+    return ~not_sink
+
+
+class CumulativeSampler:
+    """
+    Samples successors by a binary search over the cumulative probabilities of all rows at once.
+
+    Within row r, the cumulative probabilities are shifted by r, such that the cumulative probabilities
+    of all rows form a single sorted array and one searchsorted call serves a whole batch of rows.
+    """
+    def __init__(self, arrays):
+        self._row_starts = np.asarray(arrays.row_starts)
+        probabilities = np.asarray(arrays.probabilities, dtype=np.float64)
+        counts = np.diff(self._row_starts)
+        cumulative = np.cumsum(probabilities)
+        offsets = np.repeat(cumulative[self._row_starts[:-1]] - probabilities[self._row_starts[:-1]], counts)
+        self._keys = cumulative - offsets + np.repeat(np.arange(len(counts), dtype=np.float64), counts)
+
+    def sample(self, rows, uniforms):
+        """
+        :param rows: The rows (choices) to sample from.
+        :param uniforms: Uniformly distributed numbers in [0,1), one per row.
+        :return: The entries (indices into columns) that were sampled.
+        """
+        entries = np.searchsorted(self._keys, rows + uniforms, side='right')
+        # Rounding may push the search just past the row.
+        return np.clip(entries, self._row_starts[rows], self._row_starts[rows + 1] - 1)
+
+
+class SimulatorSnapshot:
+    """
+    The current states and step counters of a simulator and, optionally, the state of its random number generator.
+    """
+    def __init__(self, states, steps, rng_state=None):
+        self.states = states
+        self.steps = steps
+        self.rng_state = rng_state
+
+
+class BatchedSimulator:
+    """
+    Simulates many independent episodes of a model in lockstep.
+
+    States are state ids of the canonic model, actions are indices into the choices of the current state
+    (as for the stormpy simulator). Rewards are those of the stormpy simulator: the state-action reward of the
+    chosen action plus the state reward of the reached state.
+    An episode terminates in a sink state (see sink_states) or a state with one of the given labels,
+    and is truncated after maxsteps steps. Finished episodes are restarted automatically, unless autoreset is disabled.
+    """
+    def __init__(self, arrays, nr_episodes, seed=None, reward_models=None, done_labels=(), maxsteps=None, sampler=None,
+                 autoreset=True, terminal=None):
+        """
+        :param arrays: A gridfullsparse.export.ModelArrays.
+        :param nr_episodes: The number of episodes that are simulated in parallel.
+        :param seed: Seed for the random number generator, or a numpy Generator.
+        :param reward_models: The names of the reward models to report, by default all exported reward models.
+        :param done_labels: Labels of states that terminate an episode, in addition to sink states.
+        :param maxsteps: Number of steps after which an episode is truncated, or None.
+        :param sampler: The successor sampler, by default a CumulativeSampler; see also gridfullsparse.sampling.AliasSampler.
+        :param autoreset: Whether finished episodes are restarted in the step in which they finish.
+        :param terminal: Boolean vector of the states that terminate an episode, replacing sinks and done labels.
+        """
+        self._arrays = arrays
+        self._nr_episodes = nr_episodes
+        self._rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+        self._row_groups = np.asarray(arrays.row_groups)
+        self._columns = np.asarray(arrays.columns)
+        self._nr_actions = np.diff(self._row_groups)
+        self._initial_states = np.asarray(arrays.initial_states)
+        self._sampler = sampler if sampler is not None else CumulativeSampler(arrays)
+        if terminal is not None:
+            self._terminal = np.asarray(terminal, dtype=bool)
+        else:
+            self._terminal = sink_states(arrays)
+            for label in done_labels:
+                self._terminal = self._terminal | arrays.label(label)
+        self._maxsteps = maxsteps
+        self._autoreset = autoreset
+
+        self._reward_model_names = list(arrays.reward_model_names) if reward_models is None else list(reward_models)
+        self._state_rewards = np.zeros((len(self._reward_model_names), arrays.nr_states))
+        self._state_action_rewards = np.zeros((len(self._reward_model_names), arrays.nr_choices))
+        for i, name in enumerate(self._reward_model_names):
+            if arrays.state_rewards(name) is not None:
+                self._state_rewards[i] = arrays.state_rewards(name)
+            if arrays.state_action_rewards(name) is not None:
+                self._state_action_rewards[i] = arrays.state_action_rewards(name)
+
+        self._states = np.zeros(nr_episodes, dtype=np.int64)
+        self._steps = np.zeros(nr_episodes, dtype=np.int64)
+        self._final_states = np.zeros(nr_episodes, dtype=np.int64)
+        self._last_steps = np.zeros(nr_episodes, dtype=np.int64)
+        self._nr_finished = 0
+        self.reset()
+
+    @classmethod
+    def from_model(cls, model, program, nr_episodes, **kwargs):
+        """
+        Creates a batched simulator for a canonic model, as returned by gridfullsparse.builder.build_model.
+        """
+        return cls(ModelArrays.from_model(model, program), nr_episodes, **kwargs)
+
+    @property
+    def arrays(self):
+        return self._arrays
+
+    @property
+    def nr_episodes(self):
+        return self._nr_episodes
+
+    @property
+    def reward_model_names(self):
+        return self._reward_model_names
+
+    @property
+    def states(self):
+        return self._states
+
+    @property
+    def steps(self):
+        """
+        The number of steps every episode has taken since its last reset.
+        """
+        return self._steps
+
+    @property
+    def final_states(self):
+        """
+        For episodes that finished in the last step, the state in which they finished (they have been restarted since).
+        """
+        return self._final_states
+
+    @property
+    def nr_finished(self):
+        """
+        The total number of finished (terminated or truncated) episodes.
+        """
+        return self._nr_finished
+
+    @property
+    def nr_actions(self):
+        """
+        The number of available actions for every episode.
+        """
+        return self._nr_actions[self._states]
+
+    @property
+    def observations(self):
+        """
+        The observations of the current states.
+        """
+        return np.asarray(self._arrays.observations)[self._states]
+
+    def action_masks(self):
+        """
+        The masks of the available actions of all episodes, see gridfullsparse.policy.action_masks.
+        """
+        return action_masks(self.nr_actions, int(self._nr_actions.max()))
+
+    def select_actions(self, policy=None):
+        """
+        Actions for all episodes from the given gridfullsparse.policy.Policy, or uniformly random ones if None.
+        """
+        if policy is None:
+            return self.random_actions()
+        return policy(self._states, self.observations, self.action_masks())
+
+    @property
+    def terminal(self):
+        return self._terminal
+
+    def seed(self, seed):
+        """
+        Replaces the random number generator, e.g. to give every episode an independent stream.
+        """
+        self._rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+
+    def _initial(self, n):
+        if len(self._initial_states) == 1:
+            return np.full(n, self._initial_states[0], dtype=np.int64)
+        return self._rng.choice(self._initial_states, size=n)
+
+    def reset(self, mask=None):
+        """
+        Restarts all episodes, or those selected by the boolean mask.
+
+        :return: The current states and, per reward model, the state rewards of the initial states.
+        """
+        if mask is None:
+            mask = np.ones(self._nr_episodes, dtype=bool)
+        self._states[mask] = self._initial(int(np.count_nonzero(mask)))
+        self._steps[mask] = 0
+        return self._states, self._state_rewards[:, self._states].T
+
+    def set_states(self, states, mask=None, steps=0):
+        """
+        Continues all episodes (or those selected by the boolean mask) from the given states,
+        e.g. to branch many rollouts from a state in the middle of an episode.
+
+        :param states: The states, one per (selected) episode, or a single state for all of them.
+        :param steps: The step counters of these episodes, relevant for truncation.
+        """
+        if mask is None:
+            mask = np.ones(self._nr_episodes, dtype=bool)
+        self._states[mask] = states
+        self._steps[mask] = steps
+
+    def snapshot(self, include_rng=True):
+        """
+        Saves the current states; restoring the snapshot (with the random number generator) repeats the same future.
+        """
+        return SimulatorSnapshot(self._states.copy(), self._steps.copy(),
+                                 self._rng.bit_generator.state if include_rng else None)
+
+    def restore(self, snapshot):
+        self._states[:] = snapshot.states
+        self._steps[:] = snapshot.steps
+        if snapshot.rng_state is not None:
+            self._rng.bit_generator.state = snapshot.rng_state
+
+    def rollout(self, depth, policy=None, discount=1.0):
+        """
+        Simulates up to depth steps from the current states; episodes are neither restarted nor truncated,
+        and stop accumulating rewards once they terminate.
+
+        :param policy: A gridfullsparse.policy.Policy (or anything gridfullsparse.policy.as_policy accepts), by default uniformly random.
+        :param discount: Discount factor for the rewards.
+        :return: The accumulated discounted rewards (one column per reward model) and the terminated mask.
+        """
+        policy = as_policy(policy) if policy is not None else None
+        accumulated = np.zeros((self._nr_episodes, len(self._reward_model_names)))
+        active = ~self._terminal[self._states]
+        autoreset, maxsteps = self._autoreset, self._maxsteps
+        self._autoreset, self._maxsteps = False, None
+        try:
+            factor = 1.0
+            for _ in range(depth):
+                if not active.any():
+                    break
+                _, rewards, terminated, _ = self.step(self.select_actions(policy))
+                accumulated[active] += factor * rewards[active]
+                active &= ~terminated
+                factor *= discount
+        finally:
+            self._autoreset, self._maxsteps = autoreset, maxsteps
+        return accumulated, self._terminal[self._states]
+
+    def random_actions(self):
+        """
+        Uniformly random actions for all episodes.
+        """
+        return (self._rng.random(self._nr_episodes) * self.nr_actions).astype(np.int64)
+
+    def step(self, actions):
+        """
+        Takes one step in every episode.
+
+        :param actions: For every episode the index of the selected action.
+        :return: The new states, the rewards (one column per reward model), and the terminated and truncated masks.
+            With autoreset, episodes that terminated or were truncated have already been restarted;
+            their last state is in final_states.
+        """
+        actions = np.asarray(actions, dtype=np.int64)
+        if np.any(actions >= self._nr_actions[self._states]) or np.any(actions < 0):
+            raise RuntimeError("Selected action is not available")
+        rows = self._row_groups[self._states] + actions
+        entries = self._sampler.sample(rows, self._rng.random(self._nr_episodes))
+        self._states = self._columns[entries]
+        self._steps += 1
+        rewards = (self._state_action_rewards[:, rows] + self._state_rewards[:, self._states]).T
+
+        terminated = self._terminal[self._states]
+        truncated = ~terminated & (self._steps >= self._maxsteps) if self._maxsteps is not None else np.zeros_like(terminated)
+        finished = terminated | truncated
+        if np.any(finished):
+            self._final_states = np.where(finished, self._states, self._final_states)
+            self._last_steps = np.where(finished, self._steps, self._last_steps)
+            self._nr_finished += int(np.count_nonzero(finished))
+            if self._autoreset:
+                self.reset(finished)
+        return self._states, rewards, terminated, truncated
+
+    def episodes(self, nr_episodes=None, policy=None, keep_trajectories=False):
+        """
+        Steps all episodes in lockstep and yields an EpisodeSummary for every episode as soon as it finishes.
+
+        Only the running episodes are kept in memory; the simulation pauses while the consumer processes a summary.
+        Summaries arrive in the order in which episodes finish. Requires autoreset.
+
+        :param nr_episodes: Number of episodes to yield, or None for an endless stream.
+        :param keep_trajectories: Whether the summaries carry the trajectories (costs a Python list append per step).
+        """
+        if not self._autoreset:
+            raise RuntimeError("Streaming episodes requires autoreset")
+        policy = as_policy(policy) if policy is not None else None
+        states, rewards = self.reset()
+        accumulated = rewards.copy()
+        trajectories = [Episode() for _ in range(self._nr_episodes)] if keep_trajectories else None
+        if keep_trajectories:
+            for i, trajectory in enumerate(trajectories):
+                trajectory.states.append(int(states[i]))
+        count = 0
+        while nr_episodes is None or count < nr_episodes:
+            nr_actions = self.nr_actions.copy()
+            actions = np.asarray(self.select_actions(policy))
+            states, rewards, terminated, truncated = self.step(actions)
+            accumulated += rewards
+            finished = terminated | truncated
+            if keep_trajectories:
+                for i, trajectory in enumerate(trajectories):
+                    trajectory.available_actions.append(list(range(nr_actions[i])))
+                    trajectory.actions.append(int(actions[i]))
+                    trajectory.states.append(int(self._final_states[i] if finished[i] else states[i]))
+            for i in np.flatnonzero(finished):
+                summary = EpisodeSummary(count, int(self._last_steps[i]), bool(terminated[i]), accumulated[i].tolist())
+                if keep_trajectories:
+                    trajectory = trajectories[i]
+                    trajectory.index, trajectory.finished, trajectory.returns = count, summary.finished, summary.returns
+                    trajectory.available_actions.append(list(range(self._nr_actions[trajectory.states[-1]])))
+                    summary.trajectory = trajectory
+                    trajectories[i] = Episode()
+                    trajectories[i].states.append(int(states[i]))
+                accumulated[i] = self._state_rewards[:, states[i]]
+                yield summary
+                count += 1
+                if nr_episodes is not None and count == nr_episodes:
+                    return
+
+    def run(self, nr_steps, policy=None):
+        """
+        Takes the given number of steps in all episodes.
+
+        :param policy: A gridfullsparse.policy.Policy (or anything gridfullsparse.policy.as_policy accepts), by default uniformly random.
+        :return: The accumulated rewards of all episodes that finished, one row per episode.
+        """
+        finished_rewards = []
+        accumulated = np.zeros((self._nr_episodes, len(self._reward_model_names)))
+        policy = as_policy(policy) if policy is not None else None
+        for _ in range(nr_steps):
+            actions = self.select_actions(policy)
+            _, rewards, terminated, truncated = self.step(actions)
+            accumulated += rewards
+            finished = terminated | truncated
+            if np.any(finished):
+                finished_rewards.append(accumulated[finished])
+                accumulated[finished] = 0
+        if finished_rewards:
+            return np.concatenate(finished_rewards)
+        return np.zeros((0, len(self._reward_model_names)))
+
+
+class ArraySimulator:
+    """
+    A single episode of a BatchedSimulator, with the interface of the stormpy sparse simulator.
+
+    Can be passed to gridfullsparse.simulator.SimulationExecutor in place of the stormpy simulator.
+    """
+    def __init__(self, arrays, seed=None, sampler=None):
+        """
+        :param arrays: A gridfullsparse.export.ModelArrays.
+        :param seed: Seed for the random number generator.
+        :param sampler: The successor sampler, e.g. a gridfullsparse.sampling.AliasSampler; by default a CumulativeSampler.
+        """
+        self._batch = BatchedSimulator(arrays, 1, seed=seed, sampler=sampler, autoreset=False)
+        self._done = False
+
+    def seed(self, seed):
+        self._batch.seed(seed)
+
+    def set_state(self, state):
+        """
+        Continues the episode from the given state.
+        """
+        self._batch.set_states(state)
+        self._done = bool(self._batch.terminal[state])
+
+    def snapshot(self, include_rng=True):
+        return self._batch.snapshot(include_rng)
+
+    def restore(self, snapshot):
+        self._batch.restore(snapshot)
+        self._done = bool(self._batch.terminal[self._batch.states[0]])
+
+    def restart(self):
+        states, rewards = self._batch.reset()
+        self._done = bool(self._batch.terminal[states[0]])
+        return int(states[0]), list(rewards[0])
+
+    def available_actions(self):
+        return range(int(self._batch.nr_actions[0]))
+
+    def step(self, action):
+        if self._done:
+            raise RuntimeError("Episode is done; restart the simulator")
+        _, rewards, terminated, _ = self._batch.step([action])
+        self._done = bool(terminated[0])
+        return int(self._batch.states[0]), list(rewards[0])
+
+    def is_done(self):
+        return self._done
+
+
+def _chi_square_p_value(statistic, dof):
+    # Wilson-Hilferty approximation of the upper tail of the chi-square distribution.
+    if dof <= 0:
+        return 1.0
+    z = ((statistic / dof) ** (1 / 3) - (1 - 2 / (9 * dof))) / math.sqrt(2 / (9 * dof))
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def homogeneity_test(first, second, min_expected=5):
+    """
+    Chi-square test whether two samples of state ids stem from the same distribution.
+
+    Categories with small expected counts are pooled.
+
+    :return: The test statistic, the degrees of freedom and the (approximate) p-value.
+    """
+    first, second = np.asarray(first), np.asarray(second)
+    nr_categories = int(max(first.max(), second.max())) + 1
+    counts = np.stack([np.bincount(first, minlength=nr_categories), np.bincount(second, minlength=nr_categories)]).astype(np.float64)
+    totals = counts.sum(axis=0)
+    expected_min = totals * min(len(first), len(second)) / (len(first) + len(second))
+    small = expected_min < min_expected
+    counts = np.concatenate([counts[:, ~small], counts[:, small].sum(axis=1, keepdims=True)], axis=1)
+    counts = counts[:, counts.sum(axis=0) > 0]
+    expected = counts.sum(axis=1, keepdims=True) * counts.sum(axis=0, keepdims=True) / counts.sum()
+    statistic = float(((counts - expected) ** 2 / expected).sum())
+    dof = counts.shape[1] - 1
+    return statistic, dof, _chi_square_p_value(statistic, dof)
+
+
+def validate_against_stormpy(model, program, nr_steps=10, nr_samples=10000, seed=42):
+    """
+    Compares the distribution of the states reached after nr_steps steps (always taking the first action)
+    under the stormpy simulator and under the BatchedSimulator.
+
+    :return: The test statistic, the degrees of freedom and the p-value of the homogeneity test;
+        small p-values indicate that the simulators disagree.
+    """
+    import stormpy as sp
+    import stormpy.simulator
+
+    simulator = sp.simulator.create_simulator(model, seed=seed)
+    simulator.set_full_observability(True)
+    reference = []
+    for _ in range(nr_samples):
+        state, _ = simulator.restart()
+        for _ in range(nr_steps):
+            if simulator.is_done():
+                break
+            state, _ = simulator.step(0)
+        reference.append(state)
+
+    # Sinks are self-loops, so episodes that reached one stay there, as for the stormpy simulator that stops.
+    batch = BatchedSimulator.from_model(model, program, nr_samples, seed=seed + 1, autoreset=False)
+    for _ in range(nr_steps):
+        batch.step(np.zeros(nr_samples, dtype=np.int64))
+    states = batch.states
+    statistic, dof, p_value = homogeneity_test(reference, states)
+    logger.info(f"Chi-square statistic {statistic:.2f} with {dof} degrees of freedom, p-value {p_value:.4f}")
+    return statistic, dof, p_value
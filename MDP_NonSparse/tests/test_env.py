@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from gridfullsparse.env import GridEnv
+
+from synthetic import chain_arrays, grid_arrays
+
+
+def test_steps_collect_gains_minus_costs():
+    env = GridEnv(grid_arrays(), seed=0)
+    env.reset()
+    east = env.tables.action_names.index("east")
+    rewards = []
+    terminated = False
+    while not terminated:
+        _, reward, terminated, _, _ = env.step(east)
+        rewards.append(reward)
+    # Every step costs 1; reaching the goal gains 1. East from 1 may slip into the trap.
+    assert rewards[:-1] == [-1.0] * (len(rewards) - 1)
+    assert rewards[-1] in (0.0, -1.0)
+
+
+def test_missing_default_reward_models_are_an_error():
+    with pytest.raises(RuntimeError, match="has not been exported"):
+        GridEnv(chain_arrays())
+
+
+def test_rewards_can_be_disabled_explicitly():
+    env = GridEnv(chain_arrays(), reward_weights={}, seed=0)
+    env.reset()
+    _, reward, _, _, _ = env.step(0)
+    assert reward == 0.0
+    assert not np.any(env.tables.choice_rewards)
@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from gridfullsparse.policy import CallablePolicy, RandomPolicy, TabularPolicy, action_masks, as_policy
+from gridfullsparse.simulator import run_episode
+from gridfullsparse.vectorized import ArraySimulator, BatchedSimulator
+
+from synthetic import grid_arrays
+
+MASKS = np.array([[True, False, True, False], [False, False, False, True], [True, True, True, True]])
+
+
+def test_action_masks():
+    assert np.array_equal(action_masks([1, 3, 0], 4), [[True, False, False, False], [True, True, True, False], [False] * 4])
+    assert action_masks([2, 1]).shape == (2, 2)
+
+
+def test_random_policy_selects_uniformly_among_allowed_actions():
+    policy = RandomPolicy(0)
+    actions = np.array([policy([0, 1, 2], None, MASKS) for _ in range(3000)])
+    assert MASKS[np.arange(3), actions].all()
+    assert set(actions[:, 0]) == {0, 2} and set(actions[:, 1]) == {3}
+    counts = np.bincount(actions[:, 2], minlength=4)
+    assert counts.min() > 600
+
+
+def test_tabular_distributions_are_restricted_to_the_masks():
+    table = np.array([[0.7, 0.2, 0.1, 0.0]] * 3)
+    policy = TabularPolicy(table, seed=0)
+    masks = np.array([[False, True, True, False]] * 3)
+    actions = np.concatenate([policy([0, 1, 2], None, masks) for _ in range(1000)])
+    assert set(actions) == {1, 2}
+    # The remaining probabilities are renormalized: 2/3 and 1/3.
+    assert abs(np.mean(actions == 1) - 2 / 3) < 0.03
+    with pytest.raises(RuntimeError, match="no probability to the allowed actions in states \\[1\\]"):
+        policy([0, 1], None, [[True, False, False, False], [False, False, False, True]])
+
+
+def test_tabular_actions_must_be_allowed():
+    policy = TabularPolicy(np.array([0, 3, 2]))
+    assert policy([0, 1, 2], None, MASKS).tolist() == [0, 3, 2]
+    with pytest.raises(RuntimeError, match="not allowed in states \\[2\\]"):
+        policy([0, 1, 2], None, [[True, False, False, False], [False, False, False, True], [True, True, False, False]])
+    by_observation = TabularPolicy(np.array([1, 0]), by="observation")
+    assert by_observation([5, 6], np.array([1, 0]), [[True, True]] * 2).tolist() == [0, 1]
+    with pytest.raises(RuntimeError, match="requires observations"):
+        by_observation([5], None, [[True, True]])
+
+
+def test_seeded_policies_repeat_their_choices():
+    table = np.array([[0.5, 0.5]] * 4)
+    first, second = TabularPolicy(table, seed=1), TabularPolicy(table, seed=2)
+    second.seed(1)
+    masks = np.ones((4, 2), dtype=bool)
+    assert all(np.array_equal(first(range(4), None, masks), second(range(4), None, masks)) for _ in range(10))
+
+
+def test_as_policy():
+    assert isinstance(as_policy(None), RandomPolicy)
+    assert isinstance(as_policy(np.zeros(3, dtype=np.int64)), TabularPolicy)
+    assert isinstance(as_policy(lambda states, observations, masks: np.zeros(len(states))), CallablePolicy)
+    with pytest.raises(RuntimeError, match="as a policy"):
+        as_policy("east")
+
+
+def test_simulators_pass_the_masks_to_the_policy():
+    arrays = grid_arrays()
+    received = []
+
+    def west(states, observations, masks):
+        received.append(np.array(masks))
+        return np.ones(len(states), dtype=np.int64)
+
+    simulator = BatchedSimulator(arrays, 3, seed=0)
+    simulator.step(simulator.select_actions(west))
+    assert np.array_equal(received[-1], [[True, True, True]] * 3)
+    # Per state, the policy receives the mask of the allowed actions only.
+    episode = run_episode(ArraySimulator(arrays, seed=0), np.random.default_rng(0), 3, policy=CallablePolicy(west),
+                          shield=_OnlyWestAndEast())
+    assert episode.actions == [1, 1, 1]
+    assert np.array_equal(received[-1], [[True, True, False]])
+
+
+class _OnlyWestAndEast:
+    def masks(self, states):
+        return np.tile([True, True, False], (len(states), 1))
+
+    def restart(self):
+        pass
+
+    def update(self, action, state):
+        pass
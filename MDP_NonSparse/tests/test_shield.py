@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from gridfullsparse.shield import Shield, choice_values, reachability_values
+from gridfullsparse.simulator import run_episode
+from gridfullsparse.vectorized import ArraySimulator
+
+from synthetic import grid_arrays, guess_arrays, model_arrays
+
+
+def test_reachability_values():
+    # Going east from 1 slips into the trap with probability 0.1, and 1 cannot be avoided from 0.
+    assert np.allclose(reachability_values(grid_arrays()), [0.9, 0.9, 1.0, 1.0, 0.0])
+
+
+def test_shield_allows_the_optimal_actions():
+    arrays = grid_arrays()
+    shield = Shield.compute(arrays)
+    assert [shield.allowed_actions(state) for state in range(arrays.nr_states)] == [[0, 1], [0, 1], [0], [0], [0]]
+
+
+def test_allowed_actions_reach_the_threshold():
+    arrays = grid_arrays()
+    values = reachability_values(arrays)
+    choices = choice_values(arrays, values)
+    row_groups = np.asarray(arrays.row_groups)
+    for threshold in [0.5, 0.9, 1.0]:
+        shield = Shield.compute(arrays, threshold)
+        for state in range(arrays.nr_states):
+            for action in range(row_groups[state + 1] - row_groups[state]):
+                sufficient = choices[row_groups[state] + action] >= threshold * values[state] - 1e-6
+                assert shield.is_allowed(state, action) == sufficient
+
+
+def test_shielded_episodes_reach_the_goal_almost_surely():
+    # In the fully observable model every state can reach the goal almost surely, but not with every action.
+    arrays = guess_arrays()
+    shield = Shield.compute(arrays)
+    rng = np.random.default_rng(0)
+    simulator = ArraySimulator(arrays, seed=1)
+    for index in range(200):
+        episode = run_episode(simulator, rng, 10, index, shield=shield)
+        assert episode.finished and episode.states[-1] == 3
+
+
+def wide_arrays():
+    """
+    In state 0, action i reaches the goal 1 with probability i / 10 and the trap 2 otherwise, for i = 0, ..., 10.
+    """
+    actions = [([1, 2], [i / 10, 1 - i / 10]) for i in range(11)]
+    return model_arrays([actions, [([1], [1.0])], [([2], [1.0])]], labels={"goal": [1], "notbad": [0, 1]})
+
+
+def test_bits_pack_the_allowed_actions():
+    shield = Shield.compute(wide_arrays(), 0.45)
+    # Eleven actions take two bytes per state.
+    assert shield.width == 11 and shield.bits.shape == (3, 2)
+    assert shield.allowed_actions(0) == [5, 6, 7, 8, 9, 10]
+    masks = shield.masks([0, 1, 2])
+    assert np.array_equal(masks, shield.masks([0, 1, 2], threshold=0.45))
+    assert all(shield.is_allowed(0, action) == masks[0, action] for action in range(11))
+
+
+def test_thresholds_are_applied_at_lookup():
+    shield = Shield.compute(wide_arrays())
+    assert shield.allowed_actions(0) == [10]
+    assert np.flatnonzero(shield.masks([0], threshold=0.7)[0]).tolist() == [7, 8, 9, 10]
+    # Absolute thresholds compare the probabilities themselves; the optimum of state 0 is 1 anyway.
+    assert np.array_equal(shield.masks([0], threshold=0.7, relative=False), shield.masks([0], threshold=0.7))
+    derived = shield.with_threshold(0.25)
+    assert derived.allowed_actions(0) == [3, 4, 5, 6, 7, 8, 9, 10]
+    assert np.array_equal(derived.bits, Shield.compute(wide_arrays(), 0.25).bits)
+    assert shield.sweep([0.0, 0.25, 0.5, 1.0]).tolist() == [13, 10, 8, 3]
+
+
+def test_relative_thresholds_must_be_fractions():
+    shield = Shield.compute(wide_arrays())
+    with pytest.raises(RuntimeError, match=r"\[0, 1\]"):
+        shield.with_threshold(1.5)
+    with pytest.raises(RuntimeError, match=r"\[0, 1\]"):
+        shield.masks([0], threshold=-0.1)
+    assert shield.with_threshold(1.5, relative=False).allowed_actions(0) == []
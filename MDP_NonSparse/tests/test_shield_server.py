@@ -0,0 +1,79 @@
+import threading
+
+import numpy as np
+import pytest
+
+from gridfullsparse.shield import BeliefSupportShield, Shield
+from gridfullsparse.shield_server import ShieldClient, ShieldServer
+
+from synthetic import grid_arrays, guess_arrays
+
+
+@pytest.fixture
+def shields():
+    return {"grid": Shield.compute(grid_arrays()), "guess": BeliefSupportShield(guess_arrays())}
+
+
+def test_client_masks_match_the_shields(tmp_path, shields):
+    address = str(tmp_path / "socket")
+    with ShieldServer(shields).start(address):
+        with ShieldClient(address, "grid") as client:
+            states = np.array([0, 1, 2, 3, 4, 2])
+            assert np.array_equal(client.masks(states), shields["grid"].masks(states))
+        with ShieldClient(address, "guess") as client:
+            supports = [[0], [1, 2], [1], [3]]
+            expected = [shields["guess"].masks(support) for support in supports]
+            assert np.array_equal(client.support_masks(supports), expected)
+
+
+def test_invalid_states_are_rejected(tmp_path, shields):
+    address = str(tmp_path / "socket")
+    with ShieldServer(shields).start(address):
+        with ShieldClient(address, "grid") as client:
+            with pytest.raises(RuntimeError, match="not in 0..4"):
+                client.masks([0, -1])
+            with pytest.raises(RuntimeError, match="not in 0..4"):
+                client.masks([5])
+            # The connection is still usable.
+            assert np.array_equal(client.masks([1]), shields["grid"].masks([1]))
+        with ShieldClient(address, "guess") as client:
+            with pytest.raises(RuntimeError, match="not in 0..4"):
+                client.support_masks([[1, -2]])
+
+
+def test_concurrent_requests_are_coalesced(tmp_path, shields):
+    address = str(tmp_path / "socket")
+    server = ShieldServer(shields, max_delay=0.2)
+    barrier = threading.Barrier(6)
+    results = {}
+
+    def query(index):
+        with ShieldClient(address, "grid") as client:
+            barrier.wait()
+            try:
+                results[index] = client.masks([index % 5, 4 - index % 5])
+            except RuntimeError as e:
+                results[index] = e
+
+    with server.start(address):
+        threads = [threading.Thread(target=query, args=(i,)) for i in range(5)]
+        # One client sends an invalid request, which must not fail the others in its batch.
+        threads.append(threading.Thread(target=lambda: results.update(bad=_invalid_query(address, barrier))))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    for index in range(5):
+        assert np.array_equal(results[index], shields["grid"].masks([index % 5, 4 - index % 5]))
+    assert isinstance(results["bad"], RuntimeError)
+    assert server.statistics.requests == 6
+    assert server.statistics.batches < 6
+
+
+def _invalid_query(address, barrier):
+    with ShieldClient(address, "grid") as client:
+        barrier.wait()
+        try:
+            client.masks([7])
+        except RuntimeError as e:
+            return e
@@ -0,0 +1,97 @@
+import os
+import types
+
+import numpy as np
+import pytest
+
+from gridfullsparse.shield import Shield, ShieldStore
+
+from synthetic import grid_arrays
+
+
+def _input(tmp_path, constants=None):
+    path = tmp_path / "grid.prism"
+    if not path.exists():
+        path.write_text("pomdp\n")
+    return types.SimpleNamespace(path=str(path), constants=constants or {"N": 4}, properties=['Pmax=? [ "notbad" U "goal" ]'])
+
+
+def _rewrite(path, change):
+    """
+    Changes the contents of an array file, keeping its size and modification time.
+    """
+    stat = os.stat(path)
+    array = np.load(path)
+    np.save(path, change(array))
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+
+def test_saved_shields_load_memory_mapped(tmp_path):
+    shield = Shield.compute(grid_arrays(), 0.95)
+    shield.save(str(tmp_path / "shield"), {"model_hash": "abc"})
+    loaded = Shield.load(str(tmp_path / "shield"), expected={"model_hash": "abc"})
+    assert isinstance(loaded.bits, np.memmap)
+    assert loaded.threshold == 0.95 and loaded.relative
+    assert np.array_equal(loaded.masks(range(5)), shield.masks(range(5)))
+    assert np.array_equal(loaded.masks(range(5), threshold=0.5), shield.masks(range(5), threshold=0.5))
+
+
+def test_modified_arrays_are_rejected(tmp_path):
+    directory = str(tmp_path / "shield")
+    Shield.compute(grid_arrays()).save(directory)
+    with open(os.path.join(directory, "bits.npy"), "ab") as f:
+        f.write(b"\0")
+    with pytest.raises(RuntimeError, match="bits was modified after saving"):
+        Shield.load(directory)
+
+
+def test_checksums_are_verified_on_request(tmp_path):
+    directory = str(tmp_path / "shield")
+    Shield.compute(grid_arrays()).save(directory)
+    _rewrite(os.path.join(directory, "bits.npy"), np.invert)
+    # The stamps still match, so only verification notices.
+    Shield.load(directory)
+    with pytest.raises(RuntimeError, match="checksum of bits does not match"):
+        Shield.load(directory, verify=True)
+
+
+def test_stale_shields_are_rejected(tmp_path):
+    directory = str(tmp_path / "shield")
+    Shield.compute(grid_arrays()).save(directory, {"model_hash": "abc"})
+    with pytest.raises(RuntimeError, match="stale"):
+        Shield.load(directory, expected={"model_hash": "def"})
+
+
+def test_store_drops_outdated_and_corrupt_shields(tmp_path):
+    store = ShieldStore(str(tmp_path / "store"))
+    input = _input(tmp_path)
+    assert store.load(input) is None
+    path = store.store(input, Shield.compute(grid_arrays()))
+    assert np.array_equal(store.load(input).masks(range(5)), Shield.compute(grid_arrays()).masks(range(5)))
+    # Another threshold is another entry.
+    assert store.load(input, threshold=0.5) is None
+
+    _rewrite(os.path.join(path, "state_values.npy"), lambda values: values / 2)
+    assert store.load(input) is not None
+    assert store.load(input, verify=True) is None
+    assert not os.path.exists(path)
+
+    store.store(input, Shield.compute(grid_arrays()))
+    with open(input.path, "a") as f:
+        f.write("// changed\n")
+    # The key includes the hash of the prism file; the outdated entry is left to eviction.
+    assert store.load(input) is None
+
+
+def test_store_evicts_least_recently_used_shields(tmp_path):
+    store = ShieldStore(str(tmp_path / "store"))
+    inputs = [_input(tmp_path, {"N": n}) for n in range(3)]
+    paths = [store.store(input, Shield.compute(grid_arrays())) for input in inputs]
+    entry_size = store.size() // 3
+    for age, path in enumerate(reversed(paths)):
+        os.utime(path, (1000 - age, 1000 - age))
+    # Loading marks the oldest entry as used.
+    assert store.load(inputs[0]) is not None
+    store = ShieldStore(store.directory, max_size=2 * entry_size)
+    store.evict()
+    assert os.path.exists(paths[0]) and not os.path.exists(paths[1]) and os.path.exists(paths[2])
@@ -0,0 +1,61 @@
+import numpy as np
+
+from gridfullsparse.export import load_model_arrays
+from gridfullsparse.vectorized import BatchedSimulator, homogeneity_test
+
+from synthetic import chain_arrays
+
+SEED = 42
+# The tests are deterministic (fixed seeds); the threshold only documents how far from significance they are.
+THRESHOLD = 0.01
+
+
+def first_action_distribution(arrays, nr_steps):
+    """
+    The exact distribution of the state after nr_steps steps that always take the first action.
+    """
+    row_groups = np.asarray(arrays.row_groups)
+    row_starts = np.asarray(arrays.row_starts)
+    distribution = np.zeros(arrays.nr_states)
+    distribution[np.asarray(arrays.initial_states)] = 1.0 / len(arrays.initial_states)
+    for _ in range(nr_steps):
+        successor = np.zeros(arrays.nr_states)
+        for state in np.flatnonzero(distribution):
+            row = row_groups[state]
+            targets = slice(row_starts[row], row_starts[row + 1])
+            np.add.at(successor, np.asarray(arrays.columns)[targets], distribution[state] * np.asarray(arrays.probabilities)[targets])
+        distribution = successor
+    return distribution
+
+
+def test_homogeneity_test_accepts_samples_of_one_distribution():
+    rng = np.random.default_rng(SEED)
+    p = [0.1, 0.2, 0.3, 0.15, 0.15, 0.05, 0.03, 0.02]
+    _, _, p_value = homogeneity_test(rng.choice(len(p), size=20000, p=p), rng.choice(len(p), size=10000, p=p))
+    assert p_value > THRESHOLD
+
+
+def test_homogeneity_test_rejects_samples_of_different_distributions():
+    rng = np.random.default_rng(SEED)
+    _, _, p_value = homogeneity_test(rng.choice(4, size=10000, p=[0.25, 0.25, 0.25, 0.25]),
+                                     rng.choice(4, size=10000, p=[0.3, 0.2, 0.25, 0.25]))
+    assert p_value < THRESHOLD
+
+
+def _check_simulator(arrays, nr_steps=6, nr_samples=20000):
+    reference = np.random.default_rng(SEED).choice(arrays.nr_states, size=nr_samples,
+                                                   p=first_action_distribution(arrays, nr_steps))
+    simulator = BatchedSimulator(arrays, nr_samples, seed=SEED + 1, autoreset=False)
+    for _ in range(nr_steps):
+        simulator.step(np.zeros(nr_samples, dtype=np.int64))
+    _, _, p_value = homogeneity_test(reference, simulator.states)
+    assert p_value > THRESHOLD
+
+
+def test_batched_simulator_matches_exact_distribution():
+    _check_simulator(chain_arrays())
+
+
+def test_batched_simulator_matches_exact_distribution_on_exported_arrays(tmp_path):
+    chain_arrays().save(str(tmp_path / "synthetic"))
+    _check_simulator(load_model_arrays(str(tmp_path / "synthetic")))
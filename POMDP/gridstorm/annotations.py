@@ -183,6 +183,14 @@ class ProgramAnnotation:
             return self._constants['adv-goals-label']
         return None
 
+    @property
+    def labels(self):
+        """
+        The state labels that the annotation refers to.
+        """
+        return [self._constants[entry] for entry in ['target-label', 'traps-label', 'landmarks', 'adv-goals-label']
+                if self._constants.get(entry)]
+
     @property
     def has_resources(self):
         return "resource-name" in self._constants
@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; memory is then not reported.
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def peak_rss():
+    """
+    Peak resident set size of the current process in bytes, or None if unknown.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class BuildInstrumentation:
+    """
+    Records wall time, peak memory and model sizes for every stage of the model construction.
+
+    Use one instance per model/constants combination and pass it to gridstorm.builder.build_model.
+    """
+    def __init__(self, model_name=None, constants=None, **info):
+        self._record = {
+            "model": model_name,
+            "constants": constants,
+            "host": platform.node(),
+            "timestamp": time.time(),
+            **info,
+            "stages": []
+        }
+
+    @contextmanager
+    def stage(self, name):
+        rss_before = peak_rss()
+        start = time.perf_counter()
+        entry = {"stage": name}
+        try:
+            yield entry
+        finally:
+            entry["wall_time"] = time.perf_counter() - start
+            entry["peak_rss"] = peak_rss()
+            if rss_before is not None:
+                entry["peak_rss_increase"] = entry["peak_rss"] - rss_before
+            self._record["stages"].append(entry)
+            logger.debug(f"Stage {name} took {entry['wall_time']:.3f}s")
+
+    def record_model(self, model):
+        """
+        Attaches the size of the model to the most recent stage.
+        """
+        entry = self._record["stages"][-1]
+        entry["nr_states"] = model.nr_states
+        entry["nr_choices"] = model.nr_choices
+        entry["nr_transitions"] = model.nr_transitions
+        if hasattr(model, "nr_observations"):
+            entry["nr_observations"] = model.nr_observations
+
+    def set(self, key, value):
+        self._record[key] = value
+
+    @property
+    def stages(self):
+        return self._record["stages"]
+
+    @property
+    def total_time(self):
+        return sum(entry["wall_time"] for entry in self._record["stages"])
+
+    def as_dict(self):
+        return dict(self._record, total_time=self.total_time)
+
+    def write(self, path):
+        """
+        Appends the record as a single line to a JSON lines file.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a") as f:
+            f.write(json.dumps(self.as_dict()) + "\n")
+
+
+def read_records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
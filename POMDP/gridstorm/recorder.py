@@ -7,11 +7,25 @@ logger = logging.getLogger(__name__)
 
 
 class VideoRecorder:
-    def __init__(self, renderer, only_keep_finishers):
+    def __init__(self, renderer, only_keep_finishers, state_map=None, directory=None, prefix="episode", gif=False):
+        """
+        :param renderer: The plotter used to render the traces.
+        :param only_keep_finishers: Whether to drop paths that did not finish.
+        :param state_map: Optionally maps simulated states to states of the rendered model, e.g. Quotient.lift_state.
+        :param directory: If given, every path is rendered into this directory as soon as it ends, and then dropped,
+                          rather than kept until save.
+        :param prefix: The file name prefix for paths rendered as they end.
+        :param gif: Whether paths rendered as they end are stored as gif rather than mp4.
+        """
         self._only_keep_finishers = only_keep_finishers
+        self._state_map = state_map
         self._paths = []
         self._path = None
         self._renderer = renderer
+        self._directory = directory
+        self._prefix = prefix
+        self._gif = gif
+        self._nr_rendered = 0
 
     def start_path(self):
         assert self._path is None
@@ -20,10 +34,16 @@ class VideoRecorder:
     def end_path(self, finished):
         self._path.append_action(None)
         if not self._only_keep_finishers or finished:
-            self._paths.append(self._path)
+            if self._directory is not None:
+                self._render(self._directory, f"{self._prefix}-{self._nr_rendered}", self._gif, self._path)
+                self._nr_rendered += 1
+            else:
+                self._paths.append(self._path)
         self._path = None
 
     def record_state(self, state):
+        if self._state_map is not None:
+            state = self._state_map(state)
         self._path.append_state(state)
 
     def record_selected_action(self, action):
@@ -39,9 +59,12 @@ class VideoRecorder:
         for path in self._paths:
             path.trim_from_end(length)
 
+    def _render(self, path, name, gif, trace):
+        suffix = "gif" if gif else "mp4"
+        mp4file = os.path.join(path,f"{name}.{suffix}")
+        logger.info(f"Rendering {mp4file}")
+        self._renderer.record(mp4file, trace)
+
     def save(self, path, prefix, gif=False):
         for i, trace in enumerate(self._paths):
-            suffix = "gif" if gif else "mp4"
-            mp4file = os.path.join(path,f"{prefix}-{i}.{suffix}")
-            logger.info(f"Rendering {mp4file}")
-            self._renderer.record(mp4file, trace)
\ No newline at end of file
+            self._render(path, f"{prefix}-{i}", gif, trace)
\ No newline at end of file
@@ -0,0 +1,188 @@
+import logging
+
+import numpy as np
+import stormpy as sp
+import stormpy.simulator
+
+from gridstorm.episodes import Episode
+from gridstorm.policy import action_masks, as_policy
+
+logger = logging.getLogger(__name__)
+
+
+def _shielded_actions(shield, state, actions):
+    """
+    The actions the shield allows among the available ones; all of them if there is no shield.
+    """
+    if shield is None:
+        return actions
+    mask = shield.masks([state])[0]
+    return [action for action in actions if action < len(mask) and mask[action]]
+
+
+def _allowed_actions(shield, state, actions, fallback=False):
+    """
+    The actions the shield allows among the available ones, of which one is selected next.
+
+    :param fallback: Whether all available actions are allowed if the shield allows none; otherwise that raises.
+    """
+    allowed = _shielded_actions(shield, state, actions)
+    if not allowed:
+        if not fallback:
+            raise RuntimeError(f"Shield allows no action in state {state}; the episode left the winning region")
+        logger.warning(f"Shield allows no action in state {state}, falling back to all available actions")
+        return actions
+    return allowed
+
+
+def run_episode(simulator, rng, maxsteps, index=0, policy=None, observations=None, shield=None, shield_fallback=False):
+    """
+    Simulates a single episode.
+
+    :param simulator: A simulator with the interface of the stormpy sparse simulator.
+    :param rng: A numpy Generator used for selecting actions if no policy is given.
+    :param maxsteps: Maximal number of steps.
+    :param index: The index of the episode, stored in the result.
+    :param policy: A gridstorm.policy.Policy; actions are selected uniformly at random if None.
+        It receives the mask of the allowed actions and must select one of them.
+    :param observations: For every state its observation, passed to the policy.
+    :param shield: A gridstorm.shield.Shield (or SupportMonitor) for the simulated model; actions are then only selected
+        among the allowed ones.
+    :param shield_fallback: Whether all available actions are allowed where the shield allows none.
+        By default, this raises a RuntimeError: it means the shield is unsound for the simulated model.
+    :return: The Episode.
+    """
+    episode = Episode(index)
+    state, rewards = simulator.restart()
+    if shield is not None:
+        shield.restart()
+    episode.states.append(state)
+    episode.returns = [float(r) for r in rewards]
+    for n in range(maxsteps):
+        actions = list(simulator.available_actions())
+        allowed = _allowed_actions(shield, state, actions, shield_fallback)
+        if policy is None:
+            action = allowed[int(rng.integers(len(allowed)))]
+        else:
+            states = np.array([state])
+            masks = action_masks([len(actions)])
+            if shield is not None:
+                masks[0] = np.isin(np.arange(len(actions)), allowed)
+            action = int(policy(states, None if observations is None else observations[states], masks)[0])
+            if action not in allowed:
+                raise RuntimeError(f"The policy selected action {action} in state {state}, but only {allowed} are allowed")
+        logger.debug(f"Select action: {action}")
+        state, rewards = simulator.step(action)
+        if shield is not None:
+            shield.update(action, state)
+        episode.returns = [total + float(r) for total, r in zip(episode.returns, rewards)]
+        episode.available_actions.append(actions)
+        if shield is not None:
+            episode.allowed_actions.append(allowed)
+        episode.actions.append(action)
+        episode.states.append(state)
+        if simulator.is_done():
+            logger.info(f"Done after {n} steps!")
+            episode.finished = True
+            break
+    actions = list(simulator.available_actions())
+    episode.available_actions.append(actions)
+    if shield is not None:
+        # No action is selected anymore, so the last state may as well be one without allowed actions.
+        episode.allowed_actions.append(_shielded_actions(shield, state, actions))
+    return episode
+
+
+def first_good_runs(episodes, nr_good_runs):
+    """
+    The prefix of the episodes up to (and including) the nr_good_runs-th finished one.
+    """
+    good_runs = 0
+    for i, episode in enumerate(episodes):
+        good_runs += episode.finished
+        if good_runs == nr_good_runs:
+            return episodes[:i + 1]
+    return episodes
+
+
+class SimulationExecutor:
+    """
+    Base class that wraps the stormpy simulator
+    """
+    def __init__(self, model, seed, simulator=None, policy=None, shield=None, shield_fallback=False):
+        """
+        :param model: The (canonic) model to simulate.
+        :param seed: Seed for the simulator and the action selection.
+        :param simulator: A simulator to use instead of the stormpy simulator for the model, e.g. a gridstorm.lazy.LazySimulator.
+        :param policy: A gridstorm.policy.Policy (or anything gridstorm.policy.as_policy accepts); uniformly random if None.
+        :param shield: A gridstorm.shield.Shield computed for the model; actions are then restricted to the allowed ones,
+            and these are recorded as the allowed actions.
+        :param shield_fallback: Whether all available actions are allowed where the shield allows none, instead of raising.
+        """
+        self._model = model
+        if simulator is None:
+            simulator = sp.simulator.create_simulator(model, seed=seed)
+            simulator.set_full_observability(True) # We want to access the full state space for visualisations.
+        self._simulator = simulator
+        # Actions are drawn from a stream of our own, such that runs do not depend on the global random state.
+        self._rng = np.random.default_rng(seed)
+        self._policy = as_policy(policy) if policy is not None else None
+        self._observations = np.asarray(model.observations) if hasattr(model, "observations") else None
+        self._shield = shield
+        self._shield_fallback = shield_fallback
+
+    @property
+    def simulator(self):
+        return self._simulator
+
+    def _require_snapshots(self):
+        if not hasattr(self._simulator, "snapshot"):
+            raise RuntimeError("The simulator cannot be set to a state; use a gridstorm.vectorized.ArraySimulator")
+
+    def set_state(self, state):
+        """
+        Continues the current episode from the given state, e.g. to branch rollouts.
+        """
+        self._require_snapshots()
+        self._simulator.set_state(state)
+
+    def snapshot(self):
+        """
+        Saves the simulator state, including the random streams of the simulator and of the action selection.
+        """
+        self._require_snapshots()
+        return self._simulator.snapshot(), self._rng.bit_generator.state
+
+    def restore(self, snapshot):
+        self._require_snapshots()
+        simulator_snapshot, rng_state = snapshot
+        self._simulator.restore(simulator_snapshot)
+        self._rng.bit_generator.state = rng_state
+
+    def episodes(self, nr_episodes=None, maxsteps=200, keep_trajectories=False):
+        """
+        Simulates episodes one at a time and yields an EpisodeSummary for each, as soon as it is finished.
+
+        Nothing is accumulated: the next episode is only simulated once the consumer asks for it.
+
+        :param nr_episodes: Number of episodes, or None for an endless stream.
+        :param keep_trajectories: Whether the summaries carry the trajectories.
+        """
+        index = 0
+        while nr_episodes is None or index < nr_episodes:
+            logger.info("Start new episode.")
+            episode = run_episode(self._simulator, self._rng, maxsteps, index, self._policy, self._observations, self._shield,
+                                  self._shield_fallback)
+            yield episode.summary(keep_trajectories)
+            index += 1
+
+    def simulate(self, recorder, nr_good_runs = 1, total_nr_runs = 5, maxsteps=200):
+        result = []
+        good_runs = 0
+        for summary in self.episodes(total_nr_runs, maxsteps, keep_trajectories=True):
+            summary.trajectory.replay(recorder)
+            result.append(summary.finished)
+            good_runs += summary.finished
+            if good_runs == nr_good_runs:
+                break
+        return result
@@ -16,6 +16,6 @@ setup(
     description="This is a benchmark set visualiser for simulating grid worlds with storm.",
     keywords="gridworld storm model-checking",
     install_requires=[
-        "stormpy>=1.6.0", "matplotlib", "tqdm"
+        "stormpy>=1.6.0", "matplotlib", "numpy", "tqdm"
     ],
 )
\ No newline at end of file
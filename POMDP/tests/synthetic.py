@@ -0,0 +1,96 @@
+"""
+Small synthetic models as gridstorm.export.ModelArrays, such that the array-based code can be tested without stormpy.
+"""
+import numpy as np
+
+from gridstorm.export import EXPORT_FORMAT_VERSION, ModelArrays
+
+
+def model_arrays(rows, initial_states=(0,), observations=None, labels=None, choice_labels=None, rewards=None):
+    """
+    :param rows: For every state the list of its choices, each a pair of successor states and probabilities.
+    :param initial_states: The initial states.
+    :param observations: For every state its observation, by default the state itself.
+    :param labels: Maps label names to the states with the label.
+    :param choice_labels: Maps choice label names to the (global) choices with the label.
+    :param rewards: Maps reward model names to a dict with "state" and/or "state_action" reward vectors.
+    """
+    row_groups, row_starts, columns, probabilities = [0], [0], [], []
+    for choices in rows:
+        for targets, values in choices:
+            columns.extend(targets)
+            probabilities.extend(values)
+            row_starts.append(len(columns))
+        row_groups.append(len(row_starts) - 1)
+    nr_states, nr_choices = len(rows), len(row_starts) - 1
+    observations = np.arange(nr_states) if observations is None else np.asarray(observations)
+    arrays = {
+        "row_groups": np.array(row_groups, dtype=np.int64),
+        "row_starts": np.array(row_starts, dtype=np.int64),
+        "columns": np.array(columns, dtype=np.int64),
+        "probabilities": np.array(probabilities, dtype=np.float64),
+        "initial_states": np.array(initial_states, dtype=np.int64),
+        "observations": observations.astype(np.int32),
+    }
+    metadata = {"version": EXPORT_FORMAT_VERSION, "nr_states": nr_states, "nr_choices": nr_choices,
+                "nr_observations": int(observations.max()) + 1, "labels": sorted(labels or {}), "choice_labels": [],
+                "reward_models": {}, "nr_adversaries": 0, "has_coordinates": False}
+    for i, name in enumerate(metadata["labels"]):
+        bits = np.zeros(nr_states, dtype=bool)
+        bits[list(labels[name])] = True
+        arrays[f"label_{i}"] = np.packbits(bits)
+    if choice_labels:
+        metadata["choice_labels"] = sorted(choice_labels)
+        indices = np.full(nr_choices, -1, dtype=np.int32)
+        for i, name in enumerate(metadata["choice_labels"]):
+            indices[list(choice_labels[name])] = i
+        arrays["choice_labels"] = indices
+    for i, (name, vectors) in enumerate((rewards or {}).items()):
+        for kind, values in vectors.items():
+            arrays[f"reward_{i}_{kind}"] = np.asarray(values, dtype=np.float64)
+        metadata["reward_models"][name] = {"index": i, "kinds": sorted(vectors)}
+    return ModelArrays(arrays, metadata)
+
+
+def chain_arrays():
+    """
+    A chain 0 -> 1 -> 2 -> 3 in which every step may also stay or fall back to 0, with an absorbing state 4.
+    Every state but 4 has a second action that leads to 4.
+    """
+    successors = [([0, 1], [0.3, 0.7]), ([0, 1, 2], [0.2, 0.3, 0.5]), ([1, 2, 3], [0.1, 0.4, 0.5]), ([0, 3, 4], [0.25, 0.5, 0.25])]
+    rows = [[row, ([4], [1.0])] for row in successors] + [[([4], [1.0])]]
+    return model_arrays(rows, labels={"traps": [4]})
+
+
+def grid_arrays():
+    """
+    A corridor 0 - 1 - 2 - 3 with the goal at 3 and a trap 4 below 1 and 2, with actions east, west and down.
+    Going east from 1 slips into the trap with probability 0.1; going down always falls into the trap.
+    Goal and trap are absorbing. States 1 and 2 share an observation.
+    """
+    rows = [
+        [([1], [1.0]), ([0], [1.0]), ([4], [1.0])],
+        [([2, 4], [0.9, 0.1]), ([0], [1.0]), ([4], [1.0])],
+        [([3], [1.0]), ([1], [1.0]), ([4], [1.0])],
+        [([3], [1.0])],
+        [([4], [1.0])],
+    ]
+    return model_arrays(rows, observations=[0, 1, 1, 2, 3], labels={"goal": [3], "notbad": [0, 1, 2, 3], "traps": [4]},
+                        choice_labels={"east": [0, 3, 6], "west": [1, 4, 7], "down": [2, 5, 8], "loop": [9, 10]},
+                        rewards={"costs": {"state_action": np.ones(11)}, "gains": {"state": [0, 0, 0, 1, 0]}})
+
+
+def guess_arrays():
+    """
+    From 0, action 0 leads to 1 or 2 (which share an observation) and action 1 leads to the goal 3.
+    In 1 only action 0 and in 2 only action 1 reaches the goal, the other action reaches the trap 4.
+    Every state is almost-surely winning in the underlying MDP, but the support {1, 2} is losing.
+    """
+    rows = [
+        [([1, 2], [0.5, 0.5]), ([3], [1.0])],
+        [([3], [1.0]), ([4], [1.0])],
+        [([4], [1.0]), ([3], [1.0])],
+        [([3], [1.0])],
+        [([4], [1.0])],
+    ]
+    return model_arrays(rows, observations=[0, 1, 1, 2, 3], labels={"goal": [3], "notbad": [0, 1, 2, 3]})
@@ -0,0 +1,29 @@
+import numpy as np
+
+from gridstorm.parallel import ParallelEpisodeRunner
+from gridstorm.policy import TabularPolicy
+
+from synthetic import grid_arrays
+
+
+def _episodes(bundle, processes, policy=None, chunk_size=3):
+    # With a bundle the workers simulate on the arrays; the model name is only validated.
+    runner = ParallelEpisodeRunner("refuel", {}, processes=processes, bundle=bundle, chunk_size=chunk_size, policy=policy)
+    return [(e.index, e.states, e.actions, e.finished) for e in runner.run(20, seed=7, maxsteps=30)]
+
+
+def test_episodes_do_not_depend_on_the_number_of_workers(tmp_path):
+    bundle = str(tmp_path / "grid")
+    grid_arrays().save(bundle)
+    single = _episodes(bundle, 1, chunk_size=20)
+    assert single == _episodes(bundle, 3)
+    assert len({tuple(states) for _, states, _, _ in single}) > 1
+
+
+def test_stochastic_policies_do_not_depend_on_the_number_of_workers(tmp_path):
+    bundle = str(tmp_path / "grid")
+    grid_arrays().save(bundle)
+    policy = TabularPolicy(np.array([[0.5, 0.4, 0.1]] * 5), seed=1)
+    single = _episodes(bundle, 1, policy, chunk_size=20)
+    assert single == _episodes(bundle, 3, policy)
+    assert single == _episodes(bundle, 4, policy, chunk_size=1)
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from gridstorm.vector_env import SharedMemoryVectorEnv
+
+from synthetic import chain_arrays, grid_arrays
+
+
+@pytest.mark.parametrize("processes", [0, 2])
+def test_vector_env_returns_rewards(tmp_path, processes):
+    bundle = str(tmp_path / "grid")
+    grid_arrays().save(bundle)
+    with SharedMemoryVectorEnv(bundle, 4, processes=processes, seed=3) as env:
+        env.reset()
+        east = env.action_names.index("east")
+        _, rewards, _, _, _ = env.step(np.full(4, east))
+        # Every step costs 1.
+        assert np.all(rewards == -1.0)
+
+
+def test_vector_env_requires_the_reward_models(tmp_path):
+    bundle = str(tmp_path / "chain")
+    chain_arrays().save(bundle)
+    with pytest.raises(RuntimeError, match="has not been exported"):
+        SharedMemoryVectorEnv(bundle, 2)
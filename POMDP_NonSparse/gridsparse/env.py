@@ -0,0 +1,246 @@
+import logging
+
+import numpy as np
+
+try:
+    import gymnasium
+except ImportError:
+    # Spaces are then not available; the environment itself works without gymnasium.
+    gymnasium = None
+
+from gridsparse.builder import REWARD_PROFILE, build_model
+from gridsparse.export import ModelArrays
+from gridsparse.models import experiment_to_grid_model_names
+from gridsparse.vectorized import CumulativeSampler, sink_states
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REWARD_WEIGHTS = {"gains": 1.0, "costs": -1.0}
+
+
+def property_terminals(arrays, goal="goal", safe="notbad"):
+    """
+    The states in which an episode ends: sinks, goal states and states that are not safe.
+    Labels that have not been exported are ignored.
+    """
+    terminal = sink_states(arrays)
+    if arrays.has_label(goal):
+        terminal = terminal | arrays.label(goal)
+    if arrays.has_label(safe):
+        terminal = terminal | ~arrays.label(safe)
+    return terminal
+
+
+def require_reward_models(arrays, reward_weights):
+    """
+    Raises if one of the weighted reward models has not been exported; otherwise its rewards would silently be zero.
+    Pass reward_weights={} to run without rewards.
+    """
+    for name in reward_weights:
+        if name not in arrays.reward_model_names:
+            raise RuntimeError(f"Reward model {name} has not been exported (exported: {arrays.reward_model_names}); "
+                               f"build the model with reward models, e.g. with gridsparse.builder.REWARD_PROFILE")
+
+
+def observation_table(arrays, observation="observation"):
+    """
+    For every state its observation vector.
+
+    :param observation: "observation" for the observation id, or "coordinates" for the ego and adversary coordinates
+        (which reveals hidden information for the partially observable models).
+    """
+    if observation == "observation":
+        return np.asarray(arrays.observations, dtype=np.int32).reshape(-1, 1)
+    if observation == "coordinates":
+        columns = list(arrays.ego_coordinates)
+        for i in range(arrays.nr_adversaries):
+            columns.extend(arrays.adv_coordinates(i))
+        return np.stack([np.asarray(c, dtype=np.int32) for c in columns], axis=1)
+    raise RuntimeError(f"Unknown observation type {observation}")
+
+
+def choice_table(arrays):
+    """
+    For every state and action the choice (row) of the model, or -1 if the action is not available.
+
+    Actions are the choice labels of the model if it has them, and otherwise the indices of the choices of a state.
+    :return: The table and the names of the actions.
+    """
+    row_groups = np.asarray(arrays.row_groups)
+    nr_actions = np.diff(row_groups)
+    row_states = np.repeat(np.arange(arrays.nr_states, dtype=np.int64), nr_actions)
+    rows = np.arange(arrays.nr_choices, dtype=np.int64)
+    if arrays.has_choice_labels and np.all(np.asarray(arrays.choice_labels) >= 0):
+        names = list(arrays.choice_label_names)
+        actions = np.asarray(arrays.choice_labels, dtype=np.int64)
+    else:
+        names = [str(i) for i in range(int(nr_actions.max()))]
+        actions = rows - np.repeat(row_groups[:-1], nr_actions)
+    dtype = np.int32 if arrays.nr_choices < 2 ** 31 else np.int64
+    table = np.full((arrays.nr_states, len(names)), -1, dtype=dtype)
+    table[row_states, actions] = rows
+    return table, names
+
+
+class EnvTables:
+    """
+    The per-state and per-choice lookup tables of an environment; they can be shared by many environments.
+
+    Attributes: observations (per state), choices (state x action, see choice_table), masks (state x action),
+    terminal (per state), state_rewards, choice_rewards, columns, initial_states, action_names and sampler.
+    """
+    def __init__(self, arrays, observation="observation", reward_weights=None, terminal=None, sampler=None):
+        """
+        :param arrays: A gridsparse.export.ModelArrays.
+        :param observation: The observation type, see observation_table.
+        :param reward_weights: Maps reward model names to weights, by default DEFAULT_REWARD_WEIGHTS.
+            All of them must have been exported.
+        :param terminal: Boolean vector of the states that end an episode, by default property_terminals.
+        :param sampler: The successor sampler, by default a CumulativeSampler; see also gridsparse.sampling.AliasSampler.
+        """
+        self.arrays = arrays
+        self.sampler = sampler if sampler is not None else CumulativeSampler(arrays)
+        self.columns = np.asarray(arrays.columns)
+        self.initial_states = np.asarray(arrays.initial_states)
+        self.observations = observation_table(arrays, observation)
+        self.choices, self.action_names = choice_table(arrays)
+        self.masks = self.choices >= 0
+        self.terminal = property_terminals(arrays) if terminal is None else np.asarray(terminal, dtype=bool)
+
+        weights = DEFAULT_REWARD_WEIGHTS if reward_weights is None else reward_weights
+        require_reward_models(arrays, weights)
+        self.state_rewards = np.zeros(arrays.nr_states)
+        self.choice_rewards = np.zeros(arrays.nr_choices)
+        for name, weight in weights.items():
+            if arrays.state_rewards(name) is not None:
+                self.state_rewards += weight * np.asarray(arrays.state_rewards(name))
+            if arrays.state_action_rewards(name) is not None:
+                self.choice_rewards += weight * np.asarray(arrays.state_action_rewards(name))
+
+    def initial(self, rng):
+        if len(self.initial_states) == 1:
+            return int(self.initial_states[0])
+        return int(rng.choice(self.initial_states))
+
+    def step(self, states, actions, uniforms):
+        """
+        Takes one step from each of the given states.
+
+        :return: The successor states, the rewards and the terminated mask.
+        """
+        rows = self.choices[states, actions]
+        if np.any(rows < 0):
+            raise RuntimeError("Selected action is not available")
+        successors = self.columns[self.sampler.sample(rows, uniforms)]
+        rewards = self.choice_rewards[rows] + self.state_rewards[successors]
+        return successors, rewards, self.terminal[successors]
+
+
+class GridEnv:
+    """
+    A reset()/step() environment with the gymnasium interface, simulating a model on its exported arrays.
+
+    Observations, action masks, rewards and terminal states are precomputed per state or choice (see EnvTables),
+    such that a step consists of a few array lookups and one successor sample.
+    Rewards are weighted sums of the model's reward structures (by default gains minus costs),
+    counting the state-action reward of the chosen action and the state reward of the successor.
+    """
+    def __init__(self, arrays, observation="observation", reward_weights=None, terminal=None, maxsteps=200, seed=None,
+                 tables=None):
+        """
+        :param arrays: A gridsparse.export.ModelArrays.
+        :param observation: The observation type, see observation_table.
+        :param reward_weights: Maps reward model names to weights, by default DEFAULT_REWARD_WEIGHTS.
+        :param terminal: Boolean vector of the states that end an episode, by default property_terminals.
+        :param maxsteps: Number of steps after which an episode is truncated, or None.
+        :param seed: Seed for the random number generator.
+        :param tables: EnvTables to share with other environments; the previous arguments are then ignored.
+        """
+        self._tables = tables if tables is not None else EnvTables(arrays, observation, reward_weights, terminal)
+        self._rng = np.random.default_rng(seed)
+        self._observations = self._tables.observations
+        self._masks = self._tables.masks
+        self._action_names = self._tables.action_names
+        self._maxsteps = maxsteps
+        self._state = None
+        self._steps = 0
+
+    @classmethod
+    def from_model(cls, model, program, annotations=None, **kwargs):
+        """
+        Creates the environment for a canonic model, as returned by gridsparse.builder.build_model.
+        Coordinates are only available if annotations are given.
+        """
+        return cls(ModelArrays.from_model(model, program, annotations), **kwargs)
+
+    @property
+    def arrays(self):
+        return self._tables.arrays
+
+    @property
+    def tables(self):
+        return self._tables
+
+    @property
+    def action_names(self):
+        return self._action_names
+
+    @property
+    def nr_actions(self):
+        return len(self._action_names)
+
+    @property
+    def observation_shape(self):
+        return self._observations.shape[1:]
+
+    @property
+    def observation_space(self):
+        if gymnasium is None:
+            raise RuntimeError("Spaces require gymnasium")
+        return gymnasium.spaces.Box(low=int(self._observations.min()), high=int(self._observations.max()),
+                                    shape=self.observation_shape, dtype=np.int32)
+
+    @property
+    def action_space(self):
+        if gymnasium is None:
+            raise RuntimeError("Spaces require gymnasium")
+        return gymnasium.spaces.Discrete(self.nr_actions)
+
+    @property
+    def state(self):
+        return self._state
+
+    def action_mask(self):
+        return self._masks[self._state]
+
+    def _info(self):
+        return {"state": self._state, "action_mask": self._masks[self._state]}
+
+    def reset(self, seed=None, options=None):
+        if seed is not None:
+            self._rng = np.random.default_rng(seed)
+        self._state = self._tables.initial(self._rng)
+        self._steps = 0
+        return self._observations[self._state], self._info()
+
+    def step(self, action):
+        if not self._masks[self._state, action]:
+            raise RuntimeError(f"Action {self._action_names[action]} is not available in state {self._state}")
+        successors, rewards, terminated = self._tables.step(np.array([self._state]), np.array([action]), self._rng.random(1))
+        self._state = int(successors[0])
+        self._steps += 1
+        reward = float(rewards[0])
+        terminated = bool(terminated[0])
+        truncated = not terminated and self._maxsteps is not None and self._steps >= self._maxsteps
+        return self._observations[self._state], reward, terminated, truncated, self._info()
+
+
+def make_env(model_name, constants, cache=None, observation="observation", **kwargs):
+    """
+    Builds (or loads from the cache) a grid model of experiment_to_grid_model_names, with its reward models,
+    and wraps it into a GridEnv.
+    """
+    input = experiment_to_grid_model_names[model_name](**constants)
+    prism_program, model = build_model(input, cache=cache, profile=REWARD_PROFILE)
+    annotations = input.annotations if observation == "coordinates" else None
+    return GridEnv.from_model(model, prism_program, annotations, observation=observation, **kwargs)
@@ -0,0 +1,217 @@
+from collections import OrderedDict
+import json
+import logging
+
+import stormpy as sp
+import stormpy.simulator
+
+from gridsparse.storage import program_variables
+
+logger = logging.getLogger(__name__)
+
+
+class _ExploredState:
+    def __init__(self, id, valuation, labels, actions):
+        self.id = id
+        self.valuation = valuation
+        self.labels = labels
+        self.actions = actions
+
+
+class ExplorationStatistics:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def lookups(self):
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.lookups if self.lookups > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.lookups} lookups, hit rate {self.hit_rate:.3f}, {self.misses} states materialised, {self.evictions} evicted"
+
+
+class LazyStateSpace:
+    """
+    Explores the state space of a prism program on the fly, rather than building the model.
+
+    Only states that are visited are materialised (valuation, labels and available actions).
+    They are kept in an LRU cache of bounded capacity; states get consecutive ids, and a state
+    that is revisited after it has been evicted gets a fresh id.
+    """
+    def __init__(self, program, capacity=1000000):
+        self._program = program
+        self._capacity = capacity
+        self._states = OrderedDict()
+        self._by_id = {}
+        self._next_id = 0
+        self._statistics = ExplorationStatistics()
+        self._manager = program.expression_manager
+        boolean_variables, integer_variables = program_variables(program)
+        self._boolean_variables = [v.expression_variable for v in boolean_variables]
+        self._integer_variables = [v.expression_variable for v in integer_variables]
+        self._labels = [(label.name, label.expression) for label in program.labels]
+        self._action_names = sorted(set(command.action_name for module in program.modules
+                                        for command in module.commands if command.is_labeled))
+        self._model = LazyModel(self)
+
+    @property
+    def program(self):
+        return self._program
+
+    @property
+    def model(self):
+        """
+        A view on the explored states that can be used in place of a sparse model by the Plotter.
+        """
+        return self._model
+
+    @property
+    def statistics(self):
+        return self._statistics
+
+    @property
+    def action_names(self):
+        return self._action_names
+
+    def __len__(self):
+        return len(self._states)
+
+    def _evaluate_labels(self, valuation):
+        substitution = {}
+        for v in self._boolean_variables:
+            substitution[v] = self._manager.create_boolean(valuation[v.name])
+        for v in self._integer_variables:
+            substitution[v] = self._manager.create_integer(valuation[v.name])
+        return frozenset(name for name, expression in self._labels if expression.substitute(substitution).evaluate_as_bool())
+
+    def lookup(self, valuation, actions):
+        """
+        Returns the id of the state with the given valuation, materialising the state on a miss.
+
+        :param valuation: The state valuation as reported by the program simulator.
+        :param actions: The names of the actions available in the state.
+        """
+        key = str(valuation)
+        state = self._states.get(key)
+        if state is not None:
+            self._statistics.hits += 1
+            self._states.move_to_end(key)
+            return state.id
+        self._statistics.misses += 1
+        values = json.loads(str(valuation.to_json()))
+        state = _ExploredState(self._next_id, values, self._evaluate_labels(values), list(actions))
+        self._next_id += 1
+        self._states[key] = state
+        self._by_id[state.id] = state
+        if len(self._states) > self._capacity:
+            _, evicted = self._states.popitem(last=False)
+            del self._by_id[evicted.id]
+            self._statistics.evictions += 1
+        return state.id
+
+    def state(self, id):
+        if id not in self._by_id:
+            raise RuntimeError(f"State {id} is not (or no longer) materialised; consider a larger capacity.")
+        return self._by_id[id]
+
+    def states(self):
+        return self._by_id.values()
+
+    def simulator(self, seed):
+        return LazySimulator(self, seed)
+
+
+class LazySimulator:
+    """
+    Simulates a prism program without building it, reporting the ids of a LazyStateSpace as states.
+
+    Offers the interface of the stormpy sparse simulator as used by SimulationExecutor.
+    """
+    def __init__(self, state_space, seed):
+        self._state_space = state_space
+        self._simulator = sp.simulator.create_simulator(state_space.program, seed=seed)
+        self._simulator.set_full_observability(True)
+        self._simulator.set_action_mode(sp.simulator.SimulatorActionMode.GLOBAL_NAMES)
+        self._simulator.set_observation_mode(sp.simulator.SimulatorObservationMode.PROGRAM_LEVEL)
+        self._state = None
+
+    def _report(self, valuation, reward):
+        self._state = self._state_space.lookup(valuation, self._simulator.available_actions())
+        return self._state, reward
+
+    def restart(self):
+        valuation, reward = self._simulator.restart()
+        return self._report(valuation, reward)
+
+    def available_actions(self):
+        return range(len(self._state_space.state(self._state).actions))
+
+    def step(self, action):
+        valuation, reward = self._simulator.step(self._state_space.state(self._state).actions[action])
+        return self._report(valuation, reward)
+
+    def is_done(self):
+        return self._simulator.is_done()
+
+
+class _LazyStateValuations:
+    def __init__(self, state_space):
+        self._state_space = state_space
+
+    def get_integer_value(self, state, variable):
+        return self._state_space.state(state).valuation[variable.name]
+
+    def get_boolean_value(self, state, variable):
+        return self._state_space.state(state).valuation[variable.name]
+
+
+class _LazyLabeling:
+    def __init__(self, state_space):
+        self._state_space = state_space
+
+    def get_labels(self):
+        return set(label.name for label in self._state_space.program.labels)
+
+    def get_states(self, label):
+        return [state.id for state in self._state_space.states() if label in state.labels]
+
+    def get_labels_of_state(self, state):
+        return set(self._state_space.state(state).labels)
+
+
+class _LazyChoiceLabeling:
+    def __init__(self, state_space):
+        self._state_space = state_space
+
+    def get_labels(self):
+        return set(self._state_space.action_names)
+
+    def get_labels_of_choice(self, choice):
+        state, action = choice
+        return {self._state_space.state(state).actions[action]}
+
+
+class LazyModel:
+    """
+    Offers the parts of the sparse model interface that the Plotter uses, restricted to the explored states.
+
+    In particular, static targets and traps only show up once a state with that label has been explored.
+    """
+    def __init__(self, state_space):
+        self._state_space = state_space
+        self.state_valuations = _LazyStateValuations(state_space)
+        self.labeling = _LazyLabeling(state_space)
+        self.choice_labeling = _LazyChoiceLabeling(state_space)
+
+    @property
+    def nr_states(self):
+        return len(self._state_space)
+
+    def get_choice_index(self, state, action):
+        return state, action
@@ -0,0 +1,260 @@
+import logging
+
+import numpy as np
+
+from gridsparse.export import EXPORT_FORMAT_VERSION, ModelArrays
+import gridsparse.storage as storage
+
+logger = logging.getLogger(__name__)
+
+# Probabilities are compared after rounding to this many binary digits, to be robust against summation order.
+_PROBABILITY_BITS = 40
+_SEEDS = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xD1B54A32D192ED03))
+
+
+def _mix(x):
+    # splitmix64 finalizer; uint64 arithmetic wraps around.
+    with np.errstate(over='ignore'):
+        x = x ^ (x >> np.uint64(30))
+        x = x * np.uint64(0xBF58476D1CE4E5B9)
+        x = x ^ (x >> np.uint64(27))
+        x = x * np.uint64(0x94D049BB133111EB)
+        return x ^ (x >> np.uint64(31))
+
+
+def _as_key(values):
+    return np.round(np.asarray(values, dtype=np.float64) * (1 << _PROBABILITY_BITS)).astype(np.int64).astype(np.uint64)
+
+
+def _group_sum(values, starts):
+    # Wrapping sum of consecutive segments; every segment is non-empty.
+    with np.errstate(over='ignore'):
+        return np.add.reduceat(values, starts)
+
+
+def _renumber(*columns):
+    _, blocks = np.unique(np.stack(columns, axis=1), axis=0, return_inverse=True)
+    return blocks.reshape(-1).astype(np.int64)
+
+
+def _aggregate(arrays, rows, blocks):
+    """
+    For the given rows, sums up the probabilities of successors in the same block.
+
+    :return: row index (into rows), block and probability of every aggregated entry, sorted by row and block.
+    """
+    counts = arrays.row_starts[rows + 1] - arrays.row_starts[rows]
+    entry_rows = np.repeat(np.arange(len(rows), dtype=np.int64), counts)
+    offsets = np.arange(len(entry_rows), dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    entries = np.repeat(arrays.row_starts[rows], counts) + offsets
+    nr_blocks = int(blocks.max()) + 1
+    keys = entry_rows * nr_blocks + blocks[arrays.columns[entries]]
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    probabilities = np.bincount(inverse.reshape(-1), weights=arrays.probabilities[entries])
+    return unique_keys // nr_blocks, unique_keys % nr_blocks, probabilities
+
+
+def _initial_signature(arrays, respect_observations):
+    labels = np.zeros(arrays.nr_states, dtype=np.uint64)
+    for i, name in enumerate(arrays.label_names):
+        labels ^= _mix(np.uint64(i + 1) * arrays.label(name).astype(np.uint64))
+    columns = [labels]
+    if respect_observations:
+        columns.append(np.asarray(arrays.observations, dtype=np.int64))
+    for name in arrays.reward_model_names:
+        if arrays.state_rewards(name) is not None:
+            columns.append(_as_key(arrays.state_rewards(name)))
+    return _renumber(*[np.asarray(c).astype(np.uint64) for c in columns])
+
+
+def _row_signature(arrays, respect_observations):
+    signature = np.zeros(arrays.nr_choices, dtype=np.uint64)
+    if arrays.has_choice_labels:
+        signature ^= _mix(np.asarray(arrays.choice_labels, dtype=np.int64).astype(np.uint64) + np.uint64(1))
+    if respect_observations or not arrays.has_choice_labels:
+        # Actions are identified by their local index (the agent picks the index, for POMDPs per observation),
+        # so rows must not be matched across indices, e.g. states whose action targets are swapped.
+        row_groups = np.asarray(arrays.row_groups)
+        local = np.arange(arrays.nr_choices, dtype=np.int64) - np.repeat(row_groups[:-1], np.diff(row_groups))
+        signature ^= _mix(_mix(local.astype(np.uint64) + np.uint64(0x5851F42D4C957F2D)))
+    for i, name in enumerate(arrays.reward_model_names):
+        if arrays.state_action_rewards(name) is not None:
+            signature ^= _mix(_as_key(arrays.state_action_rewards(name)) + np.uint64(i))
+    return signature
+
+
+def bisimulation_partition(arrays, respect_observations=True):
+    """
+    Computes the coarsest probabilistic bisimulation by signature-based partition refinement.
+
+    Two states are equivalent if they agree on labels, (optionally) observations and rewards, and for every
+    choice label they have a choice with the same reward and the same distribution over equivalence classes.
+    If observations are respected or the model has no choice labels, choices are also matched by their local index,
+    as that is how actions are selected.
+    Signatures are compared via 128-bit hashes.
+
+    :param arrays: A gridsparse.export.ModelArrays of a canonic model.
+    :param respect_observations: Whether states with different observations must stay apart, as is required for POMDPs.
+    :return: For every state, the index of its block.
+    """
+    blocks = _initial_signature(arrays, respect_observations)
+    all_rows = np.arange(arrays.nr_choices, dtype=np.int64)
+    row_signature = _row_signature(arrays, respect_observations)
+    group_starts = np.asarray(arrays.row_groups[:-1])
+    iteration = 0
+    while True:
+        iteration += 1
+        nr_blocks = int(blocks.max()) + 1
+        entry_rows, entry_blocks, probabilities = _aggregate(arrays, all_rows, blocks)
+        row_starts = np.searchsorted(entry_rows, all_rows)
+        state_hashes = []
+        for seed in _SEEDS:
+            with np.errstate(over='ignore'):
+                entry_hash = _mix(_mix(entry_blocks.astype(np.uint64) + seed) ^ _as_key(probabilities))
+                row_hash = _mix(_group_sum(entry_hash, row_starts) ^ _mix(row_signature + seed))
+            state_hashes.append(_group_sum(row_hash, group_starts))
+        new_blocks = _renumber(blocks.astype(np.uint64), *state_hashes)
+        new_nr_blocks = int(new_blocks.max()) + 1
+        logger.debug(f"Bisimulation iteration {iteration}: {new_nr_blocks} blocks")
+        blocks = new_blocks
+        if new_nr_blocks == nr_blocks:
+            return blocks
+
+
+class Quotient:
+    """
+    The bisimulation quotient of a model, together with the mapping between original and quotient states.
+    """
+    def __init__(self, model, arrays, block_of, representatives, original_nr_states):
+        self._model = model
+        self._arrays = arrays
+        self._block_of = block_of
+        self._representatives = representatives
+        self._original_nr_states = original_nr_states
+
+    @property
+    def model(self):
+        """
+        The quotient as a stormpy model (without state valuations; render via lift_state and the original model).
+        """
+        return self._model
+
+    @property
+    def arrays(self):
+        return self._arrays
+
+    @property
+    def block_of(self):
+        """
+        For every original state the quotient state it belongs to.
+        """
+        return self._block_of
+
+    @property
+    def representatives(self):
+        """
+        For every quotient state an original state in its block.
+        """
+        return self._representatives
+
+    @property
+    def reduction_factor(self):
+        return self._original_nr_states / len(self._representatives)
+
+    def lift_state(self, state):
+        return int(self._representatives[state])
+
+    def project_state(self, state):
+        return int(self._block_of[state])
+
+
+def _quotient_arrays(arrays, blocks, respect_observations):
+    nr_blocks = int(blocks.max()) + 1
+    representatives = np.full(nr_blocks, arrays.nr_states, dtype=np.int64)
+    np.minimum.at(representatives, blocks, np.arange(arrays.nr_states, dtype=np.int64))
+
+    counts = np.asarray(arrays.nr_actions)[representatives]
+    row_groups = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    offsets = np.arange(row_groups[-1], dtype=np.int64) - np.repeat(row_groups[:-1], counts)
+    rows = np.repeat(np.asarray(arrays.row_groups)[representatives], counts) + offsets
+
+    entry_rows, entry_blocks, probabilities = _aggregate(arrays, rows, blocks)
+    row_starts = np.concatenate([np.searchsorted(entry_rows, np.arange(len(rows))), [len(entry_rows)]]).astype(np.int64)
+
+    quotient = {
+        "row_groups": row_groups,
+        "row_starts": row_starts,
+        "columns": entry_blocks.astype(np.int64),
+        "probabilities": probabilities,
+        "initial_states": np.unique(blocks[np.asarray(arrays.initial_states)]),
+        # Without observation-respecting refinement, the quotient is fully observable.
+        "observations": np.asarray(arrays.observations)[representatives] if respect_observations else np.arange(nr_blocks, dtype=np.int32)
+    }
+    metadata = {"version": EXPORT_FORMAT_VERSION, "nr_states": nr_blocks, "nr_choices": len(rows),
+                "nr_observations": arrays.nr_observations if respect_observations else nr_blocks, "labels": list(arrays.label_names),
+                "choice_labels": list(arrays.choice_label_names), "reward_models": {},
+                "nr_adversaries": arrays.nr_adversaries, "has_coordinates": arrays.has_coordinates}
+    for i, name in enumerate(arrays.label_names):
+        quotient[f"label_{i}"] = np.packbits(arrays.label(name)[representatives])
+    if arrays.has_choice_labels:
+        quotient["choice_labels"] = np.asarray(arrays.choice_labels)[rows]
+    for i, name in enumerate(arrays.reward_model_names):
+        kinds = []
+        if arrays.state_rewards(name) is not None:
+            quotient[f"reward_{i}_state"] = np.asarray(arrays.state_rewards(name))[representatives]
+            kinds.append("state")
+        if arrays.state_action_rewards(name) is not None:
+            quotient[f"reward_{i}_state_action"] = np.asarray(arrays.state_action_rewards(name))[rows]
+            kinds.append("state_action")
+        metadata["reward_models"][name] = {"index": i, "kinds": kinds}
+    if arrays.has_coordinates:
+        quotient["ego_x"], quotient["ego_y"] = [np.asarray(c)[representatives] for c in arrays.ego_coordinates]
+        for i in range(arrays.nr_adversaries):
+            quotient[f"adv_x_{i}"], quotient[f"adv_y_{i}"] = [np.asarray(c)[representatives] for c in arrays.adv_coordinates(i)]
+    return ModelArrays(quotient, metadata), representatives
+
+
+def _components(arrays):
+    # The layout expected by gridsparse.storage.restore_model.
+    components = {
+        "nr_states": arrays.nr_states,
+        "nr_choices": arrays.nr_choices,
+        "row_groups": arrays.row_groups.tolist(),
+        "row_starts": arrays.row_starts.tolist(),
+        "columns": arrays.columns.tolist(),
+        "values": arrays.probabilities.tolist(),
+        "labels": {name: np.flatnonzero(arrays.label(name)).tolist() for name in arrays.label_names},
+        "choice_labels": None,
+        "observations": arrays.observations.tolist(),
+        "reward_models": {},
+        "valuations": None
+    }
+    if arrays.has_choice_labels:
+        components["choice_labels"] = {name: np.flatnonzero(arrays.choice_labels == i).tolist()
+                                       for i, name in enumerate(arrays.choice_label_names)}
+    for name in arrays.reward_model_names:
+        state, state_action = arrays.state_rewards(name), arrays.state_action_rewards(name)
+        components["reward_models"][name] = {"state": state.tolist() if state is not None else None,
+                                             "state_action": state_action.tolist() if state_action is not None else None}
+    return components
+
+
+def minimize(model, program, annotations=None, respect_observations=True, arrays=None):
+    """
+    Computes the bisimulation quotient of a canonic model.
+
+    :param model: The canonic model.
+    :param program: The prism program the model was built from.
+    :param annotations: If given, coordinates are carried over to the quotient arrays.
+    :param respect_observations: Only merge states with the same observation (required for POMDP semantics).
+    :param arrays: The ModelArrays of the model, if they have been extracted already.
+    :return: A Quotient
+    """
+    if arrays is None:
+        arrays = ModelArrays.from_model(model, program, annotations)
+    blocks = bisimulation_partition(arrays, respect_observations)
+    quotient_arrays, representatives = _quotient_arrays(arrays, blocks, respect_observations)
+    quotient_model = storage.restore_model(_components(quotient_arrays), program)
+    quotient = Quotient(quotient_model, quotient_arrays, blocks, representatives, arrays.nr_states)
+    logger.info(f"Bisimulation quotient has {quotient_arrays.nr_states} of {arrays.nr_states} states (reduction factor {quotient.reduction_factor:.2f})")
+    return quotient
@@ -162,3 +162,13 @@ def rocks(N, K=2):
         return Model(_example_path("rocks2.nm"), ProgramAnnotation(_grid_rocks), ["Pmax=? [\"notbad\" U \"goal\"]"], constants=f"N={N}")
     else:
         raise RuntimeError("Rocks is only available with 2 or 3 rocks")
+
+
+experiment_to_grid_model_names = {
+    "avoid": surveillance,
+    "refuel": refuel,
+    'obstacle': obstacle,
+    "intercept": intercept,
+    'evade': evade,
+    'rocks': rocks
+}
@@ -0,0 +1,365 @@
+import logging
+import math
+import time
+
+import numpy as np
+
+from gridsparse.builder import REWARD_PROFILE, build_model
+from gridsparse.env import DEFAULT_REWARD_WEIGHTS, property_terminals, require_reward_models
+from gridsparse.episodes import Episode
+from gridsparse.export import ModelArrays
+from gridsparse.models import experiment_to_grid_model_names
+from gridsparse.policy import RandomPolicy, action_masks
+from gridsparse.shield import SupportMonitor
+from gridsparse.vectorized import ArraySimulator, BatchedSimulator, CumulativeSampler
+
+logger = logging.getLogger(__name__)
+
+
+class PlannerStatistics:
+    def __init__(self):
+        self.decisions = 0
+        self.simulations = 0
+        self.planning_time = 0.0
+
+    @property
+    def decisions_per_second(self):
+        return self.decisions / self.planning_time if self.planning_time > 0 else 0.0
+
+    @property
+    def simulations_per_second(self):
+        return self.simulations / self.planning_time if self.planning_time > 0 else 0.0
+
+    def __str__(self):
+        return f"{self.decisions} decisions ({self.decisions_per_second:.1f}/s), {self.simulations_per_second:.0f} simulations/s"
+
+
+class _Node:
+    __slots__ = ("visits", "counts", "values", "children", "particles", "support")
+
+    def __init__(self, nr_actions, support=None):
+        self.visits = 0
+        self.counts = np.zeros(nr_actions, dtype=np.int64)
+        self.values = np.zeros(nr_actions)
+        # Maps (action, observation) to the successor node.
+        self.children = {}
+        self.particles = []
+        # The belief support of the history, if a shield is used.
+        self.support = support
+
+
+class MCTSPlanner:
+    """
+    Online Monte-Carlo tree search on the exported arrays of a model.
+
+    The search tree is indexed by histories of actions and observations, with a particle belief per node (POMCP).
+    For fully observable models the observation is the state, which makes the search plain UCT.
+    Leaves are evaluated by a batch of random rollouts. The value of a path is the discounted sum of the weighted
+    rewards (by default gains minus costs) plus goal_reward for reaching the goal; episodes end in the states of
+    gridsparse.env.property_terminals.
+
+    Successors are sampled by gridsparse.vectorized.BatchedSimulators that are set to the states of the search.
+    With a BeliefSupportShield, every node of the search tree tracks the belief support of its history, and only the
+    actions that the shield allows for this support are searched and taken. Rollouts are not shielded: they only
+    estimate the values of the leaves.
+    """
+    def __init__(self, arrays, budget=1000, time_budget=None, depth=50, exploration=5.0, discount=0.95, goal_reward=10.0,
+                 reward_weights=None, rollouts_per_leaf=8, allowed=None, fully_observable=None, max_particles=1000,
+                 seed=None, sampler=None, shield=None):
+        """
+        :param arrays: A gridsparse.export.ModelArrays.
+        :param budget: Number of simulations per decision.
+        :param time_budget: If given, the time per decision in seconds, replacing the simulation budget.
+        :param depth: The search (and rollout) horizon.
+        :param exploration: The UCB exploration constant.
+        :param discount: The discount factor.
+        :param goal_reward: Reward for reaching a state labelled goal.
+        :param reward_weights: Maps reward model names to weights, by default gridsparse.env.DEFAULT_REWARD_WEIGHTS.
+            All of them must have been exported.
+        :param rollouts_per_leaf: Number of rollouts that are averaged to evaluate a new node.
+        :param allowed: Optionally restricts the actions, e.g. to those a state-based gridsparse.shield.Shield allows:
+            a function from an array of states to the boolean masks of their allowed actions. Only for fully observable
+            planning; for beliefs, the allowed actions depend on the support, see shield.
+        :param fully_observable: Whether to plan on states (UCT) rather than beliefs (POMCP); by default if every state
+            has its own observation.
+        :param max_particles: Maximal number of particles per belief node.
+        :param seed: Seed for the random number generator.
+        :param sampler: The successor sampler, by default a CumulativeSampler.
+        :param shield: A gridsparse.shield.BeliefSupportShield (or SupportMonitor) for the model, restricting the actions
+            to those it allows for the belief support of the history.
+        """
+        self._arrays = arrays
+        self._budget = budget
+        self._time_budget = time_budget
+        self._depth = depth
+        self._exploration = exploration
+        self._discount = discount
+        self._rollouts_per_leaf = rollouts_per_leaf
+        self._allowed = allowed
+        self._shield = shield.shield if isinstance(shield, SupportMonitor) else shield
+        self._max_particles = max_particles
+        self._rng = np.random.default_rng(seed)
+        self._rollout_policy = RandomPolicy(self._rng)
+        self._nr_actions = np.diff(np.asarray(arrays.row_groups))
+        self._width = int(self._nr_actions.max())
+        self._terminal = property_terminals(arrays)
+        if fully_observable is None:
+            fully_observable = arrays.nr_observations >= arrays.nr_states
+        if allowed is not None and not fully_observable:
+            # Intersecting the masks of the particles does not make an action safe for the belief.
+            raise RuntimeError("A state-based restriction of the actions is only sound for fully observable planning; "
+                               "pass a gridsparse.shield.BeliefSupportShield as shield")
+        self._observations = np.arange(arrays.nr_states) if fully_observable else np.asarray(arrays.observations)
+        self._fully_observable = fully_observable
+
+        weights = DEFAULT_REWARD_WEIGHTS if reward_weights is None else reward_weights
+        require_reward_models(arrays, weights)
+        self._weights = np.array(list(weights.values()), dtype=np.float64)
+        self._goal_rewards = goal_reward * arrays.label("goal") if arrays.has_label("goal") else np.zeros(arrays.nr_states)
+        sampler = sampler if sampler is not None else CumulativeSampler(arrays)
+        # The simulators share the sampler and draw from the random number generator of the planner.
+        self._simulator = BatchedSimulator(arrays, 1, seed=self._rng, reward_models=list(weights), sampler=sampler,
+                                           autoreset=False, terminal=self._terminal)
+        self._rollouts = BatchedSimulator(arrays, rollouts_per_leaf, seed=self._rng, reward_models=list(weights),
+                                          sampler=sampler, autoreset=False, terminal=self._terminal)
+        self._particle_simulator = BatchedSimulator(arrays, max_particles, seed=self._rng, reward_models=[], sampler=sampler,
+                                                    autoreset=False, terminal=self._terminal)
+
+        self._statistics = PlannerStatistics()
+        self._root = None
+        self.reset()
+
+    @property
+    def statistics(self):
+        return self._statistics
+
+    @property
+    def arrays(self):
+        return self._arrays
+
+    @property
+    def fully_observable(self):
+        return self._fully_observable
+
+    @property
+    def terminal(self):
+        """
+        For every state whether the episode ends in it.
+        """
+        return self._terminal
+
+    def observe(self, state):
+        """
+        The observation that the planner receives in the given state: the state itself if planning is fully observable.
+        """
+        return int(self._observations[state])
+
+    @property
+    def belief(self):
+        """
+        The particles of the current belief.
+        """
+        return self._root.particles
+
+    def reset(self, state=None):
+        """
+        Starts a new episode, in the given state or in the initial states of the model.
+        The state is only used when planning is fully observable; otherwise the belief starts in the initial states.
+        """
+        if state is not None and self._fully_observable:
+            particles = [int(state)]
+        else:
+            particles = [int(s) for s in self._arrays.initial_states]
+        support = self._shield.initial_support() if self._shield is not None else None
+        self._root = _Node(int(self._nr_actions[particles[0]]), support)
+        self._root.particles = particles
+
+    @property
+    def support(self):
+        """
+        The belief support of the current history, if a shield is used.
+        """
+        return self._root.support
+
+    def _successor_support(self, support, action, observation):
+        if self._shield is None:
+            return None
+        # For fully observable planning, the observation of the planner is the state.
+        if self._fully_observable:
+            observation = self._shield.observations[observation]
+        successor = self._shield.successor_support(support, action, observation)
+        if len(successor) == 0:
+            logger.warning(f"Observation {observation} is inconsistent with the support, continuing with all states that have it")
+            successor = np.flatnonzero(self._shield.observations == observation)
+        return successor
+
+    def _masks(self, states):
+        masks = action_masks(self._nr_actions[states], self._width)
+        if self._allowed is not None:
+            allowed = masks & np.asarray(self._allowed(states), dtype=bool)[:, :self._width]
+            # States in which nothing is allowed keep all their actions.
+            masks = np.where(allowed.any(axis=1)[:, np.newaxis], allowed, masks)
+        return masks
+
+    def _node_mask(self, state, node):
+        mask = self._masks(np.array([state]))[0]
+        if self._shield is not None:
+            allowed = mask & self._shield.masks(node.support)[:self._width]
+            # The search may enter losing supports, in which every action is as bad as any other.
+            if allowed.any():
+                mask = allowed
+        return mask
+
+    def _rewards(self, rewards, successors):
+        return rewards @ self._weights + self._goal_rewards[successors]
+
+    def _rollout(self, state, depth):
+        self._rollouts.set_states(state)
+        states = self._rollouts.states
+        values = np.zeros(self._rollouts_per_leaf)
+        active = ~self._terminal[states]
+        factor = 1.0
+        for _ in range(depth):
+            if not active.any():
+                break
+            actions = self._rollout_policy(states, None, self._masks(states))
+            states, rewards, terminated, _ = self._rollouts.step(actions)
+            values[active] += factor * self._rewards(rewards, states)[active]
+            active &= ~terminated
+            factor *= self._discount
+        return values.mean()
+
+    def _select(self, node, mask):
+        candidates = np.flatnonzero(mask[:len(node.counts)])
+        untried = candidates[node.counts[candidates] == 0]
+        if len(untried) > 0:
+            return int(self._rng.choice(untried))
+        counts = node.counts[candidates]
+        scores = node.values[candidates] + self._exploration * np.sqrt(math.log(node.visits) / counts)
+        return int(candidates[np.argmax(scores)])
+
+    def _simulate(self, state, node, depth):
+        if depth == 0 or self._terminal[state]:
+            return 0.0
+        action = self._select(node, self._node_mask(state, node))
+        self._simulator.set_states(state)
+        successors, rewards, _, _ = self._simulator.step([action])
+        successor = int(successors[0])
+        reward = self._rewards(rewards, successors)[0]
+        key = (action, int(self._observations[successor]))
+        child = node.children.get(key)
+        if child is None:
+            child = _Node(int(self._nr_actions[successor]), self._successor_support(node.support, action, key[1]))
+            node.children[key] = child
+            child.particles.append(successor)
+            value = reward + self._discount * (0.0 if self._terminal[successor] else self._rollout(successor, depth - 1))
+        else:
+            if len(child.particles) < self._max_particles:
+                child.particles.append(successor)
+            value = reward + self._discount * self._simulate(successor, child, depth - 1)
+        node.visits += 1
+        node.counts[action] += 1
+        node.values[action] += (value - node.values[action]) / node.counts[action]
+        return value
+
+    def plan(self):
+        """
+        Runs the search from the current belief and returns the (local) index of the best action.
+        """
+        start = time.perf_counter()
+        particles = np.array(self._root.particles, dtype=np.int64)
+        simulations = 0
+        while True:
+            if self._time_budget is not None:
+                if time.perf_counter() - start >= self._time_budget:
+                    break
+            elif simulations >= self._budget:
+                break
+            self._simulate(int(particles[self._rng.integers(len(particles))]), self._root, self._depth)
+            simulations += 1
+        # Without a shield, the particles are a single state unless an episode starts in several initial states.
+        mask = self._masks(particles).all(axis=0)[:len(self._root.counts)]
+        if self._shield is not None:
+            mask &= self._shield.masks(self._root.support)[:len(mask)]
+        if not mask.any():
+            raise RuntimeError(f"The shield allows no action in the current belief (particles {sorted(set(particles.tolist()))[:10]})")
+        values = np.where(mask & (self._root.counts > 0), self._root.values, -np.inf)
+        action = int(np.argmax(values)) if np.isfinite(values).any() else int(np.flatnonzero(mask)[0])
+        self._statistics.decisions += 1
+        self._statistics.simulations += simulations
+        self._statistics.planning_time += time.perf_counter() - start
+        return action
+
+    def update(self, action, observation):
+        """
+        Moves the root to the history extended by the taken action and the received observation.
+
+        For fully observable models, the observation is the state.
+        """
+        child = self._root.children.get((action, observation))
+        if child is None or not child.particles:
+            child = _Node(0, self._successor_support(self._root.support, action, observation))
+            # Rejection sampling: propagate the old particles and keep those consistent with the observation.
+            particles = np.array(self._root.particles, dtype=np.int64)
+            for _ in range(10):
+                starts = particles[self._rng.integers(len(particles), size=self._max_particles)]
+                valid = action < self._nr_actions[starts]
+                self._particle_simulator.set_states(starts)
+                successors, _, _, _ = self._particle_simulator.step(np.where(valid, action, 0))
+                successors = successors[valid]
+                child.particles.extend(int(s) for s in successors[self._observations[successors] == observation])
+                if child.particles:
+                    break
+            if not child.particles:
+                logger.warning(f"Particle deprivation after action {action} and observation {observation}")
+                child.particles = [int(s) for s in np.flatnonzero(self._observations == observation)[:self._max_particles]]
+            child.counts = np.zeros(int(self._nr_actions[child.particles[0]]), dtype=np.int64)
+            child.values = np.zeros(len(child.counts))
+        self._root = child
+
+
+def run_episode(planner, simulator, maxsteps=200, index=0):
+    """
+    Plays an episode on a gridsparse.vectorized.ArraySimulator with actions chosen by the planner.
+    The episode ends in the terminal states of the planner, and is finished if it reaches the goal.
+
+    :return: The Episode.
+    """
+    episode = Episode(index)
+    state, rewards = simulator.restart()
+    planner.reset(state)
+    episode.states.append(state)
+    episode.returns = list(rewards)
+    for n in range(maxsteps):
+        actions = list(simulator.available_actions())
+        action = planner.plan()
+        state, rewards = simulator.step(action)
+        episode.returns = [total + r for total, r in zip(episode.returns, rewards)]
+        episode.available_actions.append(actions)
+        episode.actions.append(action)
+        episode.states.append(state)
+        if planner.terminal[state] or simulator.is_done():
+            arrays = planner.arrays
+            episode.finished = bool(arrays.label("goal")[state]) if arrays.has_label("goal") else simulator.is_done()
+            break
+        planner.update(action, planner.observe(state))
+    episode.available_actions.append(list(simulator.available_actions()))
+    return episode
+
+
+def plan_model(model_name, constants, nr_episodes=1, maxsteps=200, cache=None, seed=42, **kwargs):
+    """
+    Builds (or loads from the cache) a grid model of experiment_to_grid_model_names and plays episodes with an MCTSPlanner.
+
+    :return: The Episodes and the planner statistics.
+    """
+    prism_program, model = build_model(experiment_to_grid_model_names[model_name](**constants), cache=cache,
+                                       profile=REWARD_PROFILE)
+    arrays = ModelArrays.from_model(model, prism_program)
+    # Independent streams, such that the search does not replay the random choices of the simulated episodes.
+    planner_seed, simulator_seed = np.random.SeedSequence(seed).spawn(2)
+    planner = MCTSPlanner(arrays, seed=planner_seed, **kwargs)
+    simulator = ArraySimulator(arrays, simulator_seed)
+    episodes = [run_episode(planner, simulator, maxsteps, i) for i in range(nr_episodes)]
+    logger.info(f"{model_name}: {sum(e.finished for e in episodes)}/{nr_episodes} episodes reached the goal, {planner.statistics}")
+    return episodes, planner.statistics
@@ -0,0 +1,167 @@
+from abc import ABC, abstractmethod
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def action_masks(nr_actions, width=None):
+    """
+    Masks of the available actions, given the number of choices of every state in a batch.
+
+    :param nr_actions: For every state in the batch its number of choices.
+    :param width: Number of columns, by default the maximal number of choices.
+    """
+    nr_actions = np.asarray(nr_actions)
+    if width is None:
+        width = int(nr_actions.max()) if len(nr_actions) > 0 else 0
+    return np.arange(width) < nr_actions[:, np.newaxis]
+
+
+class Policy(ABC):
+    """
+    Selects actions for a batch of states.
+
+    Actions are local choice indices, as for the stormpy simulator. Policies are called with the states,
+    their observations (or None if not available) and the masks of the available actions (see action_masks),
+    and return one action per state that is allowed by its mask. The masks may be further restricted than
+    the choices of the model, e.g. by a shield.
+    """
+    def __call__(self, states, observations, masks):
+        return self.actions(states, observations, masks)
+
+    @abstractmethod
+    def actions(self, states, observations, masks):
+        pass
+
+    def seed(self, seed):
+        """
+        Resets the random generator of a stochastic policy; deterministic policies ignore it.
+
+        :param seed: A seed, or a numpy SeedSequence.
+        """
+        pass
+
+
+class RandomPolicy(Policy):
+    """
+    Selects one of the available actions uniformly at random.
+    """
+    def __init__(self, seed=None):
+        self._rng = seed if isinstance(seed, np.random.Generator) else np.random.default_rng(seed)
+
+    def seed(self, seed):
+        self._rng = np.random.default_rng(seed)
+
+    def actions(self, states, observations, masks):
+        masks = np.asarray(masks)
+        selected = (self._rng.random(len(masks)) * masks.sum(axis=1)).astype(np.int64)
+        # The index of the (selected+1)-th available action.
+        return np.argmax(np.cumsum(masks, axis=1) > selected[:, np.newaxis], axis=1)
+
+
+class TabularPolicy(Policy):
+    """
+    Looks actions up in an array indexed by state (or observation).
+
+    A one-dimensional table holds an action per state; a two-dimensional table holds a distribution over
+    actions per state, from which actions are sampled. Distributions are restricted to the actions of the masks;
+    an action of a one-dimensional table (or a distribution) that the mask does not allow is an error.
+    """
+    def __init__(self, table, by="state", seed=None):
+        """
+        :param table: The table of actions or action distributions.
+        :param by: Whether the table is indexed by "state" or by "observation".
+        :param seed: Seed for sampling from distributions.
+        """
+        if by not in ["state", "observation"]:
+            raise RuntimeError(f"Tables are indexed by state or observation, not by {by}")
+        self._table = np.asarray(table)
+        self._by = by
+        if self._table.ndim == 2:
+            self._cumulative = np.cumsum(self._table, axis=1)
+            self._rng = np.random.default_rng(seed)
+
+    @property
+    def table(self):
+        return self._table
+
+    def seed(self, seed):
+        if self._table.ndim == 2:
+            self._rng = np.random.default_rng(seed)
+
+    def actions(self, states, observations, masks):
+        if self._by == "observation":
+            if observations is None:
+                raise RuntimeError("The policy requires observations, but none are available")
+            index = np.asarray(observations)
+        else:
+            index = np.asarray(states)
+        if self._table.ndim == 1:
+            actions = self._table[index]
+            if masks is not None:
+                masks = np.asarray(masks, dtype=bool)
+                valid = (actions >= 0) & (actions < masks.shape[1])
+                valid[valid] = masks[np.flatnonzero(valid), actions[valid]]
+                if not valid.all():
+                    raise RuntimeError(f"The policy selects actions that are not allowed in states {np.asarray(states)[~valid][:10].tolist()}")
+            return actions
+        if masks is None:
+            cumulative = self._cumulative[index]
+        else:
+            masks = np.asarray(masks, dtype=bool)
+            width = min(masks.shape[1], self._table.shape[1])
+            weights = np.zeros((len(index), self._table.shape[1]))
+            weights[:, :width] = np.where(masks[:, :width], self._table[index, :width], 0.0)
+            cumulative = np.cumsum(weights, axis=1)
+            invalid = cumulative[:, -1] <= 0
+            if invalid.any():
+                raise RuntimeError(f"The policy assigns no probability to the allowed actions in states {np.asarray(states)[invalid][:10].tolist()}")
+        uniforms = self._rng.random(len(index)) * cumulative[:, -1]
+        return np.argmax(cumulative > uniforms[:, np.newaxis], axis=1)
+
+
+class SchedulerPolicy(TabularPolicy):
+    """
+    A memoryless deterministic scheduler of stormpy, e.g. from model checking with extract_scheduler=True.
+    """
+    def __init__(self, scheduler, nr_states):
+        if not scheduler.memoryless or not scheduler.deterministic:
+            raise RuntimeError("Only memoryless deterministic schedulers are supported")
+        table = np.array([scheduler.get_choice(state).get_deterministic_choice() for state in range(nr_states)],
+                         dtype=np.int64)
+        super().__init__(table)
+
+
+class CallablePolicy(Policy):
+    """
+    Wraps a function into a policy.
+
+    With batched=True the function receives the whole batch (states, observations, masks) and returns an array
+    of actions; otherwise it is called per state with the state and the list of available actions.
+    """
+    def __init__(self, function, batched=True):
+        self._function = function
+        self._batched = batched
+
+    def actions(self, states, observations, masks):
+        if self._batched:
+            return np.asarray(self._function(states, observations, masks))
+        return np.array([self._function(int(state), list(np.flatnonzero(mask))) for state, mask in zip(states, masks)],
+                        dtype=np.int64)
+
+
+def as_policy(policy, seed=None):
+    """
+    Turns None (uniformly random), arrays (tables indexed by state) and batched functions into a Policy.
+    """
+    if policy is None:
+        return RandomPolicy(seed)
+    if isinstance(policy, Policy):
+        return policy
+    if isinstance(policy, np.ndarray):
+        return TabularPolicy(policy)
+    if callable(policy):
+        return CallablePolicy(policy)
+    raise RuntimeError(f"Cannot use {policy} as a policy")
@@ -0,0 +1,834 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from gridsparse.builder import build_from_program, prepare_program
+from gridsparse.cache import default_cache_directory, file_hash
+from gridsparse.checking import check
+from gridsparse.export import ModelArrays
+from gridsparse.models import experiment_to_grid_model_names
+
+logger = logging.getLogger(__name__)
+
+SHIELD_FORMAT_VERSION = 1
+SHIELD_MANIFEST = "manifest.json"
+
+
+def choice_values(arrays, state_values):
+    """
+    For every choice the expected value of its successors, given the value of every state.
+    """
+    products = np.asarray(arrays.probabilities) * np.asarray(state_values)[np.asarray(arrays.columns)]
+    return np.add.reduceat(products, np.asarray(arrays.row_starts)[:-1])
+
+
+def reachability_values(arrays, goal="goal", safe="notbad", tolerance=1e-8, max_iterations=100000):
+    """
+    Pmax [safe U goal] for every state, by value iteration on the arrays (from below, so values never overestimate).
+
+    If the safe label has not been exported, all states are safe.
+    """
+    goal_states = arrays.label(goal)
+    safe_states = arrays.label(safe) if arrays.has_label(safe) else np.ones(arrays.nr_states, dtype=bool)
+    undecided = safe_states & ~goal_states
+    row_groups = np.asarray(arrays.row_groups)
+    values = goal_states.astype(np.float64)
+    for iteration in range(max_iterations):
+        updated = np.where(undecided, np.maximum.reduceat(choice_values(arrays, values), row_groups[:-1]), values)
+        difference = np.max(np.abs(updated - values), initial=0.0)
+        values = updated
+        if difference < tolerance:
+            logger.info(f"Value iteration converged after {iteration + 1} iterations")
+            break
+    else:
+        logger.warning(f"Value iteration did not converge within {max_iterations} iterations")
+    return values
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+class Shield:
+    """
+    A precomputed shield for a reachability property: action a is allowed in state s if its probability P(s, a)
+    reaches a threshold, either absolute (P(s, a) >= threshold) or relative to the optimum (P(s, a) >= threshold * Pmax(s)).
+
+    The probabilities of all choices are stored (as float32, aligned with the choices of the model), such that any
+    threshold can be applied without model checking again: with_threshold derives a shield for another threshold,
+    and masks accepts a threshold per lookup. For the shield's own threshold the allowed actions are also stored as a
+    state x action bit matrix (one row of packed bits per state), such that a lookup is a constant number of array
+    accesses. Actions are local choice indices, as for the simulators; states are those of the model the shield is
+    computed for.
+    """
+    def __init__(self, choice_values, state_values, row_groups, threshold=1.0, relative=True, tolerance=1e-6, bits=None):
+        """
+        :param choice_values: For every choice its probability.
+        :param state_values: For every state its optimal probability.
+        :param row_groups: The first choice of every state, and the number of choices at the end.
+        :param threshold: The threshold; relative thresholds are fractions of the optimum, in [0, 1].
+        :param relative: Whether the threshold is relative to the optimal probability of the state.
+        :param tolerance: Absolute tolerance on the comparison, to keep optimal actions despite rounding.
+        :param bits: The packed allowed actions for the threshold, if already known (e.g. when loading a saved shield).
+        """
+        self._choice_values = np.asarray(choice_values, dtype=np.float32)
+        self._state_values = np.asarray(state_values, dtype=np.float32)
+        self._row_groups = np.asarray(row_groups)
+        self._nr_actions = np.diff(self._row_groups)
+        self._owners = None
+        self._width = int(self._nr_actions.max())
+        self._tolerance = tolerance
+        self._check_threshold(threshold, relative)
+        self._threshold = threshold
+        self._relative = relative
+        if bits is not None:
+            self._bits = bits
+            return
+        allowed = self.allowed_choices()
+        owners = self._choice_owners()
+        dense = np.zeros((len(self._nr_actions), self._width), dtype=bool)
+        dense[owners, np.arange(len(owners)) - self._row_groups[owners]] = allowed
+        self._bits = np.packbits(dense, axis=1)
+        logger.info(f"Shield with {'relative' if relative else 'absolute'} threshold {threshold} allows "
+                    f"{np.count_nonzero(allowed)} of {len(allowed)} choices")
+
+    def _choice_owners(self):
+        # The state of every choice; only needed to apply thresholds, so loaded shields do not pay for it.
+        if self._owners is None:
+            self._owners = np.repeat(np.arange(len(self._nr_actions)), self._nr_actions)
+        return self._owners
+
+    @classmethod
+    def from_values(cls, arrays, state_values, threshold=1.0, relative=True):
+        """
+        Derives the shield from the optimal value of every state.
+
+        :param arrays: The gridsparse.export.ModelArrays of the model.
+        :param state_values: For every state the optimal probability.
+        """
+        return cls(choice_values(arrays, state_values), state_values, arrays.row_groups, threshold, relative)
+
+    @classmethod
+    def compute(cls, arrays, threshold=1.0, relative=True, goal="goal", safe="notbad"):
+        """
+        Computes the shield for Pmax [safe U goal] by value iteration on the arrays, without stormpy.
+        """
+        return cls.from_values(arrays, reachability_values(arrays, goal, safe), threshold, relative)
+
+    @classmethod
+    def from_model(cls, model, program, prop, threshold=1.0, relative=True):
+        """
+        Computes the shield by model checking a property (see gridsparse.builder.prepare_program) on a canonic sparse model.
+        """
+        result = check(model, prop)
+        return cls.from_values(ModelArrays.from_model(model, program), result.get_values(), threshold, relative)
+
+    def with_threshold(self, threshold, relative=None):
+        """
+        The shield for another threshold, sharing the stored probabilities.
+
+        :param relative: Whether the threshold is relative, by default as for this shield.
+        """
+        relative = self._relative if relative is None else relative
+        return Shield(self._choice_values, self._state_values, self._row_groups, threshold, relative, self._tolerance)
+
+    def save(self, directory, metadata=None):
+        """
+        Writes the shield to the given directory, one .npy file per array and a manifest with the format version,
+        the threshold, checksums and stamps (size and modification time) of the written arrays and the given metadata.
+        Any previous shield there is replaced.
+
+        :param metadata: Further entries for the manifest, e.g. the model hash, constants and property (see ShieldStore).
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=parent, suffix=".tmp")
+        arrays = {"bits": self._bits, "choice_values": self._choice_values, "state_values": self._state_values,
+                  "row_groups": self._row_groups}
+        checksums = {}
+        stamps = {}
+        for name, arr in arrays.items():
+            path = os.path.join(tmp, f"{name}.npy")
+            np.save(path, arr)
+            checksums[name] = file_hash(path)
+            stamps[name] = _stamp(path)
+        manifest = dict(metadata if metadata is not None else {}, version=SHIELD_FORMAT_VERSION, threshold=self._threshold,
+                        relative=self._relative, tolerance=self._tolerance, checksums=checksums, stamps=stamps)
+        with open(os.path.join(tmp, SHIELD_MANIFEST), "w") as f:
+            json.dump(manifest, f, indent=1)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.replace(tmp, directory)
+        logger.info(f"Saved shield to {directory}")
+
+    @classmethod
+    def load(cls, directory, mmap=True, verify=False, expected=None):
+        """
+        Loads a shield written by save, memory-mapped read-only such that several processes share one copy.
+
+        Arrays whose size or modification time differ from the stamps in the manifest have been modified after saving
+        and are rejected; this takes one stat per array.
+
+        :param verify: Whether to also compare the checksums of the arrays with those in the manifest, which reads them fully.
+        :param expected: Manifest entries that must match, e.g. the hash of the prism file; otherwise the shield is stale.
+        """
+        with open(os.path.join(directory, SHIELD_MANIFEST)) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != SHIELD_FORMAT_VERSION:
+            raise RuntimeError(f"Shield {directory} has format version {manifest.get('version')}, expected {SHIELD_FORMAT_VERSION}")
+        for key, value in (expected if expected is not None else {}).items():
+            if manifest.get(key) != value:
+                raise RuntimeError(f"Shield {directory} is stale: {key} is {manifest.get(key)}, expected {value}")
+        arrays = {}
+        for name, checksum in manifest["checksums"].items():
+            path = os.path.join(directory, f"{name}.npy")
+            if _stamp(path) != manifest["stamps"][name]:
+                raise RuntimeError(f"Shield {directory} is corrupt: {name} was modified after saving")
+            if verify and file_hash(path) != checksum:
+                raise RuntimeError(f"Shield {directory} is corrupt: checksum of {name} does not match")
+            arrays[name] = np.load(path, mmap_mode='r' if mmap else None)
+        return cls(arrays["choice_values"], arrays["state_values"], arrays["row_groups"], manifest["threshold"],
+                   manifest["relative"], manifest["tolerance"], bits=arrays["bits"])
+
+    @staticmethod
+    def _check_threshold(threshold, relative):
+        if relative and not 0.0 <= threshold <= 1.0:
+            raise RuntimeError(f"Relative shield thresholds must be in [0, 1], not {threshold}")
+
+    def _bounds(self, states, threshold, relative):
+        if relative:
+            return threshold * self._state_values[states] - self._tolerance
+        return np.full(len(states), threshold - self._tolerance, dtype=np.float32)
+
+    @property
+    def threshold(self):
+        return self._threshold
+
+    @property
+    def relative(self):
+        return self._relative
+
+    @property
+    def choice_values(self):
+        return self._choice_values
+
+    @property
+    def state_values(self):
+        return self._state_values
+
+    @property
+    def nr_states(self):
+        return len(self._nr_actions)
+
+    @property
+    def width(self):
+        """
+        The maximal number of actions of a state.
+        """
+        return self._width
+
+    @property
+    def bits(self):
+        return self._bits
+
+    @property
+    def nbytes(self):
+        return self._bits.nbytes + self._choice_values.nbytes + self._state_values.nbytes
+
+    def allowed_choices(self, threshold=None, relative=None):
+        """
+        For every choice of the model whether it is allowed, by default for the threshold of the shield.
+        """
+        threshold = self._threshold if threshold is None else threshold
+        relative = self._relative if relative is None else relative
+        self._check_threshold(threshold, relative)
+        return self._choice_values >= self._bounds(self._choice_owners(), threshold, relative)
+
+    def sweep(self, thresholds, relative=None):
+        """
+        The number of allowed choices for each of the thresholds, e.g. to tune the permissiveness of the shield.
+        """
+        return np.array([np.count_nonzero(self.allowed_choices(threshold, relative)) for threshold in thresholds])
+
+    def is_allowed(self, state, action):
+        return bool(self._bits[state, action >> 3] >> (7 - (action & 7)) & 1)
+
+    def masks(self, states, threshold=None, relative=None):
+        """
+        The boolean masks (states x width) of the allowed actions of a batch of states.
+
+        Without a threshold, the bits of the shield are looked up; otherwise the threshold is applied to the stored
+        probabilities of the choices of the states.
+        """
+        states = np.asarray(states)
+        if threshold is None and relative is None:
+            return np.unpackbits(self._bits[states], axis=1, count=self._width).astype(bool)
+        threshold = self._threshold if threshold is None else threshold
+        relative = self._relative if relative is None else relative
+        self._check_threshold(threshold, relative)
+        local = np.arange(self._width)
+        available = local < self._nr_actions[states][:, np.newaxis]
+        rows = np.where(available, self._row_groups[states][:, np.newaxis] + local, 0)
+        return available & (self._choice_values[rows] >= self._bounds(states, threshold, relative)[:, np.newaxis])
+
+    def __call__(self, states):
+        return self.masks(states)
+
+    def allowed_actions(self, state):
+        """
+        The list of allowed actions in a state.
+        """
+        return [int(a) for a in np.flatnonzero(self.masks([state])[0])]
+
+    def restart(self):
+        """
+        Called by gridsparse.simulator.run_episode when an episode starts; state-based shields keep no history.
+        """
+
+    def update(self, action, state):
+        """
+        Called by gridsparse.simulator.run_episode after every step.
+        """
+
+
+def winning_region(arrays, mode="almost-sure", goal="goal", safe="notbad"):
+    """
+    The winning region of the underlying MDP for reaching the goal without leaving the safe states.
+
+    :param mode: "almost-sure" for the states from which the goal can be reached with probability one,
+        "positive" for those from which it can be reached with positive probability.
+    :return: For every state whether it is winning, and for every choice whether it keeps winning: whether all its
+        successors are winning (almost-sure), or some of them (positive).
+    """
+    if mode not in ["almost-sure", "positive"]:
+        raise RuntimeError(f"Winning regions are almost-sure or positive, not {mode}")
+    goal_states = arrays.label(goal)
+    safe_states = arrays.label(safe) if arrays.has_label(safe) else np.ones(arrays.nr_states, dtype=bool)
+    row_groups = np.asarray(arrays.row_groups)[:-1]
+    row_starts = np.asarray(arrays.row_starts)[:-1]
+    columns = np.asarray(arrays.columns)
+
+    def reach(candidates, choices):
+        # The candidates that reach the goal with positive probability, using only the given choices.
+        region = goal_states.copy()
+        while True:
+            hits = choices & np.logical_or.reduceat(region[columns], row_starts)
+            updated = region | (candidates & np.logical_or.reduceat(hits, row_groups))
+            if np.array_equal(updated, region):
+                return region
+            region = updated
+
+    region = reach(safe_states, np.ones(arrays.nr_choices, dtype=bool))
+    if mode == "almost-sure":
+        # Prob1E: remove states that cannot avoid leaving the region until the region is stable.
+        while True:
+            stay = np.logical_and.reduceat(region[columns], row_starts)
+            updated = reach(region & safe_states, stay)
+            if np.array_equal(updated, region):
+                break
+            region = updated
+    if mode == "almost-sure":
+        keep = np.logical_and.reduceat(region[columns], row_starts)
+    else:
+        keep = np.logical_or.reduceat(region[columns], row_starts)
+    logger.info(f"The {mode} winning region has {np.count_nonzero(region)} of {arrays.nr_states} states")
+    return region, keep
+
+
+def initial_support(arrays):
+    """
+    The belief support at the start of an episode: the initial states.
+    """
+    return np.unique(np.asarray(arrays.initial_states, dtype=np.int64))
+
+
+def successor_support(arrays, support, action, observation):
+    """
+    The states that can be reached from the support with the action and have the given observation.
+    """
+    support = np.asarray(support, dtype=np.int64)
+    row_groups = np.asarray(arrays.row_groups)
+    row_starts = np.asarray(arrays.row_starts)
+    observations = np.asarray(arrays.observations)
+    support = support[action < row_groups[support + 1] - row_groups[support]]
+    rows = row_groups[support] + action
+    starts = row_starts[rows]
+    lengths = row_starts[rows + 1] - starts
+    # The successor entries of all rows, concatenated.
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    successors = np.unique(np.asarray(arrays.columns)[offsets])
+    return successors[observations[successors] == observation]
+
+
+class BeliefSupportShield:
+    """
+    A shield for partially observable models, that decides on belief supports: the sets of states that are
+    consistent with the observations so far.
+
+    The shield solves the game on belief supports, in which the agent only knows the support. For "almost-sure", a
+    support is winning if some strategy reaches the goal from each of its states with probability one without leaving
+    the safe states; an action is allowed if all its successor supports (one per observation) are winning, and
+    choosing uniformly among the allowed actions then reaches the goal almost surely.
+    For "positive", a support is winning if some strategy reaches the goal with positive probability; an action is
+    allowed if it keeps reaching the goal with positive probability. Losing supports allow no action.
+    States outside the winning region of the underlying MDP (see winning_region) cannot be won under partial
+    observability either, which prunes the supports. Supports are explored on demand, starting from the initial
+    support, and the allowed actions are kept in an LRU cache indexed by the support, such that repeated lookups
+    are a hash lookup.
+    """
+    def __init__(self, arrays, mode="almost-sure", goal="goal", safe="notbad", capacity=100000):
+        """
+        :param arrays: The gridsparse.export.ModelArrays of the model.
+        :param mode: The winning region, "almost-sure" or "positive".
+        :param capacity: Maximal number of supports in the cache.
+        """
+        self._arrays = arrays
+        self._mode = mode
+        self._capacity = capacity
+        self._row_groups = np.asarray(arrays.row_groups)
+        self._row_starts = np.asarray(arrays.row_starts)
+        self._columns = np.asarray(arrays.columns)
+        self._observations = np.asarray(arrays.observations)
+        self._nr_actions = np.diff(self._row_groups)
+        self._width = int(self._nr_actions.max())
+        self._winning, _ = winning_region(arrays, mode, goal, safe)
+        self._goal = arrays.label(goal)
+        # The explored supports, as nodes of the game: for every node its support, its kind (see _kind), per available
+        # action and state of the support the successor pairs (see _solve), whether it is winning, its allowed actions,
+        # and for every state of the support whether it reaches the goal.
+        self._nodes = {}
+        self._supports = []
+        self._kinds = []
+        self._edges = []
+        self._node_winning = []
+        self._node_masks = []
+        self._pair_reached = []
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        initial = self._node(self.initial_support())
+        logger.info(f"Explored {len(self._supports)} belief supports, "
+                    f"the initial support is {'winning' if self._node_winning[initial] else 'losing'}")
+
+    @property
+    def mode(self):
+        return self._mode
+
+    @property
+    def winning(self):
+        """
+        For every state whether it is in the winning region of the underlying MDP.
+        """
+        return self._winning
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def observations(self):
+        return self._observations
+
+    @property
+    def nr_supports(self):
+        """
+        The number of supports explored so far.
+        """
+        return len(self._supports)
+
+    def initial_support(self):
+        return initial_support(self._arrays)
+
+    def successor_support(self, support, action, observation):
+        """
+        The states that can be reached from the support with the action and have the given observation.
+        """
+        return successor_support(self._arrays, support, action, observation)
+
+    def _normalize(self, support):
+        support = np.unique(np.asarray(support, dtype=np.int64))
+        if len(support) > 0 and (support[0] < 0 or support[-1] >= len(self._observations)):
+            raise ValueError(f"The support contains states that are not in the model: {support[(support < 0) | (support >= len(self._observations))].tolist()}")
+        if self._mode == "positive":
+            # States that cannot reach the goal (or are not safe) do not contribute to reaching it.
+            support = support[self._winning[support]]
+        return support
+
+    def _kind(self, support):
+        # "losing" supports are decided; "target" supports are won and need not be explored for almost-sure.
+        if len(support) == 0:
+            return "losing"
+        if self._mode == "positive":
+            return "target" if self._goal[support].any() else "inner"
+        if not self._winning[support].all():
+            return "losing"
+        return "target" if self._goal[support].all() else "inner"
+
+    def _available(self, support):
+        # Actions are local indices; the agent can only rely on those that every state of the support has.
+        return int(self._nr_actions[support].min()) if len(support) > 0 else 0
+
+    def _node(self, support):
+        """
+        The node of a normalized support, exploring and solving the supports reachable from it if it is new.
+        """
+        key = support.tobytes()
+        node = self._nodes.get(key)
+        if node is not None:
+            return node
+        new = []
+
+        def register(support):
+            key = support.tobytes()
+            node = self._nodes.get(key)
+            if node is None:
+                node = len(self._supports)
+                self._nodes[key] = node
+                self._supports.append(support)
+                self._kinds.append(self._kind(support))
+                self._edges.append([])
+                self._node_winning.append(False)
+                self._node_masks.append(None)
+                self._pair_reached.append(None)
+                new.append(node)
+            return node
+
+        root = register(support)
+        explored = 0
+        while explored < len(new):
+            node = new[explored]
+            explored += 1
+            kind = self._kinds[node]
+            if kind == "losing" or (kind == "target" and self._mode == "almost-sure"):
+                continue
+            support = self._supports[node]
+            for action in range(self._available(support)):
+                rows = self._row_groups[support] + action
+                successors = [self._columns[self._row_starts[row]:self._row_starts[row + 1]] for row in rows]
+                targets = {}
+                for observation, part in self._split(np.unique(np.concatenate(successors))):
+                    part = self._normalize(part)
+                    if len(part) > 0:
+                        targets[observation] = (register(part), part)
+                # For every state of the support, its successors as (node, index of the state in the node's support).
+                pairs = []
+                for state_successors in successors:
+                    pairs.append([(targets[observation][0], int(np.searchsorted(targets[observation][1], successor)))
+                                  for successor, observation in zip(state_successors, self._observations[state_successors])
+                                  if observation in targets and self._in_support(targets[observation][1], successor)])
+                self._edges[node].append(pairs)
+        self._solve(new)
+        return root
+
+    def _split(self, states):
+        # The states grouped by observation.
+        observations = self._observations[states]
+        order = np.argsort(observations, kind="stable")
+        splits = np.flatnonzero(np.diff(observations[order])) + 1
+        for part in np.split(states[order], splits):
+            yield int(self._observations[part[0]]), part
+
+    @staticmethod
+    def _in_support(support, state):
+        index = np.searchsorted(support, state)
+        return index < len(support) and support[index] == state
+
+    def _solve(self, new):
+        """
+        Solves the game on the new nodes, whose successors are new or solved before.
+
+        Progress depends on the actual state, not only on the support: a support can return to itself while some of
+        its states never move on. Reachability is therefore decided on pairs of a state and a support containing it.
+        """
+        new_nodes = set(new)
+        predecessors = {}
+        for node in new:
+            for action, pairs in enumerate(self._edges[node]):
+                for index, successors in enumerate(pairs):
+                    for successor in successors:
+                        if successor[0] in new_nodes:
+                            predecessors.setdefault(successor, []).append((node, index, action))
+
+        def node_in(node, region):
+            return node in region if node in new_nodes else self._node_winning[node]
+
+        def pair_in(pair, reached):
+            return pair in reached if pair[0] in new_nodes else bool(self._pair_reached[pair[0]][pair[1]])
+
+        candidates = {node for node in new if self._kinds[node] != "losing"}
+        while True:
+            if self._mode == "almost-sure":
+                # Actions that surely stay among the candidates.
+                allowed = {node: {action for action, pairs in enumerate(self._edges[node])
+                                  if all(node_in(successor, candidates) for successors in pairs for successor, _ in successors)}
+                           for node in candidates}
+            else:
+                allowed = {node: set(range(len(self._edges[node]))) for node in candidates}
+            # The pairs that reach the goal with positive probability via allowed actions.
+            reached = {(node, index) for node in candidates for index in np.flatnonzero(self._goal[self._supports[node]])}
+            reached |= {(node, index) for node, actions in allowed.items() for action in actions
+                        for index, successors in enumerate(self._edges[node][action])
+                        if any(successor[0] not in new_nodes and self._pair_reached[successor[0]][successor[1]]
+                               for successor in successors)}
+            stack = list(reached)
+            while stack:
+                for node, index, action in predecessors.get(stack.pop(), []):
+                    if (node, index) not in reached and action in allowed.get(node, ()):
+                        reached.add((node, index))
+                        stack.append((node, index))
+            if self._mode == "positive":
+                winning = {node for node, _ in reached}
+                break
+            # Prob1E: a support is winning if all its states reach the goal; drop the others and repeat.
+            winning = {node for node in candidates
+                       if all((node, index) in reached for index in range(len(self._supports[node])))}
+            if winning == candidates:
+                break
+            candidates = winning
+        for node in new:
+            support = self._supports[node]
+            self._node_winning[node] = node in winning
+            self._pair_reached[node] = np.array([node in winning and (node, index) in reached for index in range(len(support))],
+                                                dtype=bool)
+            mask = np.zeros(self._width, dtype=bool)
+            if node in winning and self._kinds[node] == "target":
+                mask[:self._available(support)] = True
+            elif node in winning and self._mode == "almost-sure":
+                mask[list(allowed[node])] = True
+            elif node in winning:
+                for action, pairs in enumerate(self._edges[node]):
+                    mask[action] = any(pair_in(successor, reached) for successors in pairs for successor in successors)
+            self._node_masks[node] = mask
+
+    def is_winning(self, support):
+        """
+        Whether the support is winning.
+        """
+        return self._node_winning[self._node(self._normalize(support))]
+
+    def masks(self, support):
+        """
+        The boolean mask (of length width) of the actions allowed for a support.
+        """
+        return self._mask(np.asarray(support, dtype=np.int64).tobytes())
+
+    def batch_masks(self, states, lengths):
+        """
+        The masks of a batch of supports, given as their concatenated states and their lengths.
+        Keys are sliced from one buffer, so a lookup costs little more than the hash lookup in the cache.
+        """
+        buffer = np.ascontiguousarray(states, dtype=np.int64).tobytes()
+        ends = (8 * np.cumsum(np.asarray(lengths, dtype=np.int64))).tolist()
+        if ends and ends[-1] != len(buffer):
+            raise ValueError(f"The lengths of the supports add up to {ends[-1] // 8} states, not {len(buffer) // 8}")
+        masks = np.zeros((len(ends), self._width), dtype=bool)
+        start = 0
+        for i, end in enumerate(ends):
+            masks[i] = self._mask(buffer[start:end])
+            start = end
+        return masks
+
+    def _mask(self, key):
+        mask = self._cache.get(key)
+        if mask is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return mask
+        self.misses += 1
+        mask = self._node_masks[self._node(self._normalize(np.frombuffer(key, dtype=np.int64)))]
+        self._cache[key] = mask
+        if len(self._cache) > self._capacity:
+            self._cache.popitem(last=False)
+        return mask
+
+    def allowed_actions(self, support):
+        return [int(a) for a in np.flatnonzero(self.masks(support))]
+
+    def monitor(self):
+        """
+        A SupportMonitor, to use the shield in the simulation loop.
+        """
+        return SupportMonitor(self)
+
+
+class SupportMonitor:
+    """
+    Tracks the belief support of an episode from the observations of the visited states, and shields the actions
+    with a BeliefSupportShield. It has the interface of a Shield for gridsparse.simulator.run_episode (and thus
+    SimulationExecutor), which informs it of the progress of the episode; only the observations of the states are used.
+    """
+    def __init__(self, shield):
+        self._shield = shield
+        self._support = shield.initial_support()
+
+    @property
+    def shield(self):
+        return self._shield
+
+    @property
+    def support(self):
+        return self._support
+
+    def restart(self):
+        self._support = self._shield.initial_support()
+
+    def update(self, action, state):
+        observation = self._shield.observations[state]
+        support = self._shield.successor_support(self._support, action, observation)
+        if len(support) == 0:
+            logger.warning(f"Observation {observation} is inconsistent with the support, continuing with all states that have it")
+            support = np.flatnonzero(self._shield.observations == observation)
+        self._support = support
+
+    def masks(self, states):
+        return np.tile(self._shield.masks(self._support), (len(states), 1))
+
+    def __call__(self, states):
+        return self.masks(states)
+
+    def allowed_actions(self, state=None):
+        return self._shield.allowed_actions(self._support)
+
+
+class ShieldStore:
+    """
+    Persists shields next to the model cache, by default in the shields subdirectory of the cache directory.
+
+    Entries are keyed on the prism file, the constants, the property and the threshold. Every shield records the hash
+    of the prism file it was computed for, and is rejected (and removed) if it does not match the current file,
+    or if its arrays have been modified (see Shield.load).
+    The directory is kept below max_size bytes by evicting the least recently used entries, which also removes
+    the shields of outdated prism files.
+    """
+    def __init__(self, directory=None, max_size=1024 ** 3):
+        self._directory = directory if directory is not None else os.path.join(default_cache_directory(), "shields")
+        self._max_size = max_size
+        os.makedirs(self._directory, exist_ok=True)
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @staticmethod
+    def metadata(input, threshold, relative):
+        """
+        The manifest entries that identify the shield of a grid model (a gridsparse.models.Model) for its first property.
+        """
+        return {"model_hash": file_hash(input.path), "constants": input.constants, "property": input.properties[0],
+                "threshold": threshold, "relative": relative}
+
+    def key(self, metadata):
+        h = hashlib.sha256()
+        h.update(f"v{SHIELD_FORMAT_VERSION}\n".encode())
+        h.update(json.dumps(metadata, sort_keys=True).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self._directory, f"{key}.shield")
+
+    def load(self, input, threshold=1.0, relative=True, mmap=True, verify=False):
+        """
+        The stored shield for the model, or None if there is no valid one.
+
+        :param verify: Whether to compare the checksums of the arrays, see Shield.load.
+        """
+        metadata = self.metadata(input, threshold, relative)
+        path = self.path(self.key(metadata))
+        if not os.path.exists(path):
+            return None
+        try:
+            shield = Shield.load(path, mmap=mmap, verify=verify, expected=metadata)
+        except (RuntimeError, OSError, ValueError, KeyError) as e:
+            logger.warning(f"Dropping shield {path}: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        # The modification time of the directory records the last use, see evict.
+        os.utime(path)
+        logger.debug(f"Loaded shield from {path}")
+        return shield
+
+    def store(self, input, shield):
+        metadata = self.metadata(input, shield.threshold, shield.relative)
+        path = self.path(self.key(metadata))
+        shield.save(path, metadata)
+        self.evict()
+        return path
+
+    def size(self):
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        # Other processes may store or evict concurrently, so entries can vanish while we look at them.
+        entries = []
+        for name in os.listdir(self._directory):
+            if name.endswith(".shield"):
+                p = os.path.join(self._directory, name)
+                try:
+                    mtime = os.stat(p).st_mtime
+                    size = sum(entry.stat().st_size for entry in os.scandir(p))
+                except FileNotFoundError:
+                    continue
+                entries.append((p, mtime, size))
+        return entries
+
+    def evict(self):
+        """
+        Removes least recently used shields until the store fits into max_size.
+        """
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        while entries and total > self._max_size:
+            p, _, size = entries.pop(0)
+            total -= size
+            logger.info(f"Evicting shield {p}")
+            shutil.rmtree(p, ignore_errors=True)
+
+    def clear(self):
+        for p, _, _ in self._entries():
+            shutil.rmtree(p, ignore_errors=True)
+
+
+def compute_shield(model_name, constants, threshold=1.0, relative=True, cache=None):
+    """
+    Builds (or loads from the cache) a grid model of experiment_to_grid_model_names and computes the shield for its
+    first property by model checking.
+
+    :return: The canonic model and its Shield.
+    """
+    if model_name not in experiment_to_grid_model_names:
+        raise RuntimeError(f"Unknown model {model_name}")
+    input = experiment_to_grid_model_names[model_name](**constants)
+    prism_program, prop = prepare_program(input)
+    model = build_from_program(input, prism_program, prop, cache)
+    return model, Shield.from_model(model, prism_program, prop, threshold, relative)
+
+
+def load_shield(model_name, constants, threshold=1.0, relative=True, store=None, cache=None):
+    """
+    The shield of a grid model from the shield store, computed (and stored) on a miss.
+
+    Loading does not build the model, so workers can share a shield that has been computed once.
+
+    :param store: A ShieldStore, the default store if None.
+    :param cache: The ModelCache used if the model has to be built.
+    """
+    if model_name not in experiment_to_grid_model_names:
+        raise RuntimeError(f"Unknown model {model_name}")
+    store = store if store is not None else ShieldStore()
+    input = experiment_to_grid_model_names[model_name](**constants)
+    shield = store.load(input, threshold, relative)
+    if shield is None:
+        _, shield = compute_shield(model_name, constants, threshold, relative, cache)
+        store.store(input, shield)
+    return shield
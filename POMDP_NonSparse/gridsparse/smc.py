@@ -0,0 +1,189 @@
+import logging
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from gridsparse.builder import build_model
+from gridsparse.export import ModelArrays
+from gridsparse.models import experiment_to_grid_model_names
+from gridsparse.policy import as_policy
+from gridsparse.vectorized import BatchedSimulator, sink_states
+
+logger = logging.getLogger(__name__)
+
+
+class ChernoffHoeffding:
+    """
+    Estimates the probability up to +-epsilon with confidence 1-delta, using the number of episodes
+    that the Chernoff-Hoeffding bound requires, ln(2/delta) / (2 epsilon^2).
+    """
+    def __init__(self, epsilon=0.01, delta=0.05):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.required = math.ceil(math.log(2 / delta) / (2 * epsilon ** 2))
+
+    def done(self, successes, n):
+        return n >= self.required
+
+    def interval(self, successes, n):
+        estimate = successes / n
+        return max(estimate - self.epsilon, 0.0), min(estimate + self.epsilon, 1.0)
+
+    def decision(self, successes, n):
+        return None
+
+
+class Wilson:
+    """
+    Stops once the Wilson score interval at confidence 1-delta is at most 2 epsilon wide.
+
+    Usually needs far fewer episodes than ChernoffHoeffding for probabilities close to 0 or 1.
+    As the interval is checked after every batch, the confidence is nominal rather than guaranteed.
+    """
+    def __init__(self, epsilon=0.01, delta=0.05, min_episodes=30):
+        self.epsilon = epsilon
+        self.delta = delta
+        self.min_episodes = min_episodes
+        self._z = NormalDist().inv_cdf(1 - delta / 2)
+
+    def interval(self, successes, n):
+        z2 = self._z ** 2
+        estimate = successes / n
+        center = (estimate + z2 / (2 * n)) / (1 + z2 / n)
+        half_width = self._z * math.sqrt(estimate * (1 - estimate) / n + z2 / (4 * n ** 2)) / (1 + z2 / n)
+        return max(center - half_width, 0.0), min(center + half_width, 1.0)
+
+    def done(self, successes, n):
+        if n < self.min_episodes:
+            return False
+        lower, upper = self.interval(successes, n)
+        return upper - lower <= 2 * self.epsilon
+
+    def decision(self, successes, n):
+        return None
+
+
+class SPRT:
+    """
+    Wald's sequential probability ratio test whether the probability is at least the threshold.
+
+    Tests H0: p >= threshold + epsilon against H1: p <= threshold - epsilon, with error probabilities alpha and beta;
+    within the indifference region (threshold +- epsilon) either answer may be given.
+    """
+    def __init__(self, threshold, epsilon=0.01, alpha=0.05, beta=0.05):
+        self.threshold = threshold
+        self.epsilon = epsilon
+        self._p0 = min(threshold + epsilon, 1.0 - 1e-12)
+        self._p1 = max(threshold - epsilon, 1e-12)
+        self._accept_h0 = math.log(beta / (1 - alpha))
+        self._accept_h1 = math.log((1 - beta) / alpha)
+
+    def _log_ratio(self, successes, n):
+        return successes * math.log(self._p1 / self._p0) + (n - successes) * math.log((1 - self._p1) / (1 - self._p0))
+
+    def done(self, successes, n):
+        ratio = self._log_ratio(successes, n)
+        return ratio <= self._accept_h0 or ratio >= self._accept_h1
+
+    def interval(self, successes, n):
+        return None
+
+    def decision(self, successes, n):
+        """
+        True if the probability is at least the threshold, False if it is below, None if undecided.
+        """
+        ratio = self._log_ratio(successes, n)
+        if ratio <= self._accept_h0:
+            return True
+        if ratio >= self._accept_h1:
+            return False
+        return None
+
+
+class SMCResult:
+    def __init__(self, rule, nr_successes, nr_episodes, nr_truncated, steps):
+        self.rule = rule
+        self.nr_successes = nr_successes
+        self.nr_episodes = nr_episodes
+        self.nr_truncated = nr_truncated
+        self.steps = steps
+
+    @property
+    def estimate(self):
+        return self.nr_successes / self.nr_episodes if self.nr_episodes > 0 else None
+
+    @property
+    def interval(self):
+        return self.rule.interval(self.nr_successes, self.nr_episodes) if self.nr_episodes > 0 else None
+
+    @property
+    def decision(self):
+        return self.rule.decision(self.nr_successes, self.nr_episodes)
+
+    @property
+    def converged(self):
+        return self.nr_episodes > 0 and self.rule.done(self.nr_successes, self.nr_episodes)
+
+    def __str__(self):
+        result = f"{self.nr_successes}/{self.nr_episodes} successful episodes (estimate {self.estimate:.4f}"
+        if self.interval is not None:
+            result += f", interval [{self.interval[0]:.4f}, {self.interval[1]:.4f}]"
+        if self.decision is not None:
+            result += f", at least {self.rule.threshold}: {self.decision}"
+        result += f"), {self.nr_truncated} truncated, {self.steps} steps"
+        return result if self.converged else result + ", not converged"
+
+
+def estimate(arrays, rule, policy=None, goal="goal", safe="notbad", batch_size=1024, maxsteps=1000, max_episodes=10000000,
+             seed=None, sampler=None):
+    """
+    Statistical model checking of P[safe U goal] under a policy, stopping as soon as the rule is satisfied.
+
+    Episodes run in batches of batch_size in lockstep. A batch runs until all of its episodes are decided, and the
+    rule is only consulted between batches, such that short episodes are not over-represented.
+    Episodes that neither reach the goal nor leave the safe states within maxsteps steps count as failures,
+    so the estimate is a lower bound if maxsteps is too small.
+
+    :param arrays: A gridsparse.export.ModelArrays with the goal and safe labels.
+    :param rule: The stopping rule: ChernoffHoeffding, Wilson or SPRT.
+    :param policy: A gridsparse.policy.Policy (or anything gridsparse.policy.as_policy accepts), by default uniformly random.
+    :param max_episodes: Stop after this many episodes even if the rule is not satisfied.
+    :return: An SMCResult.
+    """
+    goal_states = arrays.label(goal)
+    terminal = sink_states(arrays) | goal_states | ~arrays.label(safe)
+    simulator = BatchedSimulator(arrays, batch_size, seed=seed, reward_models=[], autoreset=False, terminal=terminal,
+                                 sampler=sampler)
+    policy = as_policy(policy) if policy is not None else None
+    successes, episodes, truncated, steps = 0, 0, 0, 0
+    while episodes < max_episodes:
+        states, _ = simulator.reset()
+        decided = terminal[states].copy()
+        success = goal_states[states].copy()
+        for _ in range(maxsteps):
+            if decided.all():
+                break
+            actions = simulator.select_actions(policy)
+            states, _, terminated, _ = simulator.step(actions)
+            steps += int(np.count_nonzero(~decided))
+            newly = terminated & ~decided
+            success[newly] = goal_states[states[newly]]
+            decided |= newly
+        successes += int(np.count_nonzero(success))
+        truncated += int(np.count_nonzero(~decided))
+        episodes += batch_size
+        logger.debug(f"{successes}/{episodes} successful episodes")
+        if rule.done(successes, episodes):
+            break
+    result = SMCResult(rule, successes, episodes, truncated, steps)
+    logger.info(str(result))
+    return result
+
+
+def estimate_model(model_name, constants, rule, cache=None, **kwargs):
+    """
+    Builds (or loads from the cache) a grid model of experiment_to_grid_model_names and runs estimate on it.
+    """
+    prism_program, model = build_model(experiment_to_grid_model_names[model_name](**constants), cache=cache)
+    return estimate(ModelArrays.from_model(model, prism_program), rule, **kwargs)
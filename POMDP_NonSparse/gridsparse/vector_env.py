@@ -0,0 +1,290 @@
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+import shutil
+import tempfile
+
+import numpy as np
+
+from gridsparse.builder import REWARD_PROFILE, build_model
+from gridsparse.env import EnvTables
+from gridsparse.export import ModelArrays
+from gridsparse.models import experiment_to_grid_model_names
+
+logger = logging.getLogger(__name__)
+
+
+def _buffer_specs(nr_envs, observation_shape, nr_actions):
+    return {
+        "observations": ((nr_envs,) + tuple(observation_shape), np.int32),
+        "rewards": ((nr_envs,), np.float64),
+        "terminated": ((nr_envs,), np.bool_),
+        "truncated": ((nr_envs,), np.bool_),
+        "action_masks": ((nr_envs, nr_actions), np.bool_),
+        "actions": ((nr_envs,), np.int64),
+        "states": ((nr_envs,), np.int64),
+        "final_states": ((nr_envs,), np.int64)
+    }
+
+
+class SharedBuffers:
+    """
+    NumPy arrays in shared memory; created by the parent and attached to by name in the workers.
+    """
+    def __init__(self, specs, names=None):
+        self._memory = {}
+        self.arrays = {}
+        for key, (shape, dtype) in specs.items():
+            size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            if names is None:
+                memory = shared_memory.SharedMemory(create=True, size=size)
+            else:
+                memory = _attach(names[key])
+            self._memory[key] = memory
+            self.arrays[key] = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+
+    @property
+    def names(self):
+        return {key: memory.name for key, memory in self._memory.items()}
+
+    def close(self):
+        self.arrays = {}
+        for memory in self._memory.values():
+            try:
+                memory.close()
+            except BufferError:
+                # Views handed out earlier are still alive; the mapping goes away with them.
+                pass
+
+    def unlink(self):
+        for memory in self._memory.values():
+            memory.unlink()
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 there is no track argument. Workers share the resource tracker of the parent,
+        # so registering the block again is harmless; the parent unlinks it.
+        return shared_memory.SharedMemory(name=name)
+
+
+class _EnvSlice:
+    """
+    The environments start..stop-1 of a vector environment, stepped together on shared tables.
+    """
+    def __init__(self, tables, start, stop, seed_sequences, maxsteps, buffers):
+        self._tables = tables
+        self._slice = slice(start, stop)
+        self._rngs = [np.random.default_rng(s) for s in seed_sequences]
+        self._maxsteps = maxsteps
+        self._buffers = {key: array[self._slice] for key, array in buffers.items()}
+        self._steps = np.zeros(stop - start, dtype=np.int64)
+
+    def _write(self, states):
+        self._buffers["states"][:] = states
+        self._buffers["observations"][:] = self._tables.observations[states]
+        self._buffers["action_masks"][:] = self._tables.masks[states]
+
+    def reset(self):
+        self._steps[:] = 0
+        self._buffers["rewards"][:] = 0
+        self._buffers["terminated"][:] = False
+        self._buffers["truncated"][:] = False
+        self._write(np.array([self._tables.initial(rng) for rng in self._rngs], dtype=np.int64))
+
+    def step(self):
+        uniforms = np.array([rng.random() for rng in self._rngs])
+        states, rewards, terminated = self._tables.step(self._buffers["states"], self._buffers["actions"], uniforms)
+        self._steps += 1
+        truncated = ~terminated & (self._steps >= self._maxsteps) if self._maxsteps is not None else np.zeros_like(terminated)
+        finished = terminated | truncated
+        self._buffers["final_states"][:] = np.where(finished, states, -1)
+        for i in np.flatnonzero(finished):
+            states[i] = self._tables.initial(self._rngs[i])
+            self._steps[i] = 0
+        self._buffers["rewards"][:] = rewards
+        self._buffers["terminated"][:] = terminated
+        self._buffers["truncated"][:] = truncated
+        self._write(states)
+
+
+def _worker(bundle, observation, reward_weights, maxsteps, start, stop, seed_sequences, specs, names, pipe):
+    buffers = SharedBuffers(specs, names)
+    try:
+        tables = EnvTables(ModelArrays.load(bundle), observation, reward_weights)
+        envs = _EnvSlice(tables, start, stop, seed_sequences, maxsteps, buffers.arrays)
+        pipe.send(None)
+        while True:
+            command = pipe.recv()
+            if command == "close":
+                break
+            try:
+                getattr(envs, command)()
+                pipe.send(None)
+            except Exception as e:
+                pipe.send(repr(e))
+    except Exception as e:
+        pipe.send(repr(e))
+    finally:
+        buffers.close()
+
+
+class SharedMemoryVectorEnv:
+    """
+    Steps many GridEnv-like environments at once, with automatic resets.
+
+    Observations, rewards, terminated/truncated flags and action masks are written into shared NumPy buffers
+    (one row per environment) that are returned without copying; they are overwritten by the next step.
+    With processes > 0, the environments are split over worker processes that memory-map the same model bundle,
+    and stepping is asynchronous (step_async/step_wait); with processes = 0 they are stepped synchronously in this process.
+    The results only depend on the seed, not on the number of processes.
+    """
+    def __init__(self, bundle, nr_envs, processes=0, observation="observation", reward_weights=None, maxsteps=200, seed=None):
+        """
+        :param bundle: A directory with an exported model, see gridsparse.export.
+        :param nr_envs: Number of environments.
+        :param processes: Number of worker processes, or 0 for synchronous stepping in this process.
+        :param observation: The observation type, see gridsparse.env.observation_table.
+        :param reward_weights: See gridsparse.env.EnvTables.
+        :param maxsteps: Number of steps after which an episode is truncated, or None.
+        :param seed: Seed from which the random streams of the environments are derived.
+        """
+        self._nr_envs = nr_envs
+        self._tables = EnvTables(ModelArrays.load(bundle), observation, reward_weights)
+        specs = _buffer_specs(nr_envs, self._tables.observations.shape[1:], len(self._tables.action_names))
+        seed_sequences = np.random.SeedSequence(seed).spawn(nr_envs)
+        self._pipes = []
+        self._processes = []
+        self._waiting = False
+        self._cleanup = []
+        if processes == 0:
+            self._buffers = None
+            self._arrays = {key: np.zeros(shape, dtype=dtype) for key, (shape, dtype) in specs.items()}
+            self._local = _EnvSlice(self._tables, 0, nr_envs, seed_sequences, maxsteps, self._arrays)
+            return
+        self._buffers = SharedBuffers(specs)
+        self._arrays = self._buffers.arrays
+        self._local = None
+        bounds = np.linspace(0, nr_envs, min(processes, nr_envs) + 1).astype(int)
+        context = multiprocessing.get_context()
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            parent, child = context.Pipe()
+            process = context.Process(target=_worker, daemon=True,
+                                      args=(bundle, observation, reward_weights, maxsteps, int(start), int(stop),
+                                            seed_sequences[start:stop], specs, self._buffers.names, child))
+            process.start()
+            self._pipes.append(parent)
+            self._processes.append(process)
+        self._collect()
+
+    @classmethod
+    def from_model_name(cls, model_name, constants, nr_envs, cache=None, directory=None, **kwargs):
+        """
+        Builds (or loads from the cache) a grid model once, with its reward models, and exports it as a bundle for the workers.
+
+        :param directory: Where to export the bundle; a temporary directory that is removed on close if None.
+        """
+        input = experiment_to_grid_model_names[model_name](**constants)
+        prism_program, model = build_model(input, cache=cache, profile=REWARD_PROFILE)
+        annotations = input.annotations if model.has_state_valuations() else None
+        arrays = ModelArrays.from_model(model, prism_program, annotations)
+        if not arrays.reward_model_names:
+            raise RuntimeError(f"No reward models were exported for {model_name}, all rewards would be zero")
+        remove = directory is None
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix="gridsparse-bundle-")
+        arrays.save(directory)
+        env = cls(directory, nr_envs, **kwargs)
+        if remove:
+            env._cleanup.append(directory)
+        return env
+
+    @property
+    def nr_envs(self):
+        return self._nr_envs
+
+    @property
+    def action_names(self):
+        return self._tables.action_names
+
+    @property
+    def states(self):
+        return self._arrays["states"]
+
+    @property
+    def action_masks(self):
+        return self._arrays["action_masks"]
+
+    def _collect(self):
+        errors = [error for error in (pipe.recv() for pipe in self._pipes) if error is not None]
+        if errors:
+            raise RuntimeError(f"Worker failed: {errors[0]}")
+
+    def _send(self, command):
+        if self._waiting:
+            raise RuntimeError("A step is still pending; call step_wait first")
+        for pipe in self._pipes:
+            pipe.send(command)
+
+    def _results(self):
+        info = {"states": self._arrays["states"], "action_masks": self._arrays["action_masks"],
+                "final_states": self._arrays["final_states"]}
+        return self._arrays["observations"], self._arrays["rewards"], self._arrays["terminated"], self._arrays["truncated"], info
+
+    def reset(self):
+        if self._local is not None:
+            self._local.reset()
+        else:
+            self._send("reset")
+            self._collect()
+        return self._arrays["observations"], {"states": self._arrays["states"], "action_masks": self._arrays["action_masks"]}
+
+    def step_async(self, actions):
+        """
+        Starts a step with the given actions, one per environment.
+        """
+        self._arrays["actions"][:] = actions
+        if self._local is not None:
+            self._local.step()
+        else:
+            self._send("step")
+        self._waiting = True
+
+    def step_wait(self):
+        """
+        Waits for the pending step and returns observations, rewards, terminated, truncated and info.
+        Environments that finished have been reset; info["final_states"] holds their last state (-1 for the others).
+        """
+        if not self._waiting:
+            raise RuntimeError("No step is pending")
+        self._waiting = False
+        if self._local is None:
+            self._collect()
+        return self._results()
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        for pipe in self._pipes:
+            pipe.send("close")
+        for process in self._processes:
+            process.join()
+        self._pipes, self._processes = [], []
+        if self._buffers is not None:
+            self._arrays = {}
+            self._buffers.close()
+            self._buffers.unlink()
+            self._buffers = None
+        for directory in self._cleanup:
+            shutil.rmtree(directory, ignore_errors=True)
+        self._cleanup = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
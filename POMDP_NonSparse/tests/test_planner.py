@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from gridsparse.planner import MCTSPlanner, run_episode
+from gridsparse.shield import BeliefSupportShield, Shield
+from gridsparse.vectorized import ArraySimulator
+
+from synthetic import guess_arrays, model_arrays
+
+
+def tempting_guess_arrays():
+    """
+    guess_arrays with a reward for the action that leads to the losing support {1, 2}.
+    """
+    arrays = guess_arrays()
+    rows = [
+        [([1, 2], [0.5, 0.5]), ([3], [1.0])],
+        [([3], [1.0]), ([4], [1.0])],
+        [([4], [1.0]), ([3], [1.0])],
+        [([3], [1.0])],
+        [([4], [1.0])],
+    ]
+    rewards = np.zeros(arrays.nr_choices)
+    rewards[0] = 5.0
+    return model_arrays(rows, observations=[0, 1, 1, 2, 3], labels={"goal": [3], "notbad": [0, 1, 2, 3]},
+                        rewards={"gains": {"state_action": rewards}})
+
+
+def _planner(arrays, **kwargs):
+    return MCTSPlanner(arrays, budget=300, goal_reward=1.0, reward_weights={"gains": 1.0}, seed=0, **kwargs)
+
+
+def test_planner_takes_the_tempting_action_without_shield():
+    assert _planner(tempting_guess_arrays()).plan() == 0
+
+
+def test_planner_only_takes_actions_that_the_shield_allows_for_the_support():
+    arrays = tempting_guess_arrays()
+    shield = BeliefSupportShield(arrays)
+    planner = _planner(arrays, shield=shield.monitor())
+    assert planner.support.tolist() == [0]
+    assert planner.plan() == 1
+    for index in range(5):
+        episode = run_episode(planner, ArraySimulator(arrays, seed=index), maxsteps=10, index=index)
+        assert episode.finished
+
+
+def test_planner_rejects_state_based_restrictions_of_beliefs():
+    arrays = guess_arrays()
+    with pytest.raises(RuntimeError, match="only sound for fully observable"):
+        MCTSPlanner(arrays, reward_weights={}, allowed=Shield.compute(arrays))
+
+
+def test_planner_requires_the_reward_models():
+    with pytest.raises(RuntimeError, match="has not been exported"):
+        MCTSPlanner(guess_arrays())
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from gridsparse.shield import Shield
+from gridsparse.simulator import run_episode
+from gridsparse.vectorized import ArraySimulator
+
+from synthetic import grid_arrays
+
+
+def test_run_episode_respects_the_shield():
+    arrays = grid_arrays()
+    shield = Shield.compute(arrays)
+    episode = run_episode(ArraySimulator(arrays, seed=0), np.random.default_rng(0), 50, shield=shield)
+    # Going down is never allowed, and going east from 1 is allowed as the trap can be avoided with probability 0.9.
+    assert 2 not in episode.actions
+    assert all(2 not in allowed for allowed in episode.allowed_actions)
+
+
+def test_run_episode_raises_if_the_shield_allows_nothing():
+    arrays = grid_arrays()
+    # The goal is reached with probability at most 0.9, so no action reaches it with probability 1.
+    shield = Shield.compute(arrays, threshold=1.0, relative=False)
+    with pytest.raises(RuntimeError, match="allows no action"):
+        run_episode(ArraySimulator(arrays, seed=0), np.random.default_rng(0), 50, shield=shield)
+    episode = run_episode(ArraySimulator(arrays, seed=0), np.random.default_rng(0), 50, shield=shield, shield_fallback=True)
+    assert episode.allowed_actions[0] == [0, 1, 2]
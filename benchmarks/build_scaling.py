@@ -0,0 +1,197 @@
+"""
+Build-time scaling benchmark for the grid models of all four packages.
+
+For every package and every model in experiment_to_grid_model_names, N is increased until a build exceeds
+the time or memory budget. Every build runs in a fresh process, such that memory measurements are not
+polluted by earlier builds. Results are appended to a JSON lines file; with --baseline, they are
+compared against a stored baseline and regressions are reported (exit code 1).
+
+    python benchmarks/build_scaling.py --output results.jsonl
+    python benchmarks/build_scaling.py --output baseline.jsonl --packages gridstorm --models evade obstacle
+    python benchmarks/build_scaling.py --output results.jsonl --baseline baseline.jsonl
+"""
+import argparse
+import importlib
+import inspect
+import json
+import logging
+import multiprocessing
+import queue
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+PACKAGES = ["gridstorm", "gridsparse", "gridfull", "gridfullsparse"]
+DEFAULT_CONSTANTS = {"RADIUS": 2, "ENERGY": 3}
+# Builds faster than this are dominated by noise and never count as time regressions.
+MIN_TIME_DELTA = 0.5
+
+
+def _run_build(package, model_name, constants, memory_budget, results):
+    if resource is not None and memory_budget:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_budget, memory_budget))
+    builder = importlib.import_module(f"{package}.builder")
+    models = importlib.import_module(f"{package}.models")
+    instrumentation = importlib.import_module(f"{package}.instrumentation")
+    factory = models.experiment_to_grid_model_names[model_name]
+    record = instrumentation.BuildInstrumentation(model_name, constants, package=package)
+    try:
+        builder.build_model(factory(**constants), cache=None, instrumentation=record)
+        record.set("status", "ok")
+    except MemoryError:
+        record.set("status", "memory")
+    except Exception as e:
+        record.set("status", "error")
+        record.set("error", repr(e))
+    results.put(record.as_dict())
+
+
+def run_build(package, model_name, constants, time_budget, memory_budget):
+    """
+    Builds a single model in a separate process, enforcing the budgets.
+    """
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_build, args=(package, model_name, constants, memory_budget, results))
+    start = time.perf_counter()
+    process.start()
+    record = None
+    while record is None:
+        try:
+            record = results.get(timeout=0.5)
+        except queue.Empty:
+            if not process.is_alive():
+                # The record may have arrived just after the timeout; a dead process has written everything it put.
+                try:
+                    record = results.get_nowait()
+                except queue.Empty:
+                    # Killed by the OS (e.g. out of memory) before reporting.
+                    record = {"model": model_name, "constants": constants, "package": package, "status": "crashed", "stages": []}
+            elif time.perf_counter() - start > time_budget:
+                process.kill()
+                record = {"model": model_name, "constants": constants, "package": package, "status": "timeout", "stages": []}
+    process.join()
+    record["wall_time"] = time.perf_counter() - start
+    return record
+
+
+def summarize(record):
+    """
+    Reduces a build record to the numbers that are compared across runs.
+    """
+    stages = {stage["stage"]: stage for stage in record.get("stages", [])}
+    canonic = stages.get("make_canonic", {})
+    peaks = [stage["peak_rss"] for stage in record.get("stages", []) if stage.get("peak_rss") is not None]
+    return {
+        "package": record["package"],
+        "model": record["model"],
+        "N": record["constants"]["N"],
+        "constants": record["constants"],
+        "status": record["status"],
+        "nr_states": canonic.get("nr_states"),
+        "nr_transitions": canonic.get("nr_transitions"),
+        "build_time": sum(stages[s]["wall_time"] for s in ["build", "make_canonic"] if s in stages),
+        "total_time": sum(stage["wall_time"] for stage in record.get("stages", [])),
+        "peak_rss": max(peaks) if peaks else None
+    }
+
+
+def sweep(package, model_name, args):
+    models = importlib.import_module(f"{package}.models")
+    parameters = inspect.signature(models.experiment_to_grid_model_names[model_name]).parameters
+    constants = {k: v for k, v in args.constants.items() if k in parameters}
+    N = args.start
+    while N <= args.max_n:
+        constants["N"] = N
+        result = summarize(run_build(package, model_name, dict(constants), args.time_budget, args.memory_budget))
+        logger.info(f"{package}/{model_name} N={N}: {result['status']}, {result['nr_states']} states, {result['build_time']:.2f}s")
+        yield result
+        if result["status"] != "ok" or result["total_time"] > args.time_budget:
+            break
+        if result["peak_rss"] is not None and result["peak_rss"] > args.memory_budget:
+            break
+        N += args.step
+
+
+def load_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Compares results against a baseline; a regression is a slower build, more memory, a different state space or a new failure.
+    """
+    reference = {(r["package"], r["model"], r["N"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        base = reference.get((r["package"], r["model"], r["N"]))
+        if base is None:
+            continue
+        key = f"{r['package']}/{r['model']} N={r['N']}"
+        if base["status"] == "ok" and r["status"] != "ok":
+            regressions.append(f"{key}: status {r['status']} (baseline ok)")
+            continue
+        if r["status"] != "ok":
+            continue
+        if base["nr_states"] != r["nr_states"] or base["nr_transitions"] != r["nr_transitions"]:
+            regressions.append(f"{key}: {r['nr_states']} states/{r['nr_transitions']} transitions, baseline {base['nr_states']}/{base['nr_transitions']}")
+        if r["build_time"] > base["build_time"] * (1 + tolerance) and r["build_time"] - base["build_time"] > MIN_TIME_DELTA:
+            regressions.append(f"{key}: build time {r['build_time']:.2f}s, baseline {base['build_time']:.2f}s")
+        if r["peak_rss"] and base["peak_rss"] and r["peak_rss"] > base["peak_rss"] * (1 + tolerance):
+            regressions.append(f"{key}: peak memory {r['peak_rss'] / 1024 ** 2:.0f}MB, baseline {base['peak_rss'] / 1024 ** 2:.0f}MB")
+    return regressions
+
+
+def _constant(item):
+    key, value = item.split("=")
+    return key, int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build-time scaling benchmark for the grid models.")
+    parser.add_argument("--packages", nargs="+", default=PACKAGES)
+    parser.add_argument("--models", nargs="+", default=None, help="Defaults to all models of the registry")
+    parser.add_argument("--start", type=int, default=4)
+    parser.add_argument("--step", type=int, default=2)
+    parser.add_argument("--max-n", type=int, default=64)
+    parser.add_argument("--constant", action="append", type=_constant, default=[], help="Fixed constants, e.g. RADIUS=2")
+    parser.add_argument("--time-budget", type=float, default=300.0, help="Seconds per build")
+    parser.add_argument("--memory-budget", type=int, default=8 * 1024 ** 3, help="Bytes per build")
+    parser.add_argument("--output", default="build_scaling.jsonl")
+    parser.add_argument("--baseline", default=None, help="Results file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Relative slowdown that counts as regression")
+    args = parser.parse_args(argv)
+    args.constants = dict(DEFAULT_CONSTANTS, **dict(args.constant))
+    logging.basicConfig(level=logging.INFO)
+
+    results = []
+    for package in args.packages:
+        try:
+            models = importlib.import_module(f"{package}.models")
+        except ImportError:
+            logger.warning(f"Package {package} is not installed, skipping")
+            continue
+        for model_name in (args.models or list(models.experiment_to_grid_model_names.keys())):
+            for result in sweep(package, model_name, args):
+                results.append(result)
+                with open(args.output, "a") as f:
+                    f.write(json.dumps(result) + "\n")
+
+    if args.baseline:
+        regressions = find_regressions(results, load_results(args.baseline), args.tolerance)
+        for regression in regressions:
+            logger.error(f"Regression: {regression}")
+        if regressions:
+            return 1
+        logger.info("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""
+Compares the sparse and the symbolic (decision-diagram) engine on the grid models.
+
+For every model and N, both engines build the model and compute the value of the model's property
+in a fresh process; build time, checking time, peak memory and the value are reported.
+The symbolic engine cannot build POMDPs, so it builds the underlying MDP of each program; the sparse engine
+builds the POMDP and checks it under full observability, so both values refer to the same MDP.
+Models the symbolic engine cannot build at all are reported as unsupported.
+
+    python benchmarks/engine_comparison.py --package gridstorm --models obstacle refuel evade --n 8 12 16
+"""
+import argparse
+import importlib
+import inspect
+import json
+import logging
+import multiprocessing
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONSTANTS = {"RADIUS": 2, "ENERGY": 3}
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _run(package, model_name, constants, engine, results):
+    builder = importlib.import_module(f"{package}.builder")
+    checking = importlib.import_module(f"{package}.checking")
+    models = importlib.import_module(f"{package}.models")
+    input = models.experiment_to_grid_model_names[model_name](**constants)
+    record = {"package": package, "model": model_name, "constants": constants, "engine": engine}
+    try:
+        start = time.perf_counter()
+        if engine == "dd":
+            _, prop, model = builder.build_symbolic_model(input)
+        else:
+            prism_program, prop = builder.prepare_program(input)
+            model = builder.build_from_program(input, prism_program, prop, profile=builder.minimal_profile(input))
+        record["build_time"] = time.perf_counter() - start
+        record["nr_states"] = model.nr_states
+        record["nr_transitions"] = model.nr_transitions
+        start = time.perf_counter()
+        record["value"] = checking.initial_value(model, prop)
+        record["check_time"] = time.perf_counter() - start
+        record["status"] = "ok"
+    except RuntimeError as e:
+        record["status"] = "unsupported" if engine == "dd" and "does not support" in str(e) else "error"
+        record["error"] = repr(e)
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = repr(e)
+    record["peak_rss"] = _peak_rss()
+    results.put(record)
+
+
+def run(package, model_name, constants, engine, timeout):
+    results = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run, args=(package, model_name, constants, engine, results))
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+        process.kill()
+        process.join()
+        return {"package": package, "model": model_name, "constants": constants, "engine": engine, "status": "timeout"}
+    if results.empty():
+        return {"package": package, "model": model_name, "constants": constants, "engine": engine, "status": "crashed"}
+    return results.get()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the sparse and the symbolic engine.")
+    parser.add_argument("--package", default="gridstorm")
+    parser.add_argument("--models", nargs="+", default=["obstacle", "refuel", "evade"])
+    parser.add_argument("--n", nargs="+", type=int, default=[6, 8, 10, 12])
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--output", default="engine_comparison.jsonl")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    models = importlib.import_module(f"{args.package}.models")
+    for model_name in args.models:
+        parameters = inspect.signature(models.experiment_to_grid_model_names[model_name]).parameters
+        for N in args.n:
+            constants = {k: v for k, v in DEFAULT_CONSTANTS.items() if k in parameters}
+            constants["N"] = N
+            for engine in ["sparse", "dd"]:
+                record = run(args.package, model_name, constants, engine, args.timeout)
+                if record["status"] == "ok":
+                    logger.info(f"{model_name} N={N} {engine}: {record['nr_states']} states, build {record['build_time']:.2f}s, "
+                                f"check {record['check_time']:.2f}s, {record['peak_rss'] / 1024 ** 2:.0f}MB, value {record['value']}")
+                else:
+                    logger.info(f"{model_name} N={N} {engine}: {record['status']} {record.get('error', '')}")
+                with open(args.output, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
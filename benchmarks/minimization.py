@@ -0,0 +1,67 @@
+"""
+Benchmark for bisimulation minimization on the grid models.
+
+For every model and N, the model is built and minimized; reported are the reduction factor, the time of the
+partition refinement and of building the quotient, and the time of model checking the property and of computing
+a shield (value iteration on the arrays) on the original model and on the quotient, together with both values.
+
+    python benchmarks/minimization.py --package gridstorm --models evade intercept avoid --n 8 12 16
+"""
+import argparse
+import importlib
+import inspect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONSTANTS = {"RADIUS": 2, "ENERGY": 3}
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run(package, model_name, constants):
+    builder = importlib.import_module(f"{package}.builder")
+    checking = importlib.import_module(f"{package}.checking")
+    export = importlib.import_module(f"{package}.export")
+    minimize = importlib.import_module(f"{package}.minimize")
+    models = importlib.import_module(f"{package}.models")
+    shield = importlib.import_module(f"{package}.shield")
+
+    input = models.experiment_to_grid_model_names[model_name](**constants)
+    prism_program, prop = builder.prepare_program(input)
+    model = builder.build_from_program(input, prism_program, prop)
+    arrays = export.ModelArrays.from_model(model, prism_program)
+    _, partition_time = _timed(minimize.bisimulation_partition, arrays)
+    quotient, minimize_time = _timed(minimize.minimize, model, prism_program, None, True, arrays)
+    logger.info(f"{model_name}({constants}): {arrays.nr_states} -> {quotient.arrays.nr_states} states "
+                f"(factor {quotient.reduction_factor:.2f}), partition {partition_time:.3f}s, quotient {minimize_time:.3f}s")
+    for name, candidate, candidate_arrays in [("original", model, arrays), ("quotient", quotient.model, quotient.arrays)]:
+        value, check_time = _timed(checking.initial_value, candidate, prop)
+        _, shield_time = _timed(shield.Shield.compute, candidate_arrays)
+        logger.info(f"  {name}: checking {check_time:.3f}s (value {value:.6f}), shield {shield_time:.3f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark bisimulation minimization.")
+    parser.add_argument("--package", default="gridstorm")
+    parser.add_argument("--models", nargs="+", default=["evade", "intercept", "avoid"])
+    parser.add_argument("--n", nargs="+", type=int, default=[8, 12, 16])
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    models = importlib.import_module(f"{args.package}.models")
+    for model_name in args.models:
+        parameters = inspect.signature(models.experiment_to_grid_model_names[model_name]).parameters
+        for N in args.n:
+            constants = {k: v for k, v in DEFAULT_CONSTANTS.items() if k in parameters}
+            constants["N"] = N
+            run(args.package, model_name, constants)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Runs the MCTS planner on the grid models and reports decisions per second and the fraction of episodes reaching the goal.
+
+By default, every model in experiment_to_grid_model_names is used.
+
+    python benchmarks/planner.py --package gridstorm --budget 500 --episodes 5
+"""
+import argparse
+import importlib
+import inspect
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONSTANTS = {"N": 6, "RADIUS": 2, "ENERGY": 3}
+
+
+def run(package, model_name, constants, nr_episodes, maxsteps, budget, time_budget, seed):
+    planner = importlib.import_module(f"{package}.planner")
+    episodes, statistics = planner.plan_model(model_name, constants, nr_episodes, maxsteps, seed=seed, budget=budget,
+                                              time_budget=time_budget)
+    finished = sum(e.finished for e in episodes)
+    logger.info(f"{model_name}({constants}): {finished}/{nr_episodes} reached the goal, "
+                f"{statistics.decisions_per_second:,.1f} decisions/s, {statistics.simulations_per_second:,.0f} simulations/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the MCTS planner.")
+    parser.add_argument("--package", default="gridstorm")
+    parser.add_argument("--models", nargs="+", default=None, help="By default all models")
+    parser.add_argument("--episodes", type=int, default=3)
+    parser.add_argument("--maxsteps", type=int, default=100)
+    parser.add_argument("--budget", type=int, default=500, help="Simulations per decision")
+    parser.add_argument("--time-budget", type=float, default=None, help="Seconds per decision, replaces --budget")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    models = importlib.import_module(f"{args.package}.models")
+    for model_name in args.models or models.experiment_to_grid_model_names:
+        parameters = inspect.signature(models.experiment_to_grid_model_names[model_name]).parameters
+        constants = {k: v for k, v in DEFAULT_CONSTANTS.items() if k in parameters}
+        run(args.package, model_name, constants, args.episodes, args.maxsteps, args.budget, args.time_budget, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Plots the results of build_scaling.py: states and build time over N, one line per package and model.
+
+    python benchmarks/plot_build_scaling.py build_scaling.jsonl --output build_scaling.png
+"""
+import argparse
+from collections import defaultdict
+import json
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+
+def load_results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def plot(results, output):
+    series = defaultdict(list)
+    for r in results:
+        if r["status"] == "ok":
+            series[(r["package"], r["model"])].append(r)
+
+    fig, axes = plt.subplots(1, 3, figsize=(18, 5))
+    for (package, model), rs in sorted(series.items()):
+        rs = sorted(rs, key=lambda r: r["N"])
+        label = f"{package}/{model}"
+        axes[0].plot([r["N"] for r in rs], [r["nr_states"] for r in rs], marker="o", label=label)
+        axes[1].plot([r["N"] for r in rs], [r["build_time"] for r in rs], marker="o", label=label)
+        axes[2].plot([r["nr_transitions"] for r in rs], [r["peak_rss"] / 1024 ** 2 if r["peak_rss"] else None for r in rs],
+                     marker="o", label=label)
+    axes[0].set(xlabel="N", ylabel="states", yscale="log", title="State space")
+    axes[1].set(xlabel="N", ylabel="seconds", yscale="log", title="Build time (build + make_canonic)")
+    axes[2].set(xlabel="transitions", ylabel="MB", xscale="log", yscale="log", title="Peak memory")
+    axes[0].legend(fontsize=7)
+    fig.tight_layout()
+    fig.savefig(output, dpi=100)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plot build scaling results.")
+    parser.add_argument("results")
+    parser.add_argument("--output", default="build_scaling.png")
+    args = parser.parse_args(argv)
+    plot(load_results(args.results), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Load test for the shield server.
+
+Starts a ShieldServer for a grid model in a separate process (the shield is loaded from, or computed into, the shield
+store) and lets several client processes query the allowed actions of random batches of states. Reports queries per
+second, lookups per second and the latency percentiles, and the server reports how many requests it coalesced.
+
+    python benchmarks/shield_server.py --package gridstorm --model evade --n 8 --clients 1 4 16 --batch 1 64
+"""
+import argparse
+import importlib
+import inspect
+import logging
+import multiprocessing
+import os
+import tempfile
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONSTANTS = {"RADIUS": 2, "ENERGY": 3}
+
+
+def _serve(package, model_name, constants, threshold, address, ready, stop):
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    shield_server = importlib.import_module(f"{package}.shield_server")
+    server = shield_server.ShieldServer.from_models({model_name: (model_name, constants)}, threshold).start(address)
+    ready.set()
+    stop.wait()
+    logger.info(f"  server: {server.statistics}")
+    server.stop()
+
+
+def _client(package, address, name, nr_states, nr_requests, batch_size, seed):
+    shield_server = importlib.import_module(f"{package}.shield_server")
+    rng = np.random.default_rng(seed)
+    latencies = np.zeros(nr_requests)
+    with shield_server.ShieldClient(address, name) as client:
+        for i in range(nr_requests):
+            states = rng.integers(nr_states, size=batch_size)
+            start = time.perf_counter()
+            client.masks(states)
+            latencies[i] = time.perf_counter() - start
+    return latencies
+
+
+def run(package, model_name, constants, threshold, clients, batch_sizes, nr_requests, seed):
+    shield = importlib.import_module(f"{package}.shield")
+    # Computes the shield into the store once, such that the server only loads it.
+    nr_states = shield.load_shield(model_name, constants, threshold).nr_states
+    address = os.path.join(tempfile.mkdtemp(), "shield.sock")
+    ready, stop = multiprocessing.Event(), multiprocessing.Event()
+    server = multiprocessing.Process(target=_serve, args=(package, model_name, constants, threshold, address, ready, stop))
+    server.start()
+    ready.wait()
+    logger.info(f"{model_name}({constants}): {nr_states} states")
+    try:
+        for nr_clients in clients:
+            for batch_size in batch_sizes:
+                with multiprocessing.Pool(nr_clients) as pool:
+                    arguments = [(package, address, model_name, nr_states, nr_requests, batch_size, seed + i)
+                                 for i in range(nr_clients)]
+                    start = time.perf_counter()
+                    latencies = np.concatenate(pool.starmap(_client, arguments))
+                    elapsed = time.perf_counter() - start
+                logger.info(f"  {nr_clients} clients, batch {batch_size}: {len(latencies) / elapsed:,.0f} queries/s, "
+                            f"{len(latencies) * batch_size / elapsed:,.0f} lookups/s, "
+                            f"p50 {np.percentile(latencies, 50) * 1e3:.3f}ms, p99 {np.percentile(latencies, 99) * 1e3:.3f}ms")
+    finally:
+        stop.set()
+        server.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test for the shield server.")
+    parser.add_argument("--package", default="gridstorm")
+    parser.add_argument("--model", default="evade")
+    parser.add_argument("--n", type=int, default=8)
+    parser.add_argument("--threshold", type=float, default=0.9, help="Relative shield threshold")
+    parser.add_argument("--clients", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--batch", nargs="+", type=int, default=[1, 64])
+    parser.add_argument("--requests", type=int, default=5000, help="Requests per client")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    models = importlib.import_module(f"{args.package}.models")
+    parameters = inspect.signature(models.experiment_to_grid_model_names[args.model]).parameters
+    constants = {k: v for k, v in DEFAULT_CONSTANTS.items() if k in parameters}
+    constants["N"] = args.n
+    run(args.package, args.model, constants, args.threshold, args.clients, args.batch, args.requests, args.seed)
+
+
+if __name__ == "__main__":
+    main()
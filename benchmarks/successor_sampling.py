@@ -0,0 +1,113 @@
+"""
+Micro-benchmark for successor sampling on the grid models.
+
+Compares transitions per second of
+ - the stormpy simulator (one step() call per transition),
+ - the ArraySimulator with cumulative (binary search) and alias-table sampling,
+ - the batched samplers on their own, sampling from all stochastic rows of the model at once,
+and reports the total variation distance between the empirical and the exact successor distributions.
+
+    python benchmarks/successor_sampling.py --package gridstorm --models evade intercept --n 8
+"""
+import argparse
+import importlib
+import inspect
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONSTANTS = {"RADIUS": 2, "ENERGY": 3}
+
+
+def _steps_per_second(simulator, nr_steps, seed):
+    rng = np.random.default_rng(seed)
+    simulator.restart()
+    start = time.perf_counter()
+    for _ in range(nr_steps):
+        actions = simulator.available_actions()
+        simulator.step(int(rng.integers(len(actions))))
+        if simulator.is_done():
+            simulator.restart()
+    return nr_steps / (time.perf_counter() - start)
+
+
+def _total_variation(arrays, sampler, rows, nr_samples, seed):
+    rng = np.random.default_rng(seed)
+    sampled_rows = rng.choice(rows, size=nr_samples)
+    counts = np.bincount(sampler.sample(sampled_rows, rng.random(nr_samples)), minlength=len(arrays.columns))
+    row_counts = np.bincount(sampled_rows, minlength=arrays.nr_choices)
+    entry_rows = np.repeat(np.arange(arrays.nr_choices), np.diff(arrays.row_starts))
+    mask = row_counts[entry_rows] > 0
+    empirical = counts[mask] / row_counts[entry_rows][mask]
+    exact = np.asarray(arrays.probabilities)[mask]
+    # Average over the sampled rows of half the L1 distance.
+    return 0.5 * np.abs(empirical - exact).sum() / np.count_nonzero(row_counts)
+
+
+def run(package, model_name, constants, nr_steps, nr_samples, seed):
+    import stormpy as sp
+    import stormpy.simulator
+    builder = importlib.import_module(f"{package}.builder")
+    export = importlib.import_module(f"{package}.export")
+    models = importlib.import_module(f"{package}.models")
+    sampling = importlib.import_module(f"{package}.sampling")
+    vectorized = importlib.import_module(f"{package}.vectorized")
+
+    prism_program, model = builder.build_model(models.experiment_to_grid_model_names[model_name](**constants))
+    arrays = export.ModelArrays.from_model(model, prism_program)
+    counts = np.diff(arrays.row_starts)
+    stochastic = np.flatnonzero(counts > 1)
+    logger.info(f"{model_name}({constants}): {arrays.nr_states} states, {len(stochastic)} stochastic rows, "
+                f"at most {counts.max()} successors")
+
+    start = time.perf_counter()
+    samplers = {"cumulative": vectorized.CumulativeSampler(arrays)}
+    logger.info(f"  cumulative tables built in {time.perf_counter() - start:.3f}s")
+    start = time.perf_counter()
+    samplers["alias"] = sampling.AliasSampler(arrays)
+    logger.info(f"  alias tables built in {time.perf_counter() - start:.3f}s ({samplers['alias'].nbytes / 1024 ** 2:.1f}MB)")
+
+    simulator = sp.simulator.create_simulator(model, seed=seed)
+    simulator.set_full_observability(True)
+    logger.info(f"  stormpy step(): {_steps_per_second(simulator, nr_steps, seed):,.0f} steps/s")
+    for name, sampler in samplers.items():
+        rate = _steps_per_second(vectorized.ArraySimulator(arrays, seed, sampler), nr_steps, seed)
+        logger.info(f"  ArraySimulator ({name}): {rate:,.0f} steps/s")
+    if len(stochastic) == 0:
+        return
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(stochastic, size=nr_samples)
+    uniforms = rng.random(nr_samples)
+    for name, sampler in samplers.items():
+        start = time.perf_counter()
+        sampler.sample(rows, uniforms)
+        rate = nr_samples / (time.perf_counter() - start)
+        distance = _total_variation(arrays, sampler, stochastic, nr_samples, seed)
+        logger.info(f"  batched {name}: {rate:,.0f} samples/s, mean total variation distance {distance:.4f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark successor sampling.")
+    parser.add_argument("--package", default="gridstorm")
+    parser.add_argument("--models", nargs="+", default=["evade", "intercept"])
+    parser.add_argument("--n", nargs="+", type=int, default=[8])
+    parser.add_argument("--steps", type=int, default=100000, help="Steps for the per-step simulators")
+    parser.add_argument("--samples", type=int, default=10000000, help="Samples for the batched samplers")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    models = importlib.import_module(f"{args.package}.models")
+    for model_name in args.models:
+        parameters = inspect.signature(models.experiment_to_grid_model_names[model_name]).parameters
+        for N in args.n:
+            constants = {k: v for k, v in DEFAULT_CONSTANTS.items() if k in parameters}
+            constants["N"] = N
+            run(args.package, model_name, constants, args.steps, args.samples, args.seed)
+
+
+if __name__ == "__main__":
+    main()